@@ -1,18 +1,20 @@
+import gzip
 import json
 import os
 import uuid
 from asyncio import create_task, gather
 from base64 import b64decode
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import date, datetime
 from http import HTTPStatus
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 from urllib import parse
 
 import httpx
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import (
     HTMLResponse,
@@ -20,18 +22,20 @@ from fastapi.responses import (
     FileResponse,
     RedirectResponse,
     PlainTextResponse,
+    Response,
+    StreamingResponse,
 )
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from starlette.exceptions import HTTPException
 
+from src.budget import BUDGET, MemoryBudgetMiddleware
 from src.constants import (
     COPR_BUILD_URL,
     KOJI_BUILD_URL,
     OBS_BUILD_URL,
     FEEDBACK_DIR,
-    REVIEWS_DIR,
     SERVER_URL,
     LOGDETECTIVE_READ_TIMEOUT,
     LOGDETECTIVE_CONNECT_TIMEOUT,
@@ -42,6 +46,9 @@ from src.constants import (
     LOGGER_NAME,
     LOG_DETECTIVE_TOKEN,
     STATIC_SOURCE_DIR,
+    EXPORT_PAGE_SIZE,
+    SNIPPET_CONTEXT_MAX_SIZE,
+    SHARED_CACHE_EXPLANATION_TTL,
 )
 from src.fetcher import (
     ContainerProvider,
@@ -56,21 +63,22 @@ from src.fetcher import (
 from src.schema import (
     ContributeResponseSchema,
     FeedbackInputSchema,
-    FeedbackSchema,
-    FeedbackLogSchema,
     schema_inp_to_out,
 )
 from src.spells import (
-    find_file_by_name,
+    GZIP_MAGIC,
     get_logger,
     start_sentry,
-    read_json_file,
-    write_json_file,
-    fetch_text,
+    fetch_log,
     sanitize_uploaded_schema,
     get_robots,
 )
+from src.koji_client import KojiSessionPool
+from src.logcache import get_log_cache
+from src.reviews import ReviewProcessor
+from src.sharedcache import get_shared_cache
 from src.store import Storator3000
+from src.writer import GroupCommitWriter
 from src.exceptions import NoDataFound
 from src.client import get_http_client
 
@@ -87,8 +95,14 @@ else:
 async def lifespan(_app: FastAPI):
     """Manage application-wide resources."""
     _app.state.http_client = get_http_client()
+    Storator3000.ensure_index()
+    # reviews not merged yet when the worker stopped last time
+    ReviewProcessor.get().resume()
     yield
     await _app.state.http_client.aclose()
+    KojiSessionPool.close_all()
+    ReviewProcessor.shutdown()
+    GroupCommitWriter.shutdown()
 
 
 app = FastAPI(
@@ -106,6 +120,7 @@ app = FastAPI(
 )
 
 
+app.add_middleware(MemoryBudgetMiddleware)
 app.mount("/static", StaticFiles(directory=STATIC_SOURCE_DIR), name="static")
 # blame scarlette for not being able to mount directories recursively
 for root, directories, _ in os.walk(STATIC_SOURCE_DIR):
@@ -146,6 +161,7 @@ def _custom_http_exception_handler(
             "error": f"Server error: {status_code}",
             "description": description,
         },
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -181,9 +197,9 @@ def review_redirect():
     """
     Redirect to a review URL that contains some result ID
     """
-    result = Storator3000.get_random()
-    LOGGER.info("Opening %s for review", result)
-    return f"/review/{result.stem}"
+    result_id = Storator3000.next_for_review()
+    LOGGER.info("Opening %s for review", result_id)
+    return f"/review/{result_id}"
 
 
 @app.get("/review/{result_id}", response_class=HTMLResponse)
@@ -320,7 +336,9 @@ def _store_data_for_providers(
     *args,
     our_server: str = "https://logdetective.com",
 ) -> OkResponse:
-    storator = Storator3000(ProvidersEnum[provider], str(id_))
+    # Copr chroot or Koji architecture
+    chroot = str(args[0]) if args else None
+    storator = Storator3000(ProvidersEnum[provider], str(id_), chroot)
 
     if provider == ProvidersEnum.container:
         result_to_store = schema_inp_to_out(feedback_input, is_with_spec=False)
@@ -444,22 +462,139 @@ def contribute_review_obs(
     )
 
 
+@app.get("/frontend/annotations")
+def get_existing_annotations(
+    request: Request,
+    provider: Optional[ProvidersEnum] = None,
+    build_id: Optional[str] = None,
+    chroot: Optional[str] = None,
+    package: Optional[str] = None,
+) -> dict:
+    """
+    Find out whether a build (optionally a chroot of it) or a package was
+    already annotated, without fetching its logs.
+    """
+    if not build_id and not package:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Either build_id or package is required",
+        )
+
+    our_server = f"{request.url.scheme}://{request.url.netloc}"
+    annotations = [
+        annotation | {"review_url_website": f"{our_server}/review/{annotation['id']}"}
+        for annotation in Storator3000.find_annotations(
+            provider, build_id, chroot, package
+        )
+    ]
+    return {"annotated": bool(annotations), "annotations": annotations}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def _review_headers(digest: str, gzipped: bool, is_random: bool) -> dict[str, str]:
+    # strong ETags differ for each encoding of the same content
+    return {
+        "ETag": f'"{digest}-gzip"' if gzipped else f'"{digest}"',
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-store"
+        if is_random
+        else "public, max-age=31536000, immutable",
+    }
+
+
 @app.get("/frontend/review/{result_id}")
-def frontend_review_random(result_id):
-    if result_id == "random":
-        feedback_file = Storator3000.get_random()
-    else:
-        feedback_file = Storator3000.get_by_id(result_id)
+def frontend_review_random(
+    request: Request, result_id, payload: Literal["full", "snippets"] = "full"
+):
+    """
+    An annotation to review. With `payload=snippets` logs have no content,
+    only their size and a context window around every snippet, see
+    `/frontend/review/<id>/context` for fetching more of them.
+
+    Annotations never change, so the response is rendered only once and
+    served as it is stored, gzip compressed if the client accepts it. It can
+    be cached forever unless it is a random one.
+    """
+    is_random = result_id == "random"
+    if is_random:
+        result_id = Storator3000.next_for_review()
 
     LOGGER.info("Opening annotation: %s for review", result_id)
 
-    if not feedback_file:
+    accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    if_none_match = request.headers.get("if-none-match")
+    # answer conditional requests without reading the stored response
+    stored = Storator3000.find_rendered_review(result_id, payload)
+    if if_none_match and stored is not None:
+        digest, compressed = stored
+        headers = _review_headers(digest, compressed and accepts_gzip, is_random)
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    rendered = Storator3000.get_rendered_review(result_id, payload)
+    if rendered is None:
         raise NoDataFound(f"No result with ID {result_id}")
+    digest, data = rendered
+
+    gzipped = data.startswith(GZIP_MAGIC)
+    if gzipped and not accepts_gzip:
+        data = gzip.decompress(data)
+        gzipped = False
+    headers = _review_headers(digest, gzipped, is_random)
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(data, media_type="application/json", headers=headers)
+
+
+@app.get("/frontend/review/{result_id}/context")
+def get_log_context(
+    result_id: str,
+    log: str,
+    start: int = Query(ge=0),
+    end: int = Query(ge=0),
+) -> dict:
+    """
+    Characters of a log between the start and end offsets, to show more
+    context around a snippet than its precomputed window.
+    """
+    if end < start or end - start > SNIPPET_CONTEXT_MAX_SIZE:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Request at most {SNIPPET_CONTEXT_MAX_SIZE} characters "
+            "with end not before start",
+        )
+    return Storator3000.get_log_part(result_id, log, start, end)
 
-    content = read_json_file(feedback_file)
-    return FeedbackSchema(**content).model_dump() | {
-        "id": feedback_file.name.rstrip(".json")
-    }
+
+@app.get("/frontend/review/{result_id}/reviews")
+def get_reviews(result_id: str) -> list[dict]:
+    """
+    All reviews of an annotation as they were submitted, oldest first.
+    """
+    if Storator3000.get_index().get(result_id) is None:
+        raise NoDataFound(f"No result with ID {result_id}")
+    return Storator3000.get_reviews(result_id)
+
+
+@app.get("/frontend/review/{result_id}/consensus")
+def get_consensus(result_id: str) -> dict:
+    """
+    Votes of all reviews of an annotation summed up, for its fail reason,
+    how to fix and every reviewed snippet.
+    """
+    return Storator3000.get_consensus(result_id)
 
 
 async def _check_log_urls(
@@ -486,6 +621,10 @@ async def _check_log_urls(
         raise HTTPException(status_code=422, detail=f"Unreachable log files: {detail}")
 
 
+# providers of logs of finished builds which never change
+IMMUTABLE_PROVIDERS = (ProvidersEnum.copr, ProvidersEnum.koji, ProvidersEnum.packit)
+
+
 async def _call_analyze_api(
     log_urls: list[dict[str, str]],
     http_client: httpx.AsyncClient,
@@ -503,8 +642,6 @@ async def _call_analyze_api(
         commentary,
     )
 
-    await _check_log_urls(log_urls, http_client=http_client)
-
     data = {
         "files": [{"name": f["name"], "url": f["url"]} for f in log_urls],
         "build_metadata": {
@@ -514,6 +651,17 @@ async def _call_analyze_api(
             "infra_status": None,
         },
     }
+    # logs of other providers may change under the same URL
+    shared = get_shared_cache() if provider_name in IMMUTABLE_PROVIDERS else None
+    cache_key = json.dumps(data, sort_keys=True)
+    if shared is not None:
+        cached = await run_in_threadpool(shared.get, "explanation", cache_key)
+        if cached is not None:
+            LOGGER.info("Explanation found in the shared cache")
+            return _process_server_data(cached)
+
+    await _check_log_urls(log_urls, http_client=http_client)
+
     headers = {"Content-Type": "application/json"}
 
     if LOG_DETECTIVE_TOKEN:
@@ -544,6 +692,14 @@ async def _call_analyze_api(
         detail = f"{response.status_code} {response.reason_phrase}\n{response.url}"
         raise HTTPException(status_code=response.status_code, detail=detail) from ex
 
+    if shared is not None:
+        await run_in_threadpool(
+            shared.set,
+            "explanation",
+            cache_key,
+            response.content,
+            SHARED_CACHE_EXPLANATION_TTL,
+        )
     return _process_server_data(response.content)
 
 
@@ -704,54 +860,21 @@ async def _download_log_content(url: str, client: httpx.AsyncClient) -> str:
     """Download content of the log file and returns it."""
 
     try:
-        response = await fetch_text(url, client=client, timeout=600)
+        log = await fetch_log(url, client=client, timeout=600)
     except (
         httpx.ConnectError,
         httpx.TimeoutException,
         httpx.RequestError,
     ) as ex:
         raise HTTPException(status_code=408, detail=str(ex)) from ex
+    response = log.response
     try:
         response.raise_for_status()
     except httpx.HTTPError as ex:
         detail = f"{response.status_code} {response.reason_phrase}\n{response.url}"
         raise HTTPException(status_code=response.status_code, detail=detail) from ex
 
-    return response.text
-
-
-def _get_text_from_feedback(item: dict) -> str:
-    if item["vote"] != 1:
-        return ""
-
-    return item["text"]
-
-
-def _parse_logs(
-    logs_orig: dict[str, FeedbackLogSchema], review_snippets: list[dict]
-) -> None:
-    for name, item in logs_orig.items():
-        item.snippets = []
-        for snippet in review_snippets:
-            if snippet["file"] == name and snippet["vote"] == 1:
-                # mypy can't see this far and hinting to it is messy
-                item.snippets.append(snippet)  # type: ignore[arg-type]
-
-
-def _parse_feedback(review_d: dict, origin_id: int) -> dict:
-    original_file_path = find_file_by_name(f"{origin_id}.json", Path(FEEDBACK_DIR))
-    if original_file_path is None:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail=f"Original feedback file for ID {origin_id} not found",
-        )
-
-    original_content = read_json_file(original_file_path)
-    schema = FeedbackSchema(**original_content)
-    schema.fail_reason = _get_text_from_feedback(review_d["fail_reason"])
-    schema.how_to_fix = _get_text_from_feedback(review_d["how_to_fix"])
-    _parse_logs(schema.logs, review_d["snippets"])
-    return schema.model_dump(exclude_unset=True)
+    return log.content
 
 
 @app.post("/frontend/review")
@@ -759,11 +882,6 @@ async def store_random_review(feedback_input: Request) -> OkResponse:
     """
     Store review from frontend.
     """
-    # TODO: temporary silly solution until database is created
-    #  (missing provider but we can dig it from original feedback file)
-    reviews_dir = Path(REVIEWS_DIR)
-    parsed_reviews_dir = reviews_dir / "parsed"
-    parsed_reviews_dir.mkdir(parents=True, exist_ok=True)
     content = await feedback_input.json()
     original_file_id = content.pop("id")
     # avoid duplicates - same ID can be reviewed multiple times
@@ -771,23 +889,32 @@ async def store_random_review(feedback_input: Request) -> OkResponse:
 
     LOGGER.info("Storing review for %s as %s", original_file_id, file_name)
 
-    write_json_file(
-        reviews_dir / f"{file_name}.json",
+    # waits until the review is durably stored, merging it with the annotation
+    # takes much longer so it happens in the background
+    await run_in_threadpool(
+        Storator3000.store_review,
+        original_file_id,
+        file_name,
         content | {"id": original_file_id},
     )
-
-    parsed_feedback = _parse_feedback(content, original_file_id) | {
-        "id": original_file_id
-    }
-    write_json_file(
-        parsed_reviews_dir / f"{file_name}.json",
-        parsed_feedback,
-    )
+    ReviewProcessor.get().submit(file_name)
 
     our_server = f"{feedback_input.url.scheme}://{feedback_input.url.netloc}"
     return OkResponse.from_id(file_name, our_server)
 
 
+@app.get("/frontend/reviews/{review_id}/status")
+def get_review_status(review_id: str) -> dict:
+    """
+    Whether the review was already merged with the annotation it reviews:
+    pending, parsed or failed.
+    """
+    review = Storator3000.get_index().get_review(review_id)
+    if review is None:
+        raise NoDataFound(f"No review with ID {review_id}")
+    return {"review_id": review_id, "status": review["status"]}
+
+
 @app.get("/download")
 def download_results():
     """
@@ -821,6 +948,39 @@ def download_results():
     )
 
 
+@app.get("/export")
+def export_annotations(
+    after: int = Query(0, ge=0),
+    limit: int = Query(EXPORT_PAGE_SIZE, ge=1, le=EXPORT_PAGE_SIZE),
+    provider: Optional[ProvidersEnum] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> StreamingResponse:
+    """
+    Stream a page of annotations as NDJSON, in the order they were submitted.
+
+    Pass the X-Next-Cursor response header as `after` to get the next page,
+    an empty page means there is nothing new. Incremental consumers can keep
+    the cursor and come back later to get only what was submitted since.
+    """
+    next_cursor, annotations = Storator3000.export(
+        after,
+        limit,
+        provider,
+        since.isoformat() if since else None,
+        until.isoformat() if until else None,
+    )
+    LOGGER.info("Exporting annotations after %s up to %s", after, next_cursor)
+    lines = (
+        json.dumps(annotation, ensure_ascii=False) + "\n" for annotation in annotations
+    )
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={"X-Next-Cursor": str(next_cursor)},
+    )
+
+
 @app.get("/stats")
 def get_report_stats() -> dict:
     """Produce basic information about submitted annotations."""
@@ -829,6 +989,82 @@ def get_report_stats() -> dict:
     return Storator3000.get_stats()
 
 
+# (name, type, help, key in LogCache.stats)
+LOG_CACHE_METRICS = (
+    ("log_cache_hits_total", "counter", "Logs served from the cache.", "hits"),
+    ("log_cache_misses_total", "counter", "Logs not found in the cache.", "misses"),
+    (
+        "log_cache_hit_bytes_total",
+        "counter",
+        "Bytes of logs served from the cache.",
+        "hit_bytes",
+    ),
+    (
+        "log_cache_stored_bytes_total",
+        "counter",
+        "Bytes of logs downloaded and stored in the cache.",
+        "stored_bytes",
+    ),
+    (
+        "log_cache_evictions_total",
+        "counter",
+        "Logs evicted from the cache.",
+        "evictions",
+    ),
+    ("log_cache_entries", "gauge", "Logs in the cache.", "entries"),
+    ("log_cache_size_bytes", "gauge", "Size of the cache on disk.", "size"),
+)
+
+MEMORY_BUDGET_METRICS = (
+    (
+        "memory_budget_bytes",
+        "gauge",
+        "Bytes of logs and uploads a worker may hold in memory.",
+        "capacity",
+    ),
+    (
+        "memory_budget_used_bytes",
+        "gauge",
+        "Bytes of the memory budget reserved by requests.",
+        "used",
+    ),
+    (
+        "memory_budget_waiting",
+        "gauge",
+        "Requests waiting for the memory budget.",
+        "waiting",
+    ),
+    (
+        "memory_budget_rejected_total",
+        "counter",
+        "Requests rejected because the memory budget was exhausted.",
+        "rejected",
+    ),
+)
+
+
+@app.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+def metrics() -> str:
+    """Metrics in the Prometheus text format."""
+    lines = []
+    cache = get_log_cache()
+    if cache is not None:
+        stats = cache.stats()
+        for name, kind, help_, key in LOG_CACHE_METRICS:
+            lines += [
+                f"# HELP logdetective_{name} {help_}",
+                f"# TYPE logdetective_{name} {kind}",
+                f"logdetective_{name} {stats[key]}",
+            ]
+    for name, kind, help_, attribute in MEMORY_BUDGET_METRICS:
+        lines += [
+            f"# HELP logdetective_{name} {help_}",
+            f"# TYPE logdetective_{name} {kind}",
+            f"logdetective_{name} {getattr(BUDGET, attribute)}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
 @app.get("/robots.txt", include_in_schema=False, response_class=PlainTextResponse)
 def robots() -> str:
     """Return robots.txt"""
@@ -0,0 +1,366 @@
+"""
+Backends keeping annotations, reviews and contents of their files.
+
+`Storator3000` decides what is stored under which key and keeps the index
+used for lookups, random picks and statistics. Backends only store bytes
+under keys like `2024-01-01/copr/123/<id>.json.gz`, one backend per namespace
+(results, reviews or blobs). This lets the storage move off a single volume
+and makes the backends comparable with each other.
+"""
+
+import datetime
+import hashlib
+import hmac
+import os
+import sqlite3
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import quote
+
+import httpx
+
+from src.writer import GroupCommitWriter
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def put_many(self, items: list[tuple[str, bytes]]) -> None:
+        """
+        Durably store all (key, data) items, replacing objects with the
+        same keys.
+        """
+
+    def put(self, key: str, data: bytes) -> None:
+        self.put_many([(key, data)])
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """
+        Raises:
+            FileNotFoundError: when nothing is stored under the key
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> Iterator[tuple[str, int]]:
+        """
+        Yields:
+            (key, size) of every object with key starting with the prefix
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Delete the object, if it exists.
+        """
+
+    def prune(self, keep_prefix: Optional[str] = None) -> None:
+        """
+        Clean up what deleted objects left behind, e.g. empty directories,
+        except under keep_prefix where new objects may just be stored.
+        """
+
+
+class FilesystemBackend(StorageBackend):
+    """
+    Objects as files in a directory, key being the relative path.
+    """
+
+    def __init__(self, root: Path | str) -> None:
+        self.root = Path(root)
+
+    def put_many(self, items: list[tuple[str, bytes]]) -> None:
+        writer = GroupCommitWriter.get()
+        futures = [writer.write_file(self.root / key, data) for key, data in items]
+        for future in futures:
+            future.result()
+
+    def get(self, key: str) -> bytes:
+        return (self.root / key).read_bytes()
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def list(self, prefix: str = "") -> Iterator[tuple[str, int]]:
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                # files being written by GroupCommitWriter
+                if name.startswith(".tmp-"):
+                    continue
+                path = Path(directory) / name
+                key = path.relative_to(self.root).as_posix()
+                if key.startswith(prefix):
+                    yield key, path.stat().st_size
+
+    def delete(self, key: str) -> None:
+        (self.root / key).unlink(missing_ok=True)
+
+    def prune(self, keep_prefix: Optional[str] = None) -> None:
+        keep = self.root / keep_prefix if keep_prefix else None
+        for directory, _, _ in os.walk(self.root, topdown=False):
+            path = Path(directory)
+            if path == self.root or (keep and path.is_relative_to(keep)):
+                continue
+            if not any(path.iterdir()):
+                path.rmdir()
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Objects of all namespaces in a single SQLite database file.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS objects (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (namespace, key)
+    );
+    """
+
+    # databases whose schema was already created by this process
+    _initialized: set[str] = set()
+
+    def __init__(self, db_path: Path | str, namespace: str) -> None:
+        self.db_path = Path(db_path)
+        self.namespace = namespace
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        if str(self.db_path) not in self._initialized or not self.db_path.exists():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(self.SCHEMA)
+            conn.close()
+            self._initialized.add(str(self.db_path))
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # don't lose committed objects on power loss, WAL syncs only
+        # on checkpoints by default
+        conn.execute("PRAGMA synchronous=FULL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def put_many(self, items: list[tuple[str, bytes]]) -> None:
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO objects (namespace, key, data) VALUES (?, ?, ?)",
+                [(self.namespace, key, data) for key, data in items],
+            )
+
+    def get(self, key: str) -> bytes:
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM objects WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No object {key} in {self.namespace}")
+        return row[0]
+
+    def exists(self, key: str) -> bool:
+        with self.connection() as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM objects WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                ).fetchone()
+                is not None
+            )
+
+    def list(self, prefix: str = "") -> Iterator[tuple[str, int]]:
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT key, length(data) FROM objects "
+                "WHERE namespace = ? AND substr(key, 1, ?) = ? ORDER BY key",
+                (self.namespace, len(prefix), prefix),
+            ).fetchall()
+        yield from rows
+
+    def delete(self, key: str) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                "DELETE FROM objects WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+
+
+# headers set by httpx which proxies may change
+UNSIGNED_HEADERS = {
+    "accept",
+    "accept-encoding",
+    "authorization",
+    "connection",
+    "content-length",
+    "user-agent",
+}
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sign_v4(
+    request: httpx.Request,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    now: datetime.datetime,
+) -> None:
+    """
+    Sign the request for S3 with AWS Signature Version 4, all its headers
+    are signed.
+
+    https://docs.aws.amazon.com/AmazonS3/latest/API/sig-v4-header-based-auth.html
+    """
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    scope = f"{now.strftime('%Y%m%d')}/{region}/s3/aws4_request"
+    request.headers["x-amz-date"] = amz_date
+    if "x-amz-content-sha256" not in request.headers:
+        request.headers["x-amz-content-sha256"] = _sha256(request.content)
+
+    headers = {
+        name.lower(): " ".join(value.split())
+        for name, value in request.headers.items()
+        if name.lower() not in UNSIGNED_HEADERS
+    }
+    signed_headers = ";".join(sorted(headers))
+    query = "&".join(
+        f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for name, value in sorted(request.url.params.multi_items())
+    )
+    canonical_request = "\n".join(
+        [
+            request.method,
+            quote(request.url.path, safe="/-_.~"),
+            query,
+            "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+            signed_headers,
+            request.headers["x-amz-content-sha256"],
+        ]
+    )
+    string_to_sign = "\n".join(
+        [
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            _sha256(canonical_request.encode("utf-8")),
+        ]
+    )
+    key = f"AWS4{secret_key}".encode("utf-8")
+    for part in scope.split("/"):
+        key = _hmac(key, part)
+    signature = hmac.new(
+        key, string_to_sign.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    request.headers["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+
+
+class S3Backend(StorageBackend):
+    """
+    Objects in an S3-compatible object store (e.g. MinIO or Ceph), keys of a
+    namespace prefixed by its name. Buckets are addressed by path.
+    """
+
+    XMLNS = {"s3": "http://s3.amazonaws.com/doc/2006-03-01/"}
+
+    # HTTP client shared by all backends in this process
+    _client: Optional[httpx.Client] = None
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        namespace: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        client: Optional[httpx.Client] = None,
+    ) -> None:
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.namespace = namespace
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        if client is not None:
+            self.client = client
+        else:
+            if S3Backend._client is None:
+                S3Backend._client = httpx.Client(timeout=30)
+            self.client = S3Backend._client
+
+    def _url(self, key: str = "") -> str:
+        url = f"{self.endpoint_url}/{self.bucket}"
+        if key:
+            url += "/" + quote(f"{self.namespace}/{key}", safe="/-_.~")
+        return url
+
+    def _request(
+        self, method: str, url: str, content: bytes = b"", **kwargs
+    ) -> httpx.Response:
+        request = self.client.build_request(method, url, content=content, **kwargs)
+        sign_v4(
+            request,
+            self.access_key,
+            self.secret_key,
+            self.region,
+            datetime.datetime.now(datetime.timezone.utc),
+        )
+        return self.client.send(request)
+
+    def put_many(self, items: list[tuple[str, bytes]]) -> None:
+        for key, data in items:
+            self._request("PUT", self._url(key), content=data).raise_for_status()
+
+    def get(self, key: str) -> bytes:
+        response = self._request("GET", self._url(key))
+        if response.status_code == 404:
+            raise FileNotFoundError(f"No object {key} in {self.namespace}")
+        response.raise_for_status()
+        return response.content
+
+    def exists(self, key: str) -> bool:
+        response = self._request("HEAD", self._url(key))
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def list(self, prefix: str = "") -> Iterator[tuple[str, int]]:
+        params = {"list-type": "2", "prefix": f"{self.namespace}/{prefix}"}
+        while True:
+            response = self._request("GET", self._url(), params=params)
+            response.raise_for_status()
+            root = ET.fromstring(response.content)
+            for item in root.iterfind("s3:Contents", self.XMLNS):
+                key = item.findtext("s3:Key", "", self.XMLNS)
+                size = int(item.findtext("s3:Size", "0", self.XMLNS))
+                yield key.removeprefix(f"{self.namespace}/"), size
+            token = root.findtext("s3:NextContinuationToken", None, self.XMLNS)
+            if root.findtext("s3:IsTruncated", "", self.XMLNS) != "true" or not token:
+                return
+            params["continuation-token"] = token
+
+    def delete(self, key: str) -> None:
+        response = self._request("DELETE", self._url(key))
+        if response.status_code != 404:
+            response.raise_for_status()
@@ -0,0 +1,85 @@
+"""
+Content-addressed storage for log and spec file contents.
+
+Popular builds get annotated many times, so instead of storing the same
+multi-megabyte log with every annotation, we store each distinct content
+only once, named by its SHA-256 hash.
+"""
+
+import hashlib
+from typing import Optional
+
+from src.backends import StorageBackend
+from src.constants import STORAGE_COMPRESSION
+from src.spells import decode_text, encode_text
+
+
+class BlobStore:
+    def __init__(self, backend: StorageBackend) -> None:
+        self.backend = backend
+
+    @staticmethod
+    def digest(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(digest: str) -> str:
+        # spread blobs into subdirectories so none of them grows too large
+        return f"{digest[:2]}/{digest}"
+
+    def find(self, digest: str) -> Optional[str]:
+        """
+        Find the key of the blob, either compressed (with .gz suffix) or not.
+        """
+        key = self.key(digest)
+        for candidate in (f"{key}.gz", key):
+            if self.backend.exists(candidate):
+                return candidate
+        return None
+
+    def put(self, content: str) -> str:
+        """
+        Store content unless it is already stored.
+
+        Returns:
+            SHA-256 hex digest which can be used to `get` the content back.
+        """
+        return self.put_many([content])[0]
+
+    def put_many(self, contents: list[str]) -> list[str]:
+        """
+        Durably store all contents which are not stored yet, in one batch.
+
+        Returns:
+            SHA-256 hex digests of the contents, in the same order.
+        """
+        digests = []
+        items = {}
+        suffix = ".gz" if STORAGE_COMPRESSION == "gzip" else ""
+        for content in contents:
+            digest = self.digest(content)
+            digests.append(digest)
+            key = self.key(digest) + suffix
+            if key not in items and not self.find(digest):
+                items[key] = encode_text(key, content)
+
+        if items:
+            self.backend.put_many(list(items.items()))
+        return digests
+
+    def delete(self, digest: str) -> None:
+        key = self.key(digest)
+        for candidate in (f"{key}.gz", key):
+            self.backend.delete(candidate)
+
+    def get(self, digest: str) -> str:
+        return decode_text(self.get_stored(digest))
+
+    def get_stored(self, digest: str) -> bytes:
+        """
+        Return the blob as it is stored, gzip compressed or not.
+        """
+        key = self.find(digest)
+        if key is None:
+            raise FileNotFoundError(f"No blob {digest}")
+        return self.backend.get(key)
@@ -0,0 +1,229 @@
+"""
+Admission of requests by the memory their logs take.
+
+A worker can serve hundreds of concurrent requests (see
+LOGDETECTIVE_MAX_CONNECTION_LIMIT), and a burst of them fetching large logs
+could take more memory than the worker has. Every request therefore reserves
+bytes of a MEMORY_BUDGET shared by the whole worker before it reads a log or
+an uploaded body, weighted by MEMORY_BUDGET_FACTOR for the copies made while
+the content is decoded, sanitized and serialized. The reservations are
+released once the response was sent. Requests which can't reserve their bytes
+wait for MEMORY_BUDGET_WAIT seconds in the order they came and then fail with
+503 Service Unavailable. A waiting request holds no bytes, it gives back what
+it has reserved so far and waits for all of it together, so that requests
+waiting for each other can't exhaust the budget.
+"""
+
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.constants import (
+    MEMORY_BUDGET,
+    MEMORY_BUDGET_FACTOR,
+    MEMORY_BUDGET_RETRY_AFTER,
+    MEMORY_BUDGET_WAIT,
+)
+from src.exceptions import BudgetExhausted
+
+T = TypeVar("T")
+
+
+class ByteBudget:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.used = 0
+        self.rejected = 0
+        # (bytes, future) of the requests waiting for bytes, in their order
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self, size: int) -> Optional[int]:
+        """
+        Reserve bytes if they are available right away, see `acquire`.
+        """
+        size = min(size, self.capacity)
+        if not self._waiters and self.used + size <= self.capacity:
+            self.used += size
+            return size
+        return None
+
+    async def acquire(self, size: int, timeout: float) -> int:
+        """
+        Reserve bytes, waiting at most `timeout` seconds for them.
+
+        Returns:
+            The reserved bytes, never more than the capacity, so that a
+            single large request can still proceed on its own.
+        """
+        reserved = self.try_acquire(size)
+        if reserved is not None:
+            return reserved
+
+        size = min(size, self.capacity)
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (size, waiter)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as ex:
+            if waiter.done() and not waiter.cancelled():
+                # the bytes were granted, but nobody is going to use them
+                self.release(size)
+            else:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                self._wake_up()
+            if isinstance(ex, asyncio.TimeoutError):
+                self.rejected += 1
+                raise BudgetExhausted(MEMORY_BUDGET_RETRY_AFTER) from ex
+            raise
+        return size
+
+    def release(self, size: int) -> None:
+        self.used -= size
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        while self._waiters:
+            size, waiter = self._waiters[0]
+            if waiter.done():
+                # cancelled, its task is about to remove it
+                self._waiters.popleft()
+                continue
+            if self.used + size > self.capacity:
+                break
+            self._waiters.popleft()
+            self.used += size
+            waiter.set_result(None)
+
+
+class Reservation:
+    """
+    Bytes reserved by a single request.
+    """
+
+    def __init__(self, budget: ByteBudget) -> None:
+        self.budget = budget
+        self.size = 0
+        self.released = False
+
+    async def reserve(self, size: int) -> None:
+        if self.released:
+            # a fetch shared with other requests outlived the one it started in
+            return
+        size *= MEMORY_BUDGET_FACTOR
+        reserved = self.budget.try_acquire(size)
+        if reserved is None:
+            # don't hold bytes while waiting for more
+            held, self.size = self.size, 0
+            self.budget.release(held)
+            reserved = await self.budget.acquire(held + size, MEMORY_BUDGET_WAIT)
+        if self.released:
+            self.budget.release(reserved)
+        else:
+            self.size += reserved
+
+    def release(self) -> None:
+        self.released = True
+        self.budget.release(self.size)
+        self.size = 0
+
+
+BUDGET = ByteBudget(MEMORY_BUDGET)
+
+_RESERVATION: ContextVar[Optional[Reservation]] = ContextVar(
+    "reservation", default=None
+)
+
+
+async def reserve_memory(size: int) -> None:
+    """
+    Reserve memory for `size` bytes of content for the rest of the current
+    request. Nothing is reserved outside of requests.
+
+    Raises:
+        BudgetExhausted: The bytes weren't available in time.
+    """
+    reservation = _RESERVATION.get()
+    if reservation is not None:
+        await reservation.reserve(size)
+
+
+class _CountingReservation(Reservation):
+    """
+    Bytes reserved by a call shared by several requests, reserved for the
+    request which started it.
+    """
+
+    def __init__(self, parent: Optional[Reservation]) -> None:
+        super().__init__(BUDGET if parent is None else parent.budget)
+        self.parent = parent
+        self.counted = 0
+
+    async def reserve(self, size: int) -> None:
+        self.counted += size
+        if self.parent is not None:
+            await self.parent.reserve(size)
+
+    def release(self) -> None:
+        pass
+
+
+async def count_reserved(func: Callable[[], Awaitable[T]]) -> tuple[T, int]:
+    """
+    Await func() run in its own task, and count the bytes of content it
+    reserves memory for, so that other requests sharing its result can
+    reserve the same.
+    """
+    reservation = _CountingReservation(_RESERVATION.get())
+    _RESERVATION.set(reservation)
+    result = await func()
+    return result, reservation.counted
+
+
+class MemoryBudgetMiddleware:
+    """
+    Scope reservations to requests and reserve memory for uploaded bodies.
+    """
+
+    def __init__(self, app: ASGIApp, budget: ByteBudget = BUDGET) -> None:
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.budget.capacity <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        reservation = Reservation(self.budget)
+        token = _RESERVATION.set(reservation)
+        try:
+            headers = dict(scope["headers"])
+            content_length = headers.get(b"content-length", b"0")
+            if content_length.isdigit() and int(content_length):
+                try:
+                    await reservation.reserve(int(content_length))
+                except BudgetExhausted as ex:
+                    # outside of the app, its exception handlers don't apply
+                    response = JSONResponse(
+                        status_code=ex.status_code,
+                        content={
+                            "error": f"Server error: {ex.status_code}",
+                            "description": ex.detail,
+                        },
+                        headers=ex.headers,
+                    )
+                    await response(scope, receive, send)
+                    return
+            await self.app(scope, receive, send)
+        finally:
+            reservation.release()
+            _RESERVATION.reset(token)
@@ -8,6 +8,86 @@ KOJI_BUILD_URL = "https://koji.fedoraproject.org/koji/buildinfo?buildID={0}"
 OBS_BUILD_URL = "https://build.opensuse.org/package/show/{0}/{1}"
 FEEDBACK_DIR = os.environ.get("FEEDBACK_DIR", "/persistent/results")
 REVIEWS_DIR = os.environ.get("REVIEWS_DIR", "/persistent/reviews")
+# Where to keep annotations, reviews and blobs: "filesystem" (in FEEDBACK_DIR,
+# REVIEWS_DIR and BLOBS_DIR), "sqlite" (all in STORAGE_DB) or "s3"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "filesystem")
+STORAGE_DB = os.environ.get("STORAGE_DB", "/persistent/storage.sqlite3")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+S3_BUCKET = os.environ.get("S3_BUCKET", "logdetective")
+S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY", "")
+# How to compress newly stored annotations, reviews and blobs: "gzip" or "none".
+# Files stored in either way can always be read.
+STORAGE_COMPRESSION = os.environ.get("STORAGE_COMPRESSION", "gzip")
+# "files" stores every annotation as a separate file in FEEDBACK_DIR,
+# "segments" appends them to segment files in SEGMENTS_DIR
+STORAGE_MODE = os.environ.get("STORAGE_MODE", "files")
+SEGMENTS_DIR = os.environ.get("SEGMENTS_DIR", "/persistent/segments")
+SEGMENT_MAX_SIZE = int(os.environ.get("SEGMENT_MAX_SIZE", 256 * 1024 * 1024))
+# Contents of logs and spec files referenced from annotations in FEEDBACK_DIR
+BLOBS_DIR = os.environ.get("BLOBS_DIR", "/persistent/blobs")
+# Review responses rendered from annotations, a cache which is neither
+# compressed by nor archived with the rest, see `python3 -m src.manage prune-rendered`
+RENDERED_DIR = os.environ.get("RENDERED_DIR", "/persistent/rendered")
+# SQLite index of everything stored in FEEDBACK_DIR, can be recreated with
+# `python3 -m src.manage rebuild-index`
+INDEX_DB = os.environ.get("INDEX_DB", "/persistent/index.sqlite3")
+# For how many seconds an annotation handed out for review is not handed out
+# to other reviewers
+REVIEW_LEASE = float(os.environ.get("REVIEW_LEASE", 300))
+# How many threads of a worker merge submitted reviews with annotations
+REVIEW_WORKERS = int(os.environ.get("REVIEW_WORKERS", 2))
+# For how many seconds a review being merged by a worker is not resumed by
+# other workers
+REVIEW_MERGE_LEASE = float(os.environ.get("REVIEW_MERGE_LEASE", 600))
+# How many times a worker tries to merge a review when the storage fails
+REVIEW_MERGE_ATTEMPTS = int(os.environ.get("REVIEW_MERGE_ATTEMPTS", 3))
+# Maximum number of annotations in one page of /export
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 1000))
+# For how many seconds a worker may serve /stats from its memory
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 5))
+# Logs of finished builds are cached in this directory, shared by all workers,
+# up to LOG_CACHE_SIZE bytes (compressed), 0 disables the cache
+LOG_CACHE_DIR = os.environ.get("LOG_CACHE_DIR", "/persistent/log-cache")
+LOG_CACHE_SIZE = int(os.environ.get("LOG_CACHE_SIZE", 1024 * 1024 * 1024))
+# Optional cache shared by all replicas: redis://[:password@]host[:port][/db]
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", "")
+# How long to wait for the shared cache and for how long not to try it again
+# when it didn't answer, in seconds
+SHARED_CACHE_TIMEOUT = float(os.environ.get("SHARED_CACHE_TIMEOUT", 0.5))
+SHARED_CACHE_RETRY = float(os.environ.get("SHARED_CACHE_RETRY", 30))
+# Larger values (compressed) are not kept in the shared cache
+SHARED_CACHE_MAX_VALUE = int(os.environ.get("SHARED_CACHE_MAX_VALUE", 16 * 1024 * 1024))
+# For how many seconds logs, build metadata and explanations are shared
+SHARED_CACHE_LOG_TTL = int(os.environ.get("SHARED_CACHE_LOG_TTL", 7 * 24 * 3600))
+SHARED_CACHE_METADATA_TTL = int(os.environ.get("SHARED_CACHE_METADATA_TTL", 24 * 3600))
+SHARED_CACHE_EXPLANATION_TTL = int(
+    os.environ.get("SHARED_CACHE_EXPLANATION_TTL", 24 * 3600)
+)
+# For how many seconds a worker remembers metadata of finished Copr builds and
+# Koji tasks and how many of them at most
+METADATA_CACHE_TTL = float(os.environ.get("METADATA_CACHE_TTL", 3600))
+METADATA_CACHE_SIZE = int(os.environ.get("METADATA_CACHE_SIZE", 1024))
+# How many calls a worker makes to a Koji hub at once, each in its own session
+KOJI_SESSIONS = int(os.environ.get("KOJI_SESSIONS", 8))
+# Logs larger than LOG_MAX_SIZE bytes are truncated to their first
+# LOG_TRUNCATED_HEAD and last LOG_TRUNCATED_TAIL characters
+LOG_MAX_SIZE = int(os.environ.get("LOG_MAX_SIZE", 32 * 1024 * 1024))
+LOG_TRUNCATED_HEAD = int(os.environ.get("LOG_TRUNCATED_HEAD", 1024 * 1024))
+LOG_TRUNCATED_TAIL = int(os.environ.get("LOG_TRUNCATED_TAIL", 4 * 1024 * 1024))
+# How many bytes of logs and uploads a worker holds in memory at once, 0 means
+# no limit. Every byte is counted MEMORY_BUDGET_FACTOR times for its copies.
+# Requests wait for MEMORY_BUDGET_WAIT seconds at most, then they fail and are
+# told to retry after MEMORY_BUDGET_RETRY_AFTER seconds.
+MEMORY_BUDGET = int(os.environ.get("MEMORY_BUDGET", 1024 * 1024 * 1024))
+MEMORY_BUDGET_FACTOR = int(os.environ.get("MEMORY_BUDGET_FACTOR", 4))
+MEMORY_BUDGET_WAIT = float(os.environ.get("MEMORY_BUDGET_WAIT", 10))
+MEMORY_BUDGET_RETRY_AFTER = float(os.environ.get("MEMORY_BUDGET_RETRY_AFTER", 5))
+# How many lines around every snippet are shown to reviewers right away
+SNIPPET_CONTEXT_LINES = int(os.environ.get("SNIPPET_CONTEXT_LINES", 10))
+# Maximum number of characters of a log fetched at once for more context
+SNIPPET_CONTEXT_MAX_SIZE = int(os.environ.get("SNIPPET_CONTEXT_MAX_SIZE", 256 * 1024))
 
 LOGDETECTIVE_READ_TIMEOUT = float(os.environ.get("LOGDETECTIVE_READ_TIMEOUT", 1800))
 # Set to slightly more than retransmission window of 3s from RFC2988
@@ -0,0 +1,84 @@
+"""
+Asynchronous client of the Copr API.
+
+The python3-copr client is synchronous and blocked the event loop for every
+metadata call of a contribution or explanation. This one uses the shared httpx
+client and remembers every record for the lifetime of the provider, so one
+request asks for a build once. Records of finished builds don't change
+anymore, they are also kept by the worker for METADATA_CACHE_TTL seconds and
+in the cache shared by all replicas, if there is one.
+"""
+
+import asyncio
+from http import HTTPStatus
+from typing import Any
+
+import httpx
+
+from src.constants import SHARED_CACHE_METADATA_TTL
+from src.metadata import MetadataCache
+from src.sharedcache import get_shared_cache
+from src.singleflight import FLIGHTS
+
+FINISHED_COPR_STATES = ("succeeded", "failed", "canceled", "skipped", "forked")
+
+
+class CoprNoResultError(Exception):
+    """
+    The build or build chroot doesn't exist.
+    """
+
+
+class CoprClient:
+    # records of finished builds shared by all requests of this worker, per URL
+    _finished = MetadataCache()
+
+    def __init__(self, copr_url: str, http_client: httpx.AsyncClient) -> None:
+        self.api_url = f"{copr_url}/api_3"
+        self.http_client = http_client
+        # records fetched during this request, finished or not
+        self._records: dict[str, dict[str, Any]] = {}
+
+    async def get_build(self, build_id: int) -> dict[str, Any]:
+        return await self._get(f"build/{build_id}")
+
+    async def get_build_chroot(self, build_id: int, chroot: str) -> dict[str, Any]:
+        return await self._get(f"build-chroot?build_id={build_id}&chrootname={chroot}")
+
+    async def _get(self, path: str) -> dict[str, Any]:
+        url = f"{self.api_url}/{path}"
+        record = self._records.get(url) or self._finished.get(url)
+        if record is None:
+            record = await FLIGHTS.do(("copr", url), lambda: self._fetch(url))
+        self._records[url] = record
+        return record
+
+    async def _fetch(self, url: str) -> dict[str, Any]:
+        shared = get_shared_cache()
+        if shared is not None:
+            record = await asyncio.to_thread(shared.get_json, "metadata", url)
+            if record is not None:
+                self._finished.set(url, record)
+                return record
+
+        response = await self.http_client.get(url)
+        if response.status_code == HTTPStatus.NOT_FOUND:
+            try:
+                detail = response.json()["error"]
+            except (ValueError, KeyError, TypeError):
+                detail = f"{url} not found"
+            raise CoprNoResultError(detail)
+        response.raise_for_status()
+
+        record = response.json()
+        if record.get("state") in FINISHED_COPR_STATES:
+            self._finished.set(url, record)
+            if shared is not None:
+                await asyncio.to_thread(
+                    shared.set_json,
+                    "metadata",
+                    url,
+                    record,
+                    SHARED_CACHE_METADATA_TTL,
+                )
+        return record
@@ -14,3 +14,16 @@ class FetchError(HTTPException):
 
 class NoDataFound(FetchError):
     pass
+
+
+class BudgetExhausted(HTTPException):
+    """
+    The worker doesn't have memory for the logs of another request right now.
+    """
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Too many large logs are being processed, please try again later",
+            headers={"Retry-After": str(round(retry_after))},
+        )
@@ -7,21 +7,24 @@ from abc import ABC, abstractmethod
 from functools import cached_property, wraps
 from http import HTTPStatus
 from pathlib import Path
-from typing import Optional
+from typing import Any, Hashable, Optional
 
-import copr.v3
 import koji
 import httpx
 from fastapi import HTTPException
 
 from src.constants import COPR_RESULT_TEMPLATE, LOGGER_NAME
+from src.copr_client import CoprClient, CoprNoResultError
 from src.exceptions import FetchError
+from src.koji_client import FINISHED_TASK_STATES, KojiClient
+from src.singleflight import single_flight
+from src.srpm import UnsupportedSRPM, read_spec_file
 from src.spells import (
     get_temporary_dir,
     get_logger,
     read_text_file,
+    fetch_log,
     fetch_text,
-    ensure_text,
 )
 
 LOGGER = get_logger(LOGGER_NAME)
@@ -39,7 +42,7 @@ def handle_errors(func):
             return await func(*args, **kwargs)
         except HTTPException:
             raise
-        except (copr.v3.exceptions.CoprNoResultException, koji.GenericError) as ex:
+        except (CoprNoResultError, koji.GenericError) as ex:
             raise HTTPException(
                 status_code=HTTPStatus.BAD_REQUEST, detail=str(ex)
             ) from ex
@@ -73,8 +76,17 @@ def handle_errors(func):
 
 
 class Provider(ABC):
+    @property
     @abstractmethod
-    async def fetch_logs(self) -> list[dict[str, str]]:
+    def flight_key(self) -> Hashable:
+        """
+        What the provider fetches from, concurrent fetches of providers with
+        equal keys share a single call (see `single_flight`).
+        """
+        ...
+
+    @abstractmethod
+    async def fetch_logs(self) -> list[dict[str, Any]]:
         """
         Fetches logs from a provider with name and content.
 
@@ -118,74 +130,80 @@ class CoprProvider(RPMProvider):
     ) -> None:
         self.build_id = build_id
         self.chroot = chroot
-        self.client = copr.v3.Client({"copr_url": self.copr_url})
+        self.client = CoprClient(self.copr_url, http_client)
         self.http_client = http_client
 
+    @property
+    def flight_key(self) -> Hashable:
+        return self.build_id, self.chroot
+
     @handle_errors
-    async def fetch_logs(self) -> list[dict[str, str]]:
-        baseurl, log_names = self._get_baseurl_and_log_names()
+    @single_flight
+    async def fetch_logs(self) -> list[dict[str, Any]]:
+        baseurl, log_names = await self._get_baseurl_and_log_names()
         logs = []
+        # results of a build appear in its result directory once it finished
         responses = await asyncio.gather(
             *[
-                fetch_text("{}/{}".format(baseurl, name), client=self.http_client)
+                fetch_log(
+                    "{}/{}".format(baseurl, name),
+                    client=self.http_client,
+                    immutable=True,
+                )
                 for name in log_names
             ]
         )
 
-        for name, response in zip(log_names, responses):
-            response.raise_for_status()
-            logs.append(
-                {
-                    "name": name.removesuffix(".gz"),
-                    "content": response.text,
-                }
-            )
+        for name, log in zip(log_names, responses):
+            log.response.raise_for_status()
+            logs.append(log.as_dict(name.removesuffix(".gz")))
         return logs
 
-    def _get_baseurl_and_log_names(self):
+    async def _get_baseurl_and_log_names(self):
         log_names = ["builder-live.log.gz", "backend.log.gz"]
-        if self.chroot == "srpm-builds":
-            build = self.client.build_proxy.get(self.build_id)
-            baseurl = COPR_RESULT_TEMPLATE.format(
-                build.ownername, build.project_dirname, build.id
-            )
-        else:
-            build_chroot = self.client.build_chroot_proxy.get(
-                self.build_id, self.chroot
-            )
-            baseurl = build_chroot.result_url
+        if self.chroot != "srpm-builds":
             log_names.append("build.log.gz")
 
+        baseurl = await self._get_baseurl()
         if not baseurl:
             raise FetchError(
                 "There are no results for {}/{}".format(self.build_id, self.chroot)
             )
         return baseurl, log_names
 
+    async def _get_baseurl(self) -> Optional[str]:
+        """
+        URL of the results directory.
+        """
+        if self.chroot == "srpm-builds":
+            build = await self.client.get_build(self.build_id)
+            return COPR_RESULT_TEMPLATE.format(
+                build["ownername"], build["project_dirname"], build["id"]
+            )
+
+        build_chroot = await self.client.get_build_chroot(self.build_id, self.chroot)
+        return build_chroot["result_url"]
+
     @handle_errors
+    @single_flight
     async def fetch_log_urls(self) -> list[dict[str, str]]:
-        baseurl, log_names = self._get_baseurl_and_log_names()
+        baseurl, log_names = await self._get_baseurl_and_log_names()
         return [
             {"name": name.removesuffix(".gz"), "url": "{}/{}".format(baseurl, name)}
             for name in log_names
         ]
 
     @handle_errors
+    @single_flight
     async def fetch_spec_file(self) -> Optional[dict[str, str]]:
-        build = self.client.build_proxy.get(self.build_id)
-        name = build.source_package["name"]
-        if self.chroot == "srpm-builds":
-            baseurl = COPR_RESULT_TEMPLATE.format(
-                build.ownername, build.project_dirname, build.id
-            )
-        else:
-            build_chroot = self.client.build_chroot_proxy.get(
-                self.build_id, self.chroot
-            )
-            baseurl = build_chroot.result_url
-
+        build, baseurl = await asyncio.gather(
+            self.client.get_build(self.build_id), self._get_baseurl()
+        )
+        name = build["source_package"]["name"]
         spec_name = f"{name}.spec"
-        response = await fetch_text(f"{baseurl}/{spec_name}", client=self.http_client)
+        response = await fetch_text(
+            f"{baseurl}/{spec_name}", client=self.http_client, immutable=True
+        )
         if response.status_code == 404:
             return None
         response.raise_for_status()
@@ -205,65 +223,65 @@ class KojiProvider(RPMProvider):
     koji_pkgs_url = "https://kojipkgs.fedoraproject.org/work"
 
     task_id: int
+    task_info: dict
 
     def __init__(
         self, build_or_task_id: int, arch: str, http_client: httpx.AsyncClient
     ) -> None:
-        api_url = "{}/kojihub".format(self.koji_url)
-        self.client = koji.ClientSession(api_url)
-
+        self.client = KojiClient("{}/kojihub".format(self.koji_url))
+        self.build_or_task_id = build_or_task_id
         self.arch = arch
-        self.build_id = None
+        self.build_id: Optional[int] = None
         self.http_client = http_client
+        self._resolved = False
+
+    @property
+    def flight_key(self) -> Hashable:
+        return self.build_or_task_id, self.arch
+
+    async def _resolve(self) -> None:
+        """
+        Find the task and its information, off the event loop.
+        """
+        if self._resolved:
+            return
         # this block detects what we got: is it build or task?
         # failed builds are useless sadly, we will only work with tasks
-        try:
-            self.build = self.client.getBuild(build_or_task_id)
-        except koji.GenericError:
-            # great, no need to take care of builds
-            self.build = None
-
-        if self.build:
-            self.build_id = build_or_task_id
+        build = await self.client.get_build(self.build_or_task_id)
+        if build:
+            self.build_id = self.build_or_task_id
             # it's a build, we need to find the right task now
-            root_task_id = self.build["task_id"]
-            # the response of getTaskDescendents:
-            #   {'112162296': [{'arch': 'noarch', 'awaited': False...
-            task_descendants = self.client.getTaskDescendents(root_task_id)[
-                str(root_task_id)
-            ]
-            for task_info in task_descendants:
+            for task_info in build["tasks"]:
                 if (
-                    task_info["arch"] == arch
+                    task_info["arch"] == self.arch
                     and task_info["method"] in ("buildArch", "buildSRPMFromSCM")
                     and task_info["state"] == 5
                 ):
                     # this is the one and only ring!
-                    self.task_id = task_info["id"]
+                    task = task_info
                     break
             else:
                 raise HTTPException(
-                    detail=f"Build {build_or_task_id} doesn't have a failed task for arch {arch}",
+                    detail=f"Build {self.build_or_task_id} doesn't have a failed task for arch {self.arch}",
                     status_code=HTTPStatus.BAD_REQUEST,
                 )
         else:
-            self.task_id = build_or_task_id
+            task = await self.client.get_task(self.build_or_task_id)
+            if not task:
+                raise HTTPException(
+                    detail=f"Task {self.build_or_task_id} is empty",
+                    status_code=HTTPStatus.BAD_REQUEST,
+                )
 
-    @cached_property
-    def task_info(self) -> dict:
-        task = self.client.getTaskInfo(self.task_id)
-        if not task:
-            raise HTTPException(
-                detail=f"Task {self.task_id} is empty",
-                status_code=HTTPStatus.BAD_REQUEST,
-            )
-        return task
+        self.task_id = task["id"]
+        self.task_info = task
+        self._resolved = True
 
-    @cached_property
+    @property
     def task_request(self) -> list:
-        return self.client.getTaskRequest(self.task_id)
+        return self.task_info["request"]
 
-    def get_task_request_url(self) -> Optional[str]:
+    async def get_task_request_url(self) -> Optional[str]:
         """
         We need this:
             'git+https://src.fedoraproject.org/rpms/libphonenumber.git#c88bd3...
@@ -279,9 +297,9 @@ class KojiProvider(RPMProvider):
             return task_request_url
         parent_task = self.task_info["parent"]
         if parent_task:
-            task_request_url = self.client.getTaskInfo(parent_task, request=True)[
-                "request"
-            ][0]
+            parent_task_info = await self.client.get_task(parent_task)
+            if parent_task_info:
+                task_request_url = parent_task_info["request"][0]
         if task_request_url.startswith("git+https"):
             return task_request_url
         return None
@@ -301,31 +319,75 @@ class KojiProvider(RPMProvider):
                 status_code=HTTPStatus.BAD_REQUEST,
             )
 
-    async def _fetch_task_logs_from_task_id(self) -> list[dict[str, str]]:
+    async def _fetch_task_logs_from_task_id(self) -> list[dict[str, Any]]:
         # since we require arch in the input, we can check if the task matches it
         # but I think it's not a good UX, if the user gives us task ID, let's just use it
         # if someone complains about, just reintroduce the if below
         # if self.task_info["arch"] != self.arch:
 
         self._validate_task_method()
+        available_logs = await self._get_available_logs()
 
-        logs = []
-        # Logs are gathered sequentially for to preserve error handling
-        for log_name in self.logs_to_look_for:
-            try:
-                log_content = await asyncio.to_thread(
-                    self.client.downloadTaskOutput, self.task_id, log_name
+        # outputs of finished tasks don't change anymore
+        immutable = self.task_info["state"] in FINISHED_TASK_STATES
+        # download the non-empty logs in parallel
+        log_names = [name for name, size in available_logs.items() if size]
+        responses = await asyncio.gather(
+            *[
+                fetch_log(
+                    self._log_url(log_name),
+                    client=self.http_client,
+                    immutable=immutable,
                 )
-            except koji.GenericError:
-                # checkout.log not available for buildArch
-                continue
-            # Koji API may return bytes
-            logs.append({"name": log_name, "content": ensure_text(log_content)})
+                for log_name in log_names
+            ],
+            return_exceptions=True,
+        )
+        logs: dict[str, dict[str, Any]] = {
+            name: {"name": name, "content": "", "original_size": 0, "truncated": False}
+            for name in available_logs
+        }
+        for log_name, log in zip(log_names, responses):
+            if isinstance(log, httpx.HTTPError):
+                LOGGER.warning("Unable to download %s: %s", log_name, log)
+                del logs[log_name]
+            elif isinstance(log, BaseException):
+                raise log
+            elif not log.response.is_success:
+                LOGGER.warning(
+                    "Unable to download %s: %s %s",
+                    log.response.url,
+                    log.response.status_code,
+                    log.response.reason_phrase,
+                )
+                del logs[log_name]
+            else:
+                logs[log_name] = log.as_dict(log_name)
 
-        return logs
+        return list(logs.values())
+
+    async def _get_available_logs(self) -> dict[str, int]:
+        """
+        Returns:
+            Sizes of the logs the task has, by their names, in the order of
+            `logs_to_look_for`.
+        """
+        # checkout.log not available for buildArch
+        output = await self.client.get_task_output(self.task_info)
+        return {
+            log_name: int(output[log_name]["st_size"])
+            for log_name in self.logs_to_look_for
+            if log_name in output
+        }
+
+    def _log_url(self, log_name: str) -> str:
+        task_relpath = f"tasks/{self.task_id % 10000}/{self.task_id}"
+        return f"{self.koji_pkgs_url}/{task_relpath}/{log_name}"
 
     @handle_errors
-    async def fetch_logs(self) -> list[dict[str, str]]:
+    @single_flight
+    async def fetch_logs(self) -> list[dict[str, Any]]:
+        await self._resolve()
         logs = await self._fetch_task_logs_from_task_id()
 
         if not logs:
@@ -337,21 +399,15 @@ class KojiProvider(RPMProvider):
         return logs
 
     @handle_errors
+    @single_flight
     async def fetch_log_urls(self) -> list[dict[str, str]]:
+        await self._resolve()
         self._validate_task_method()
-        available_logs = await asyncio.to_thread(
-            self.client.listTaskOutput, self.task_id
-        )
-        task_relpath = f"tasks/{self.task_id % 10000}/{self.task_id}"
+        available_logs = await self._get_available_logs()
         urls = []
         for log_name in self.logs_to_look_for:
             if log_name in available_logs:
-                urls.append(
-                    {
-                        "name": log_name,
-                        "url": f"{self.koji_pkgs_url}/{task_relpath}/{log_name}",
-                    }
-                )
+                urls.append({"name": log_name, "url": self._log_url(log_name)})
 
         if not urls:
             raise FetchError(
@@ -372,6 +428,17 @@ class KojiProvider(RPMProvider):
     def _get_spec_file_content_from_srpm(
         srpm_path: Path, temp_dir: Path
     ) -> Optional[dict[str, str]]:
+        try:
+            with open(srpm_path, "rb") as srpm_f:
+                spec_file = read_spec_file(srpm_f)
+        except UnsupportedSRPM as ex:
+            LOGGER.info("Extracting %s with rpm2archive: %s", srpm_path.name, ex)
+        else:
+            if spec_file is None:
+                return None
+            name, content = spec_file
+            return {"name": name, "content": content}
+
         # extract spec file from srpm
         cmd = f"rpm2archive -n < {str(srpm_path)} | tar xf - '*.spec'"
         subprocess.run(cmd, shell=True, check=True, cwd=temp_dir, capture_output=True)
@@ -386,31 +453,39 @@ class KojiProvider(RPMProvider):
             srpm_url = self._get_srpm_url_from_task()
             if not srpm_url:
                 return None
-            resp = await self.http_client.get(srpm_url)
-            if not resp.is_success:
-                LOGGER.error(
-                    "SRPM %s for task %s not accessible: %s (%s)",
-                    srpm_url,
-                    self.task_id,
-                    resp.status_code,
-                    resp.reason_phrase,
-                )
-                return None
-
             destination = Path(f"{temp_dir}/{srpm_url.split('/')[-1]}")
-            with open(destination, "wb") as srpm_f:
-                srpm_f.write(resp.content)
-
-            return self._get_spec_file_content_from_srpm(destination, temp_dir)
+            async with self.http_client.stream("GET", srpm_url) as resp:
+                if not resp.is_success:
+                    LOGGER.error(
+                        "SRPM %s for task %s not accessible: %s (%s)",
+                        srpm_url,
+                        self.task_id,
+                        resp.status_code,
+                        resp.reason_phrase,
+                    )
+                    return None
+                # don't block the event loop by writing hundreds of megabytes
+                srpm_f = await asyncio.to_thread(open, destination, "wb")
+                try:
+                    async for chunk in resp.aiter_bytes(1024 * 1024):
+                        await asyncio.to_thread(srpm_f.write, chunk)
+                finally:
+                    await asyncio.to_thread(srpm_f.close)
+
+            return await asyncio.to_thread(
+                self._get_spec_file_content_from_srpm, destination, temp_dir
+            )
 
     @handle_errors
+    @single_flight
     async def fetch_spec_file(self) -> Optional[dict[str, str]]:
         """
         Fetch spec file from dist-git if possible.
 
         Otherwise, download the SRPM and extract spec out of it.
         """
-        request_url = self.get_task_request_url()
+        await self._resolve()
+        request_url = await self.get_task_request_url()
         # request_url is not a link but rather a relative path to the SRPM
         if request_url is None:
             return await self._fetch_spec_file_from_task_id()
@@ -428,7 +503,8 @@ class KojiProvider(RPMProvider):
             "https://src.fedoraproject.org/rpms/"
             f"{package_name}/raw/{commit_hash}/f/{package_name}.spec"
         )
-        response = await fetch_text(spec_url, client=self.http_client)
+        # the spec file at a specific commit
+        response = await fetch_text(spec_url, client=self.http_client, immutable=True)
         try:
             response.raise_for_status()
         except httpx.HTTPStatusError as exc:
@@ -463,6 +539,10 @@ class PackitProvider(RPMProvider):
         self.koji_url = f"{self.packit_api_url}/koji-builds/{self.packit_id}"
         self.http_client = http_client
 
+    @property
+    def flight_key(self) -> Hashable:
+        return self.packit_id
+
     async def _get_provider(self) -> CoprProvider | KojiProvider:
         if self._provider:
             return self._provider
@@ -487,9 +567,9 @@ class PackitProvider(RPMProvider):
 
         build = resp.json()
         task_id = build["task_id"]
-        koji_api_url = f"{KojiProvider.koji_url}/kojihub"
-        koji_client = koji.ClientSession(koji_api_url)
-        arch = koji_client.getTaskInfo(task_id, strict=True).get("arch")
+        koji_client = KojiClient(f"{KojiProvider.koji_url}/kojihub")
+        task = await koji_client.get_task(task_id)
+        arch = task.get("arch") if task else None
         if arch is None:
             raise FetchError(f"No arch was found for koji task #{task_id}")
 
@@ -498,16 +578,19 @@ class PackitProvider(RPMProvider):
         )
 
     @handle_errors
-    async def fetch_logs(self) -> list[dict[str, str]]:
+    @single_flight
+    async def fetch_logs(self) -> list[dict[str, Any]]:
         provider = await self._get_provider()
         return await provider.fetch_logs()
 
     @handle_errors
+    @single_flight
     async def fetch_log_urls(self) -> list[dict[str, str]]:
         provider = await self._get_provider()
         return await provider.fetch_log_urls()
 
     @handle_errors
+    @single_flight
     async def fetch_spec_file(self) -> Optional[dict[str, str]]:
         provider = await self._get_provider()
         return await provider.fetch_spec_file()
@@ -526,24 +609,25 @@ class URLProvider(Provider):
         self.url = url
         self.http_client = http_client
 
+    @property
+    def flight_key(self) -> Hashable:
+        return self.url
+
     @handle_errors
-    async def fetch_logs(self) -> list[dict[str, str]]:
+    @single_flight
+    async def fetch_logs(self) -> list[dict[str, Any]]:
         # TODO Can we recognize a directory listing and show _all_ logs?
         #  also this will allow us to fetch spec files
-        response = await fetch_text(self.url, client=self.http_client)
-        response.raise_for_status()
-        if "text/plain" not in response.headers["Content-Type"]:
+        log = await fetch_log(self.url, client=self.http_client)
+        log.response.raise_for_status()
+        if "text/plain" not in log.response.headers["Content-Type"]:
             raise FetchError(
                 f"The URL must point to a raw text file. This URL isn't: {self.url}"
             )
-        return [
-            {
-                "name": "build.log",
-                "content": response.text,
-            }
-        ]
+        return [log.as_dict("build.log")]
 
     @handle_errors
+    @single_flight
     async def fetch_log_urls(self) -> list[dict[str, str]]:
         return [{"name": "build.log", "url": self.url}]
 
@@ -557,23 +641,24 @@ class ContainerProvider(Provider):
         self.url = url
         self.http_client = http_client
 
+    @property
+    def flight_key(self) -> Hashable:
+        return self.url
+
     @handle_errors
-    async def fetch_logs(self) -> list[dict[str, str]]:
+    @single_flight
+    async def fetch_logs(self) -> list[dict[str, Any]]:
         # TODO: c&p from url provider for now, integrate with containers better later on
-        response = await fetch_text(self.url, client=self.http_client)
-        response.raise_for_status()
-        if "text/plain" not in response.headers["Content-Type"]:
+        log = await fetch_log(self.url, client=self.http_client)
+        log.response.raise_for_status()
+        if "text/plain" not in log.response.headers["Content-Type"]:
             raise FetchError(
                 f"The URL must point to a raw text file. This URL isn't: {self.url}"
             )
-        return [
-            {
-                "name": "Container log",
-                "content": response.text,
-            }
-        ]
+        return [log.as_dict("Container log")]
 
     @handle_errors
+    @single_flight
     async def fetch_log_urls(self) -> list[dict[str, str]]:
         return [{"name": "Container log", "url": self.url}]
 
@@ -605,6 +690,10 @@ class OBSProvider(RPMProvider):
         self.package = package
         self.http_client = http_client
 
+    @property
+    def flight_key(self) -> Hashable:
+        return self.project, self.repository, self.architecture, self.package
+
     @cached_property
     def log_url(self) -> str:
         """Return the OBS public build-log URL for this provider's coordinates."""
@@ -616,21 +705,24 @@ class OBSProvider(RPMProvider):
         )
 
     @handle_errors
-    async def fetch_logs(self) -> list[dict[str, str]]:
-        response = await fetch_text(self.log_url, client=self.http_client)
-        response.raise_for_status()
-        content_type = response.headers.get("Content-Type", "")
+    @single_flight
+    async def fetch_logs(self) -> list[dict[str, Any]]:
+        log = await fetch_log(self.log_url, client=self.http_client)
+        log.response.raise_for_status()
+        content_type = log.response.headers.get("Content-Type", "")
         if "text/plain" not in content_type:
             raise FetchError(
                 f"The OBS log URL did not return a plain text file. URL: {self.log_url}"
             )
-        return [{"name": "build.log", "content": response.text}]
+        return [log.as_dict("build.log")]
 
     @handle_errors
+    @single_flight
     async def fetch_log_urls(self) -> list[dict[str, str]]:
         return [{"name": "build.log", "url": self.log_url}]
 
     @handle_errors
+    @single_flight
     async def fetch_spec_file(self) -> Optional[dict[str, str]]:
         spec_name = f"{self.package}.spec"
         url = self.obs_spec_url.format(
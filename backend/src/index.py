@@ -0,0 +1,580 @@
+"""
+SQLite-backed metadata index of stored annotations.
+
+The annotations themselves stay where `Storator3000` puts them, the index only
+remembers where to find them so we don't need to walk the whole feedback
+directory on every request.
+"""
+
+import fcntl
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    build_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    reviews INTEGER NOT NULL DEFAULT 0
+);
+
+-- Statistics kept up to date on every write so that reading them is cheap.
+-- Kinds are: total, reviewed (annotations with at least one review),
+-- reviews (number of reviews), provider and day.
+CREATE TABLE IF NOT EXISTS counters (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+);
+
+-- Reviews of annotations and where they are stored, relative to REVIEWS_DIR.
+-- Parsed copies of reviews are stored under parsed/<key>.
+CREATE TABLE IF NOT EXISTS reviews (
+    id TEXT PRIMARY KEY,
+    annotation_id TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reviews_annotation ON reviews (annotation_id);
+
+-- Votes of all reviews of an annotation summed up. Fields are fail_reason,
+-- how_to_fix and snippet, snippets are identified by their file and position.
+CREATE TABLE IF NOT EXISTS votes (
+    annotation_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    file TEXT NOT NULL DEFAULT '',
+    start_index INTEGER NOT NULL DEFAULT -1,
+    end_index INTEGER NOT NULL DEFAULT -1,
+    up INTEGER NOT NULL DEFAULT 0,
+    down INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (annotation_id, field, file, start_index, end_index)
+);
+
+-- Annotations as shown to reviewers, with windows around snippets instead of
+-- full logs (see src/snippets.py). They are derived from the annotations, so
+-- they are kept when the index is rebuilt and recreated when missing.
+CREATE TABLE IF NOT EXISTS review_payloads (
+    annotation_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+
+-- Hashes of review responses rendered once, per payload mode (full or
+-- snippets), kept in the rendered namespace. Annotations never change, so
+-- neither do these.
+CREATE TABLE IF NOT EXISTS rendered_reviews (
+    annotation_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    content_sha256 TEXT NOT NULL,
+    PRIMARY KEY (annotation_id, payload)
+);
+"""
+
+# Columns added to tables later, indexes created before get them when
+# first opened
+ADDED_COLUMNS = {
+    "annotations": {
+        # where the annotation starts within the segment in `path`, NULL for
+        # annotations stored as separate files
+        "segment_offset": "INTEGER",
+        # Copr chroot or Koji architecture the annotated logs are from
+        "chroot": "TEXT",
+        # name of the package from its spec file
+        "package": "TEXT",
+        # until when (UNIX time) the annotation is handed out for review
+        "lease_until": "REAL",
+    },
+    "reviews": {
+        # pending until the review is merged with the annotation into its
+        # parsed copy, then parsed, or failed
+        "status": "TEXT NOT NULL DEFAULT 'parsed'",
+        # until when (UNIX time) a worker merges the pending review
+        "lease_until": "REAL",
+    },
+}
+
+# Secondary indexes, created only once the columns above exist
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS annotations_build "
+    "ON annotations (provider, build_id, chroot)",
+    "CREATE INDEX IF NOT EXISTS annotations_package ON annotations (package)",
+    # the review queue, least reviewed and oldest first
+    "CREATE INDEX IF NOT EXISTS annotations_queue ON annotations (reviews, seq)",
+    "CREATE INDEX IF NOT EXISTS reviews_status ON reviews (status)",
+)
+
+INCREMENT = (
+    "INSERT INTO counters (kind, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT (kind, key) DO UPDATE SET value = value + excluded.value"
+)
+
+VOTE = (
+    "INSERT INTO votes (annotation_id, field, file, start_index, end_index, up, down) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (annotation_id, field, file, start_index, end_index) "
+    "DO UPDATE SET up = up + excluded.up, down = down + excluded.down"
+)
+
+RECOUNT = (
+    "UPDATE annotations SET reviews = "
+    "(SELECT count(*) FROM reviews "
+    " WHERE annotation_id = annotations.id AND status = 'parsed')",
+    "DELETE FROM counters",
+    "INSERT INTO counters (kind, key, value) "
+    "SELECT 'total', '', count(*) FROM annotations",
+    "INSERT INTO counters (kind, key, value) "
+    "SELECT 'reviewed', '', count(*) FROM annotations WHERE reviews > 0",
+    "INSERT INTO counters (kind, key, value) "
+    "SELECT 'reviews', '', coalesce(sum(reviews), 0) FROM annotations",
+    "INSERT INTO counters (kind, key, value) "
+    "SELECT 'provider', provider, count(*) FROM annotations GROUP BY provider",
+    "INSERT INTO counters (kind, key, value) "
+    "SELECT 'day', date, count(*) FROM annotations GROUP BY date",
+)
+
+INSERT = (
+    "INSERT OR IGNORE INTO annotations "
+    "(id, path, provider, build_id, date, size, reviews, segment_offset, "
+    "chroot, package) "
+    "VALUES (:id, :path, :provider, :build_id, :date, :size, :reviews, "
+    ":segment_offset, :chroot, :package)"
+)
+
+
+class AnnotationIndex:
+    """
+    Metadata about every stored annotation: its ID, path relative to
+    FEEDBACK_DIR (or segment name and offset), provider, build ID, chroot,
+    package, date of submission, size and number of reviews.
+    """
+
+    # databases whose schema was already created by this process
+    _initialized: set[str] = set()
+
+    def __init__(self, db_path: Path | str) -> None:
+        self.db_path = Path(db_path)
+
+    def exists(self) -> bool:
+        return self.db_path.exists()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Serialize e.g. rebuilds of the index across all processes sharing it.
+        """
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.db_path.with_name(f"{self.db_path.name}.lock")
+        with open(lock_path, "w", encoding="utf-8") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a connection to the index, commit on success and roll back
+        on failure.
+        """
+        if str(self.db_path) not in self._initialized or not self.exists():
+            self._create_schema()
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_schema(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # WAL lets readers from other workers proceed while one is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            for table, added_columns in ADDED_COLUMNS.items():
+                columns = {
+                    row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+                }
+                for column, definition in added_columns.items():
+                    if column not in columns:
+                        conn.execute(
+                            f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+                        )
+            for statement in INDEXES:
+                conn.execute(statement)
+        finally:
+            conn.close()
+        self._initialized.add(str(self.db_path))
+
+    def add(self, record: dict) -> None:
+        """
+        Args:
+            record: dict with keys id, path, provider, build_id, date, size,
+                reviews, segment_offset, chroot and package
+        """
+        with self.connection() as conn:
+            if conn.execute(INSERT, record).rowcount == 0:
+                return
+            conn.executemany(
+                INCREMENT,
+                [
+                    ("total", "", 1),
+                    ("provider", record["provider"], 1),
+                    ("day", record["date"], 1),
+                ],
+            )
+
+    def get(self, id_: str) -> Optional[sqlite3.Row]:
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT * FROM annotations WHERE id = ?", (id_,)
+            ).fetchone()
+
+    def find(
+        self,
+        provider: Optional[str] = None,
+        build_id: Optional[str] = None,
+        chroot: Optional[str] = None,
+        package: Optional[str] = None,
+        limit: int = 100,
+    ) -> list[sqlite3.Row]:
+        """
+        Annotations matching all given criteria, newest first.
+        """
+        criteria = {
+            "provider": provider,
+            "build_id": build_id,
+            "chroot": chroot,
+            "package": package,
+        }
+        conditions = [f"{column} = :{column}" for column, v in criteria.items() if v]
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        with self.connection() as conn:
+            return conn.execute(
+                f"SELECT * FROM annotations {where}ORDER BY seq DESC LIMIT :limit",
+                criteria | {"limit": limit},
+            ).fetchall()
+
+    def page(
+        self,
+        after: int = 0,
+        limit: int = 100,
+        provider: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> list[sqlite3.Row]:
+        """
+        Annotations in the order they were indexed, for paging through them.
+
+        Args:
+            after: return only annotations with greater seq than this
+            limit: return at most this many annotations
+            provider: return only annotations from this provider
+            since: return only annotations submitted on this date or later
+            until: return only annotations submitted on this date or earlier
+        """
+        conditions = ["seq > :after"]
+        if provider:
+            conditions.append("provider = :provider")
+        if since:
+            conditions.append("date >= :since")
+        if until:
+            conditions.append("date <= :until")
+        with self.connection() as conn:
+            return conn.execute(
+                f"SELECT * FROM annotations WHERE {' AND '.join(conditions)} "
+                "ORDER BY seq LIMIT :limit",
+                {
+                    "after": after,
+                    "limit": limit,
+                    "provider": provider,
+                    "since": since,
+                    "until": until,
+                },
+            ).fetchall()
+
+    def lease_for_review(self, now: float, lease: float) -> Optional[sqlite3.Row]:
+        """
+        Hand out the least reviewed annotation, the oldest of them, which is
+        not handed out to another reviewer already, and lease it for `lease`
+        seconds. When all are leased, the one with the oldest lease is picked.
+        """
+        with self.connection() as conn:
+            # a single statement so that two workers never pick the same one
+            return conn.execute(
+                "UPDATE annotations SET lease_until = :until WHERE seq = coalesce("
+                "  (SELECT seq FROM annotations"
+                "   WHERE lease_until IS NULL OR lease_until < :now"
+                "   ORDER BY reviews, seq LIMIT 1),"
+                "  (SELECT seq FROM annotations ORDER BY lease_until LIMIT 1)"
+                ") RETURNING *",
+                {"now": now, "until": now + lease},
+            ).fetchone()
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def add_review(
+        self,
+        id_: str,
+        review_id: str,
+        key: str,
+        votes: Iterable[tuple[str, str, int, int, int]] = (),
+        status: str = "pending",
+        lease_until: Optional[float] = None,
+    ) -> None:
+        """
+        Record a review of the annotation stored under the key. It is counted
+        with its votes only once it is parsed, see `set_review_parsed`.
+
+        Args:
+            votes: (field, file, start index, end index, vote) of a parsed
+                review, vote being 1 or -1, see the votes table
+            lease_until: until when the pending review is merged by this
+                worker, see `lease_pending_reviews`
+        """
+        with self.connection() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO reviews "
+                "(id, annotation_id, key, status, lease_until) VALUES (?, ?, ?, ?, ?)",
+                (review_id, id_, key, status, lease_until),
+            )
+            if inserted.rowcount == 0:
+                return
+            # the reviewer is done with the annotation
+            conn.execute(
+                "UPDATE annotations SET lease_until = NULL WHERE id = ?", (id_,)
+            )
+            if status == "parsed":
+                self._count_review(conn, id_, votes)
+
+    def set_review_parsed(
+        self, review_id: str, votes: Iterable[tuple[str, str, int, int, int]] = ()
+    ) -> None:
+        """
+        Mark a review merged with its annotation and count it with its votes.
+        """
+        with self.connection() as conn:
+            row = conn.execute(
+                "UPDATE reviews SET status = 'parsed', lease_until = NULL "
+                "WHERE id = ? AND status != 'parsed' RETURNING annotation_id",
+                (review_id,),
+            ).fetchone()
+            if row is not None:
+                self._count_review(conn, row["annotation_id"], votes)
+
+    def _count_review(
+        self,
+        conn: sqlite3.Connection,
+        id_: str,
+        votes: Iterable[tuple[str, str, int, int, int]],
+    ) -> None:
+        conn.executemany(VOTE, self._vote_rows(id_, votes))
+        updated = conn.execute(
+            "UPDATE annotations SET reviews = reviews + 1 WHERE id = ?", (id_,)
+        )
+        if updated.rowcount == 0:
+            return
+        conn.execute(INCREMENT, ("reviews", "", 1))
+        reviews = conn.execute(
+            "SELECT reviews FROM annotations WHERE id = ?", (id_,)
+        ).fetchone()[0]
+        if reviews == 1:
+            conn.execute(INCREMENT, ("reviewed", "", 1))
+
+    @staticmethod
+    def _vote_rows(
+        id_: str, votes: Iterable[tuple[str, str, int, int, int]]
+    ) -> Iterator[tuple]:
+        for field, file, start_index, end_index, vote in votes:
+            yield (
+                id_,
+                field,
+                file,
+                start_index,
+                end_index,
+                int(vote > 0),
+                int(vote < 0),
+            )
+
+    def votes(self, id_: str) -> list[sqlite3.Row]:
+        """
+        Votes of all reviews of the annotation summed up.
+        """
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT * FROM votes WHERE annotation_id = ? "
+                "ORDER BY field, file, start_index, end_index",
+                (id_,),
+            ).fetchall()
+
+    def get_review_payload(self, id_: str) -> Optional[str]:
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT payload FROM review_payloads WHERE annotation_id = ?", (id_,)
+            ).fetchone()
+        return None if row is None else row["payload"]
+
+    def set_review_payload(self, id_: str, payload: str) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO review_payloads (annotation_id, payload) "
+                "VALUES (?, ?)",
+                (id_, payload),
+            )
+
+    def get_rendered_review(self, id_: str, payload: str) -> Optional[str]:
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT content_sha256 FROM rendered_reviews "
+                "WHERE annotation_id = ? AND payload = ?",
+                (id_, payload),
+            ).fetchone()
+        return None if row is None else row["content_sha256"]
+
+    def set_rendered_review(self, id_: str, payload: str, digest: str) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rendered_reviews "
+                "(annotation_id, payload, content_sha256) VALUES (?, ?, ?)",
+                (id_, payload, digest),
+            )
+
+    def pop_rendered_reviews(self) -> list[str]:
+        """
+        Forget all rendered review responses.
+
+        Returns:
+            Hashes of the forgotten responses.
+        """
+        with self.connection() as conn:
+            rows = conn.execute(
+                "DELETE FROM rendered_reviews RETURNING content_sha256"
+            ).fetchall()
+        return [row["content_sha256"] for row in rows]
+
+    def get_review(self, review_id: str) -> Optional[sqlite3.Row]:
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT * FROM reviews WHERE id = ?", (review_id,)
+            ).fetchone()
+
+    def set_review_status(self, review_id: str, status: str) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE reviews SET status = ? WHERE id = ?", (status, review_id)
+            )
+
+    def lease_pending_reviews(self, now: float, lease: float) -> list[str]:
+        """
+        IDs of reviews not merged with their annotations yet and not being
+        merged by another worker, leased to this one for `lease` seconds.
+        """
+        with self.connection() as conn:
+            # a single statement so that two workers never merge the same one
+            rows = conn.execute(
+                "UPDATE reviews SET lease_until = :until WHERE status = 'pending' "
+                "AND (lease_until IS NULL OR lease_until < :now) RETURNING id",
+                {"now": now, "until": now + lease},
+            ).fetchall()
+        return sorted(row["id"] for row in rows)
+
+    def pending_reviews(self) -> list[str]:
+        """
+        IDs of reviews not merged with their annotations yet.
+        """
+        with self.connection() as conn:
+            return [
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM reviews WHERE status = 'pending' ORDER BY id"
+                )
+            ]
+
+    def reviews(self, id_: str) -> list[sqlite3.Row]:
+        """
+        Reviews of the annotation, oldest first.
+        """
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT * FROM reviews WHERE annotation_id = ? ORDER BY id", (id_,)
+            ).fetchall()
+
+    def unpacked(self, after: int, limit: int) -> list[sqlite3.Row]:
+        """
+        Annotations stored as separate files, not in segments.
+
+        Args:
+            after: return only annotations with greater seq than this
+            limit: return at most this many annotations
+        """
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT * FROM annotations WHERE segment_offset IS NULL AND seq > ? "
+                "ORDER BY seq LIMIT ?",
+                (after, limit),
+            ).fetchall()
+
+    def relocate(self, id_: str, path: str, segment_offset: int, size: int) -> None:
+        """
+        Point the annotation to its new location in a segment.
+        """
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE annotations SET path = ?, segment_offset = ?, size = ? "
+                "WHERE id = ?",
+                (path, segment_offset, size, id_),
+            )
+
+    def counters(self) -> dict[str, dict[str, int]]:
+        """
+        Returns:
+            Counters grouped by their kind, e.g. {"provider": {"copr": 42}}
+        """
+        result: dict[str, dict[str, int]] = {}
+        with self.connection() as conn:
+            for row in conn.execute("SELECT kind, key, value FROM counters"):
+                result.setdefault(row["kind"], {})[row["key"]] = row["value"]
+        return result
+
+    def rebuild(self, records: Iterable[dict], reviews: Iterable[dict]) -> int:
+        """
+        Replace the whole index with given records.
+
+        Args:
+            records: dicts with the same keys as the record for `add`,
+                numbers of reviews are counted from `reviews`
+            reviews: dicts with keys id, annotation_id, key, status and
+                votes (see `add_review`), only parsed ones are counted
+
+        Returns:
+            Number of indexed annotations.
+        """
+        reviews = list(reviews)
+        with self.connection() as conn:
+            conn.execute("DELETE FROM annotations")
+            conn.executemany(INSERT, records)
+            conn.execute("DELETE FROM reviews")
+            conn.executemany(
+                "INSERT OR IGNORE INTO reviews (id, annotation_id, key, status) "
+                "VALUES (:id, :annotation_id, :key, :status)",
+                reviews,
+            )
+            conn.execute("DELETE FROM votes")
+            for review in reviews:
+                if review["status"] != "parsed":
+                    continue
+                conn.executemany(
+                    VOTE, self._vote_rows(review["annotation_id"], review["votes"])
+                )
+            for statement in RECOUNT:
+                conn.execute(statement)
+            return conn.execute("SELECT count(*) FROM annotations").fetchone()[0]
@@ -0,0 +1,217 @@
+"""
+Koji metadata resolution off the event loop.
+
+koji.ClientSession is synchronous, so its calls are made in threads. Calls
+which don't depend on each other are batched into one multicall, so that
+resolving a build to its task takes two round trips and a task ID one.
+Builds and tasks which finished don't change anymore, they are remembered by
+the worker for METADATA_CACHE_TTL seconds, so resolving the same build for
+another architecture costs no calls at all.
+
+Sessions are pooled per hub and reused by later requests, so that their
+connections are too. At most KOJI_SESSIONS calls per hub are made at once by
+a worker, the others wait for a free session.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import koji
+
+from src.constants import KOJI_SESSIONS
+from src.metadata import MetadataCache
+
+FINISHED_BUILD_STATES = (
+    koji.BUILD_STATES["COMPLETE"],
+    koji.BUILD_STATES["DELETED"],
+    koji.BUILD_STATES["FAILED"],
+    koji.BUILD_STATES["CANCELED"],
+)
+FINISHED_TASK_STATES = (
+    koji.TASK_STATES["CLOSED"],
+    koji.TASK_STATES["CANCELED"],
+    koji.TASK_STATES["FAILED"],
+)
+
+
+class KojiSessionPool:
+    # pools shared by all requests of this worker, per hub
+    _instances: dict[str, "KojiSessionPool"] = {}
+
+    def __init__(self, api_url: str, size: int = KOJI_SESSIONS) -> None:
+        self.api_url = api_url
+        self._idle: list[koji.ClientSession] = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    @classmethod
+    def for_url(cls, api_url: str) -> "KojiSessionPool":
+        if api_url not in cls._instances:
+            cls._instances[api_url] = cls(api_url)
+        return cls._instances[api_url]
+
+    @classmethod
+    def close_all(cls) -> None:
+        for pool in cls._instances.values():
+            pool.close()
+        cls._instances.clear()
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[koji.ClientSession]:
+        """
+        A session nobody else uses until the context ends.
+        """
+        async with self._semaphore:
+            if self._idle:
+                session = self._idle.pop()
+            else:
+                session = koji.ClientSession(self.api_url)
+            reusable = False
+            try:
+                yield session
+                reusable = True
+            except koji.GenericError:
+                # an error reported by the hub, the session is fine
+                reusable = True
+                raise
+            finally:
+                # otherwise the call may still be running in its thread
+                if reusable:
+                    self._idle.append(session)
+
+    def close(self) -> None:
+        for session in self._idle:
+            rsession = getattr(session, "rsession", None)
+            if rsession is not None:
+                rsession.close()
+        self._idle.clear()
+
+
+class KojiClient:
+    # finished builds and tasks shared by all requests of this worker
+    _finished = MetadataCache()
+
+    def __init__(self, api_url: str) -> None:
+        self.pool = KojiSessionPool.for_url(api_url)
+        # tasks fetched during this request, finished or not
+        self._tasks: dict[int, Optional[dict[str, Any]]] = {}
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """
+        Call a method of the hub in a thread.
+        """
+        async with self.pool.session() as session:
+            return await asyncio.to_thread(getattr(session, method), *args, **kwargs)
+
+    async def multicall(self, *calls: tuple[str, tuple, dict]) -> list[Any]:
+        """
+        Make (method, args, kwargs) calls in one round trip, in a thread.
+
+        Returns:
+            Results of the calls, koji.GenericError for those which failed.
+        """
+        async with self.pool.session() as session:
+            return await asyncio.to_thread(self._multicall, session, calls)
+
+    @staticmethod
+    def _multicall(
+        session: koji.ClientSession, calls: tuple[tuple[str, tuple, dict], ...]
+    ) -> list[Any]:
+        with session.multicall(strict=False) as multicall:
+            pending = [
+                getattr(multicall, method)(*args, **kwargs)
+                for method, args, kwargs in calls
+            ]
+        results = []
+        for call in pending:
+            try:
+                results.append(call.result)
+            except koji.GenericError as ex:
+                results.append(ex)
+        return results
+
+    async def get_build(self, build_or_task_id: int) -> Optional[dict[str, Any]]:
+        """
+        Resolve a build with its tasks.
+
+        The ID may be a task ID too, its task is fetched in the same round
+        trip and kept for `get_task`.
+
+        Returns:
+            {"build": ..., "root": root task, "tasks": its descendants}, tasks
+            with their requests, None when the ID is not a build.
+        """
+        key = ("build", build_or_task_id)
+        build = self._finished.get(key)
+        if build is None:
+            build = await self._fetch_build(build_or_task_id)
+        if not build:
+            return None
+        # the parent of the task with logs is the root task
+        for task in [build["root"], *build["tasks"]]:
+            self._tasks[task["id"]] = task
+        return build
+
+    async def _fetch_build(self, build_or_task_id: int) -> dict[str, Any]:
+        key = ("build", build_or_task_id)
+        build, task = await self.multicall(
+            ("getBuild", (build_or_task_id,), {}),
+            ("getTaskInfo", (build_or_task_id,), {"request": True}),
+        )
+        if isinstance(build, koji.GenericError) or not build:
+            task = None if isinstance(task, koji.GenericError) else task
+            self._tasks[build_or_task_id] = task
+            if task and task["state"] in FINISHED_TASK_STATES:
+                # it's a finished task, no need to ask again
+                self._finished.set(key, {})
+                self._finished.set(("task", build_or_task_id), task)
+            return {}
+
+        root_task_id = build["task_id"]
+        descendants, root = await self.multicall(
+            ("getTaskDescendents", (root_task_id,), {"request": True}),
+            ("getTaskInfo", (root_task_id,), {"request": True}),
+        )
+        for result in (descendants, root):
+            if isinstance(result, koji.GenericError):
+                raise result
+        # the response of getTaskDescendents:
+        #   {'112162296': [{'arch': 'noarch', 'awaited': False...
+        build = {
+            "build": build,
+            "root": root,
+            "tasks": descendants[str(root_task_id)],
+        }
+        if build["build"]["state"] in FINISHED_BUILD_STATES:
+            self._finished.set(key, build)
+        return build
+
+    async def get_task(self, task_id: int) -> Optional[dict[str, Any]]:
+        """
+        Returns:
+            Information about the task with its request, None when there is no
+            such task.
+        """
+        if task_id in self._tasks:
+            return self._tasks[task_id]
+        task = self._finished.get(("task", task_id))
+        if task is None:
+            task = await self.call("getTaskInfo", task_id, request=True)
+            if task and task["state"] in FINISHED_TASK_STATES:
+                self._finished.set(("task", task_id), task)
+        self._tasks[task_id] = task
+        return task
+
+    async def get_task_output(self, task: dict[str, Any]) -> dict[str, Any]:
+        """
+        Returns:
+            Files the task produced with their stat information (`st_size`
+            etc.), by their names.
+        """
+        key = ("output", task["id"])
+        output = self._finished.get(key)
+        if output is None:
+            output = await self.call("listTaskOutput", task["id"], stat=True)
+            if task["state"] in FINISHED_TASK_STATES:
+                self._finished.set(key, output)
+        return output
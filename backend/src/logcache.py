@@ -0,0 +1,239 @@
+"""
+On-disk cache of logs and spec files fetched from build systems.
+
+Every contribution and explanation of a build downloads its logs again, in
+every worker separately. Logs of finished builds never change, so they are
+kept in LOG_CACHE_DIR, named by the hash of their URL and shared by all
+workers on the node. An SQLite database next to them remembers when each was
+used last, evicts the least recently used ones once all of them take more than
+LOG_CACHE_SIZE bytes and counts hits and misses for /metrics. Logs missing
+here are looked up in the cache shared by all replicas, if there is one.
+
+The cache must never break fetching, anything going wrong with it is logged
+and treated as a miss.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.constants import (
+    LOG_CACHE_DIR,
+    LOG_CACHE_SIZE,
+    LOGGER_NAME,
+    SHARED_CACHE_LOG_TTL,
+)
+from src.sharedcache import get_shared_cache
+
+# src.spells fetches through the cache, so its get_logger can't be used here
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    -- compressed size on disk
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+
+-- hits, misses, hit_bytes, stored_bytes and evictions
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+INCREMENT = (
+    "INSERT INTO counters (name, value) VALUES (?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value"
+)
+
+
+class LogCache:
+    # caches whose schema was already created by this process
+    _initialized: set[str] = set()
+
+    def __init__(self, root: Path | str, max_size: int) -> None:
+        self.root = Path(root)
+        self.max_size = max_size
+        self.db_path = self.root / "cache.sqlite3"
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        if str(self.db_path) not in self._initialized or not self.db_path.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+            conn.close()
+            self._initialized.add(str(self.db_path))
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / digest
+
+    def get(self, url: str) -> Optional[tuple[bytes, Optional[str]]]:
+        """
+        Returns:
+            Content and content type of the URL, None when it is not cached.
+        """
+        try:
+            with self.connection() as conn:
+                row = conn.execute(
+                    "UPDATE entries SET used = ? WHERE url = ? RETURNING content_type",
+                    (time.time(), url),
+                ).fetchone()
+                if row is None:
+                    conn.execute(INCREMENT, ("misses", 1))
+                    return None
+
+            try:
+                content = gzip.decompress(self._path(url).read_bytes())
+            except (OSError, EOFError):
+                # evicted by another worker in the meantime
+                with self.connection() as conn:
+                    conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                    conn.execute(INCREMENT, ("misses", 1))
+                return None
+
+            with self.connection() as conn:
+                conn.execute(INCREMENT, ("hits", 1))
+                conn.execute(INCREMENT, ("hit_bytes", len(content)))
+            return content, row["content_type"]
+        except (OSError, sqlite3.Error) as ex:
+            LOGGER.error("Log cache lookup of %s failed: %s", url, ex)
+            return None
+
+    def put(self, url: str, content: bytes, content_type: Optional[str]) -> None:
+        """
+        Cache content of the URL and evict the least recently used entries
+        if the cache grew too large.
+        """
+        path = self._path(url)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            data = gzip.compress(content, compresslevel=6)
+            # other workers may be reading the previous version
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as tmp_f:
+                tmp_f.write(data)
+            os.replace(tmp_path, path)
+
+            with self.connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (url, size, content_type, used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (url, len(data), content_type, time.time()),
+                )
+                conn.execute(INCREMENT, ("stored_bytes", len(content)))
+            self._evict()
+        except (OSError, sqlite3.Error) as ex:
+            LOGGER.error("Caching of %s failed: %s", url, ex)
+
+    def _evict(self) -> None:
+        with self.connection() as conn:
+            total = conn.execute(
+                "SELECT coalesce(sum(size), 0) FROM entries"
+            ).fetchone()[0]
+            if total <= self.max_size:
+                return
+            evicted = []
+            rows = conn.execute(
+                "SELECT url, size FROM entries ORDER BY used"
+            ).fetchall()
+            for row in rows:
+                if total <= self.max_size:
+                    break
+                evicted.append(row["url"])
+                total -= row["size"]
+            conn.executemany(
+                "DELETE FROM entries WHERE url = ?", [(url,) for url in evicted]
+            )
+            conn.execute(INCREMENT, ("evictions", len(evicted)))
+
+        for url in evicted:
+            self._path(url).unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Counters of the cache (see the counters table) together with the
+        number of entries and their size on disk.
+        """
+        with self.connection() as conn:
+            stats = {
+                name: 0
+                for name in ("hits", "misses", "hit_bytes", "stored_bytes", "evictions")
+            }
+            for row in conn.execute("SELECT name, value FROM counters"):
+                stats[row["name"]] = row["value"]
+            entries, size = conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM entries"
+            ).fetchone()
+        return stats | {"entries": entries, "size": size}
+
+
+def get_log_cache() -> Optional[LogCache]:
+    """
+    Returns:
+        The cache shared by workers on this node, None when it is disabled.
+    """
+    if LOG_CACHE_SIZE <= 0:
+        return None
+    return LogCache(LOG_CACHE_DIR, LOG_CACHE_SIZE)
+
+
+async def get_cached_log(url: str) -> Optional[tuple[bytes, Optional[str]]]:
+    """
+    Look the log up in the local cache, then in the shared one.
+
+    Returns:
+        Content and content type of the URL, None when it is not cached.
+    """
+    local = get_log_cache()
+    if local is not None:
+        cached = await asyncio.to_thread(local.get, url)
+        if cached is not None:
+            return cached
+
+    shared = get_shared_cache()
+    if shared is None:
+        return None
+    value = await asyncio.to_thread(shared.get, "log", url)
+    if value is None:
+        return None
+    content_type, _, content = value.partition(b"\n")
+    cached = content, content_type.decode("utf-8") or None
+    if local is not None:
+        await asyncio.to_thread(local.put, url, *cached)
+    return cached
+
+
+async def cache_log(url: str, content: bytes, content_type: Optional[str]) -> None:
+    """
+    Store the log in the local and shared cache.
+    """
+    local = get_log_cache()
+    if local is not None:
+        await asyncio.to_thread(local.put, url, content, content_type)
+    shared = get_shared_cache()
+    if shared is not None:
+        value = (content_type or "").encode("utf-8") + b"\n" + content
+        await asyncio.to_thread(shared.set, "log", url, value, SHARED_CACHE_LOG_TTL)
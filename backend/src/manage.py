@@ -0,0 +1,71 @@
+"""
+Maintenance commands for the persistent storage.
+
+Run them inside the website container:
+
+    python3 -m src.manage rebuild-index
+    python3 -m src.manage compress
+    python3 -m src.manage compact
+    python3 -m src.manage prune-rendered
+"""
+
+import argparse
+
+from src.constants import LOGGER_NAME, STORAGE_MODE
+from src.spells import get_logger
+from src.store import Storator3000
+
+LOGGER = get_logger(LOGGER_NAME)
+
+
+def rebuild_index(_args: argparse.Namespace) -> None:
+    """Recreate the annotation index from the feedback directory."""
+    count = Storator3000.rebuild_index()
+    LOGGER.info("Indexed %s annotations", count)
+
+
+def compress(_args: argparse.Namespace) -> None:
+    """Compress annotations, reviews and blobs stored uncompressed."""
+    count = Storator3000.compress_stored()
+    LOGGER.info("Compressed %s files", count)
+
+
+def compact(_args: argparse.Namespace) -> None:
+    """Move annotations stored as separate files into segments."""
+    if STORAGE_MODE != "segments":
+        LOGGER.info("Not compacting, annotations are stored as %s", STORAGE_MODE)
+        return
+    count = Storator3000.compact()
+    LOGGER.info("Moved %s annotations into segments", count)
+
+
+def prune_rendered(_args: argparse.Namespace) -> None:
+    """Delete review responses rendered from annotations."""
+    count = Storator3000.prune_rendered()
+    LOGGER.info("Deleted %s rendered reviews", count)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Maintenance of the persistent storage"
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    parser_rebuild = subparsers.add_parser("rebuild-index", help=rebuild_index.__doc__)
+    parser_rebuild.set_defaults(func=rebuild_index)
+
+    parser_compress = subparsers.add_parser("compress", help=compress.__doc__)
+    parser_compress.set_defaults(func=compress)
+
+    parser_compact = subparsers.add_parser("compact", help=compact.__doc__)
+    parser_compact.set_defaults(func=compact)
+
+    parser_prune = subparsers.add_parser("prune-rendered", help=prune_rendered.__doc__)
+    parser_prune.set_defaults(func=prune_rendered)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Metadata of finished builds remembered by a worker between requests.
+"""
+
+import time
+from typing import Any, Hashable
+
+from src.constants import METADATA_CACHE_SIZE, METADATA_CACHE_TTL
+
+
+class MetadataCache:
+    """
+    Records of finished builds and tasks don't change anymore, so they are
+    remembered for `ttl` seconds. The oldest ones are forgotten once there are
+    more than `size` of them.
+    """
+
+    def __init__(
+        self, ttl: float = METADATA_CACHE_TTL, size: int = METADATA_CACHE_SIZE
+    ) -> None:
+        self.ttl = ttl
+        self.size = size
+        # key -> (monotonic time of expiration, value)
+        self._entries: dict[Hashable, tuple[float, Any]] = {}
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns:
+            The remembered value, None when there is none.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.size:
+            del self._entries[next(iter(self._entries))]
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,153 @@
+"""
+Merging of reviews submitted from the frontend with the annotations they review.
+
+A submitted review is stored as it is first, which is quick and durable. Only
+then it is merged with the (possibly multi-megabyte) annotation into its parsed
+copy, in a thread pool so that the event loop is never blocked by it. The
+status of merging is recorded in the index, and merging of reviews left pending
+when a worker stopped is resumed on the next start. Merging which fails on the
+storage is retried a few times, and if it keeps failing the review is left
+pending for the next start, only reviews which can't be merged at all fail.
+"""
+
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+
+from src.constants import (
+    LOGGER_NAME,
+    REVIEW_MERGE_ATTEMPTS,
+    REVIEW_MERGE_LEASE,
+    REVIEW_WORKERS,
+)
+from src.exceptions import NoDataFound
+from src.schema import FeedbackLogSchema, FeedbackSchema, SnippetSchema
+from src.spells import get_logger
+from src.store import Storator3000
+
+LOGGER = get_logger(LOGGER_NAME)
+
+# errors of the storage which may go away, e.g. a locked database
+TRANSIENT_ERRORS = (OSError, sqlite3.OperationalError, httpx.HTTPError)
+
+
+def _get_text_from_feedback(item: dict) -> str:
+    if item["vote"] != 1:
+        return ""
+
+    return item["text"]
+
+
+def _parse_logs(
+    logs_orig: dict[str, FeedbackLogSchema], review_snippets: list[dict]
+) -> None:
+    for name, item in logs_orig.items():
+        item.snippets = [
+            SnippetSchema(
+                start_index=snippet["start_index"],
+                end_index=snippet["end_index"],
+                # named comment by the review page
+                user_comment=snippet.get("comment", snippet.get("user_comment", "")),
+                text=snippet.get("text"),
+            )
+            for snippet in review_snippets
+            if snippet["file"] == name and snippet["vote"] == 1
+        ]
+
+
+def _parse_feedback(review_d: dict, origin_id: str) -> dict:
+    original_content = Storator3000.get_by_id(origin_id)
+    if original_content is None:
+        raise NoDataFound(f"Original feedback file for ID {origin_id} not found")
+
+    schema = FeedbackSchema(**original_content)
+    schema.fail_reason = _get_text_from_feedback(review_d["fail_reason"])
+    schema.how_to_fix = _get_text_from_feedback(review_d["how_to_fix"])
+    _parse_logs(schema.logs, review_d["snippets"])
+    return schema.model_dump(exclude_unset=True)
+
+
+class ReviewProcessor:
+    # processor shared by all requests of this worker
+    _instance: Optional["ReviewProcessor"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, workers: int = REVIEW_WORKERS) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="review-processor"
+        )
+
+    @classmethod
+    def get(cls) -> "ReviewProcessor":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Finish merging of all submitted reviews and stop the shared processor.
+        """
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance._executor.shutdown(wait=True)
+                cls._instance = None
+
+    def submit(self, review_id: str) -> Future:
+        """
+        Merge a review stored by `Storator3000.store_review` with the
+        annotation it reviews, in the background.
+        """
+        return self._executor.submit(self._process, review_id)
+
+    def resume(self) -> None:
+        """
+        Merge all reviews which are still pending and not being merged by
+        another worker.
+        """
+        pending = Storator3000.get_index().lease_pending_reviews(
+            time.time(), REVIEW_MERGE_LEASE
+        )
+        if pending:
+            LOGGER.info("Resuming merging of %s reviews", len(pending))
+        for review_id in pending:
+            self.submit(review_id)
+
+    @classmethod
+    def _process(cls, review_id: str) -> None:
+        for attempt in range(1, REVIEW_MERGE_ATTEMPTS + 1):
+            try:
+                cls._merge(review_id)
+                return
+            except TRANSIENT_ERRORS as ex:
+                if attempt == REVIEW_MERGE_ATTEMPTS:
+                    # its lease expires and the next resume merges it
+                    LOGGER.exception(
+                        "Failed to merge review %s, leaving it pending", review_id
+                    )
+                    return
+                LOGGER.warning("Failed to merge review %s, retrying: %s", review_id, ex)
+                time.sleep(attempt)
+            except Exception:  # pylint: disable=broad-exception-caught
+                LOGGER.exception("Failed to merge review %s", review_id)
+                Storator3000.get_index().set_review_status(review_id, "failed")
+                return
+
+    @staticmethod
+    def _merge(review_id: str) -> None:
+        review = Storator3000.get_index().get_review(review_id)
+        if review is None or review["status"] != "pending":
+            return
+        content = Storator3000.get_review(review_id)
+        if content is None:
+            LOGGER.warning("Skipping review %s, it's not stored", review_id)
+            return
+        parsed_feedback = _parse_feedback(content, review["annotation_id"]) | {
+            "id": review["annotation_id"]
+        }
+        Storator3000.store_parsed_review(review_id, content, parsed_feedback)
@@ -54,6 +54,17 @@ class NameContentSchema(BaseModel):
     content: str
 
 
+class FetchedLogSchema(NameContentSchema):
+    """
+    Log fetched from a build system. Logs larger than LOG_MAX_SIZE contain only
+    their beginning and end.
+    """
+
+    # size of the log as served, in bytes
+    original_size: Optional[int] = None
+    truncated: bool = False
+
+
 class ContributeResponseSchema(BaseModel):
     """
     Data requested by frontend at the very beginning of review process. Those are
@@ -64,7 +75,7 @@ class ContributeResponseSchema(BaseModel):
     build_id: Optional[int]
     build_id_title: BuildIdTitleEnum
     build_url: AnyUrl
-    logs: list[NameContentSchema]
+    logs: list[FetchedLogSchema]
     spec_file: Optional[NameContentSchema] = None
     container_file: Optional[NameContentSchema] = None
 
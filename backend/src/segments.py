@@ -0,0 +1,131 @@
+"""
+Append-only segment files packing many records into one file.
+
+Storing every annotation as its own small file creates millions of inodes over
+time, which makes walking, archiving and syncing the storage slow. Segments
+hold records one after another, each prefixed by a small header, and records
+are addressed by the segment name, offset and length kept in the index.
+"""
+
+import fcntl
+import mmap
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# magic and length of the payload which follows
+HEADER = struct.Struct(">4sI")
+MAGIC = b"LDR1"
+SEGMENT_NAME_RE = re.compile(r"^segment-\d{6}\.seg$")
+
+
+class SegmentStore:
+    # read-only memory maps shared by all instances in this process
+    _maps: dict[Path, mmap.mmap] = {}
+    _maps_lock = threading.Lock()
+
+    def __init__(self, root: Path | str, max_size: int) -> None:
+        self.root = Path(root)
+        self.max_size = max_size
+
+    def segments(self) -> list[str]:
+        if not self.root.exists():
+            return []
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.root)
+            if SEGMENT_NAME_RE.match(entry.name)
+        )
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Serialize appends across all processes sharing the storage.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w", encoding="utf-8") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    def _writable_segment(self, payload_size: int) -> Path:
+        segments = self.segments()
+        if segments:
+            last = self.root / segments[-1]
+            if last.stat().st_size + HEADER.size + payload_size <= self.max_size:
+                return last
+            number = int(segments[-1].split("-")[1].split(".")[0]) + 1
+        else:
+            number = 1
+        return self.root / f"segment-{number:06}.seg"
+
+    def append(self, payloads: list[bytes]) -> list[tuple[str, int, int]]:
+        """
+        Durably append records, all of them to the same segment.
+
+        Returns:
+            (segment name, offset, length) of each payload, in the same order.
+        """
+        with self._locked():
+            path = self._writable_segment(sum(len(p) for p in payloads))
+            locations = []
+            with open(path, "ab") as segment_f:
+                offset = segment_f.tell()
+                for payload in payloads:
+                    segment_f.write(HEADER.pack(MAGIC, len(payload)))
+                    segment_f.write(payload)
+                    offset += HEADER.size
+                    locations.append((path.name, offset, len(payload)))
+                    offset += len(payload)
+                segment_f.flush()
+                os.fsync(segment_f.fileno())
+        return locations
+
+    def _map(self, path: Path, end: int) -> mmap.mmap:
+        with self._maps_lock:
+            mapped = self._maps.get(path)
+            # segments grow, map them again when the record is past our map
+            if mapped is None or len(mapped) < end:
+                with open(path, "rb") as segment_f:
+                    mapped = mmap.mmap(segment_f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[path] = mapped
+            return mapped
+
+    def read(self, segment: str, offset: int, length: int) -> bytes:
+        return self._map(self.root / segment, offset + length)[offset : offset + length]
+
+    def scan(self) -> Iterator[tuple[str, int, bytes]]:
+        """
+        Iterate over all records of all segments.
+
+        A record torn by a crash during append is skipped, the next one is
+        found by its magic.
+
+        Yields:
+            (segment name, offset, payload)
+        """
+        for segment in self.segments():
+            path = self.root / segment
+            if path.stat().st_size == 0:
+                continue
+            with (
+                open(path, "rb") as segment_f,
+                mmap.mmap(segment_f.fileno(), 0, access=mmap.ACCESS_READ) as data,
+            ):
+                position = 0
+                while position + HEADER.size <= len(data):
+                    magic, length = HEADER.unpack_from(data, position)
+                    start = position + HEADER.size
+                    if magic != MAGIC or start + length > len(data):
+                        position = data.find(MAGIC, position + 1)
+                        if position == -1:
+                            break
+                        continue
+                    yield segment, start, data[start : start + length]
+                    position = start + length
@@ -0,0 +1,238 @@
+"""
+Optional cache shared by all replicas of the website, in Redis.
+
+The local log cache (see src/logcache.py) is only shared by workers of one
+node, so with more replicas each of them fetches the same logs again and the
+hit rate drops. When SHARED_CACHE_URL is set, logs missing in the local cache,
+metadata of finished builds and explanations of their logs are looked up in
+a server speaking the Redis protocol (Redis, Valkey, KeyDB, ...) first.
+
+Values are gzip compressed, values larger than SHARED_CACHE_MAX_VALUE after
+compression are not cached and all of them expire. The website must work
+without the cache, so when the server can't be reached it is not tried again
+for SHARED_CACHE_RETRY seconds and everything is a miss meanwhile.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+from urllib.parse import urlparse
+
+from src.constants import (
+    LOGGER_NAME,
+    SHARED_CACHE_MAX_VALUE,
+    SHARED_CACHE_RETRY,
+    SHARED_CACHE_TIMEOUT,
+    SHARED_CACHE_URL,
+)
+
+# src.spells fetches through the cache, so its get_logger can't be used here
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+class RedisError(Exception):
+    """
+    Error reply of the server.
+    """
+
+
+class RedisConnection:
+    """
+    Minimal client of the Redis serialization protocol (RESP2), enough for
+    plain commands and their replies.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float) -> None:
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rb")
+
+    def close(self) -> None:
+        self.file.close()
+        self.sock.close()
+
+    def command(self, *args: str | bytes | int) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, int):
+                arg = str(arg)
+            if isinstance(arg, str):
+                arg = arg.encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(parts))
+        try:
+            return self._read_reply()
+        except ValueError as ex:
+            # e.g. a garbled length, the rest of the reply can't be read
+            raise RedisError(f"Unexpected reply: {ex}") from ex
+
+    def _read_reply(self) -> Any:
+        line = self.file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size == -1:
+                return None
+            data = self.file.read(size + 2)
+            if len(data) != size + 2:
+                raise ConnectionError("Connection closed by the server")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            if count == -1:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+
+class SharedCache:
+    # connections kept open for later requests of the same worker
+    MAX_IDLE_CONNECTIONS = 8
+
+    # caches shared by all threads of this worker, per URL
+    _instances: dict[str, "SharedCache"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = SHARED_CACHE_TIMEOUT,
+        max_value_size: int = SHARED_CACHE_MAX_VALUE,
+    ) -> None:
+        """
+        Args:
+            url: redis://[:password@]host[:port][/database]
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.max_value_size = max_value_size
+        self._idle: list[RedisConnection] = []
+        self._lock = threading.Lock()
+        # monotonic time until which the server is considered unavailable
+        self._unavailable_until = 0.0
+
+    @classmethod
+    def for_url(cls, url: str) -> "SharedCache":
+        with cls._instances_lock:
+            if url not in cls._instances:
+                cls._instances[url] = cls(url)
+            return cls._instances[url]
+
+    def _connect(self) -> RedisConnection:
+        conn = RedisConnection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                conn.command("AUTH", self.password)
+            if self.database:
+                conn.command("SELECT", self.database)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[RedisConnection]:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            yield conn
+        except BaseException:
+            # the state of the connection is unknown
+            conn.close()
+            raise
+        with self._lock:
+            if len(self._idle) < self.MAX_IDLE_CONNECTIONS:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _call(self, *args: str | bytes | int) -> Any:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            with self._connection() as conn:
+                return conn.command(*args)
+        except RedisError as ex:
+            # the connection was dropped, it may be in the middle of a reply
+            LOGGER.error("Shared cache command %s failed: %s", args[0], ex)
+        except OSError as ex:
+            LOGGER.warning(
+                "Shared cache %s:%s unavailable for %ss: %s",
+                self.host,
+                self.port,
+                SHARED_CACHE_RETRY,
+                ex,
+            )
+            self._unavailable_until = time.monotonic() + SHARED_CACHE_RETRY
+        return None
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        # URLs may be too long for keys
+        return f"logdetective:{namespace}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        """
+        Args:
+            namespace: log, metadata or explanation
+        """
+        data = self._call("GET", self._key(namespace, key))
+        if data is None:
+            return None
+        try:
+            return gzip.decompress(data)
+        except (OSError, EOFError):
+            LOGGER.error("Corrupted value of %s in shared cache", key)
+            return None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: int) -> None:
+        """
+        Cache the value for ttl seconds, unless it is too large.
+        """
+        data = gzip.compress(value, compresslevel=6)
+        if len(data) > self.max_value_size:
+            LOGGER.debug("Not caching %s, it is too large (%s B)", key, len(data))
+            return
+        self._call("SET", self._key(namespace, key), data, "EX", ttl)
+
+    def get_json(self, namespace: str, key: str) -> Any:
+        value = self.get(namespace, key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            LOGGER.error("Corrupted value of %s in shared cache", key)
+            return None
+
+    def set_json(self, namespace: str, key: str, value: Any, ttl: int) -> None:
+        self.set(namespace, key, json.dumps(value).encode("utf-8"), ttl)
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Returns:
+        The cache shared by all replicas, None when it is not configured.
+    """
+    if not SHARED_CACHE_URL:
+        return None
+    return SharedCache.for_url(SHARED_CACHE_URL)
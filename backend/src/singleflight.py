@@ -0,0 +1,79 @@
+"""
+Coalescing of identical concurrent fetches.
+
+A build link shared in a chat makes many people open it at once, and each of
+their requests used to download the same logs and call the same build system
+APIs. Concurrent calls with the same key now share one call in flight and its
+result. The shared call runs as its own task, so a waiter which gives up (e.g.
+the client disconnected) doesn't cancel it for the others. The memory it
+reserves (see src/budget.py) is reserved for every request sharing its
+result, each of them makes its own copies of it.
+"""
+
+import asyncio
+import copy
+from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from src.budget import count_reserved, reserve_memory
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await func(), unless a call with the same key is in flight already,
+        then await its result instead.
+        """
+        call = self._calls.get(key)
+        joined = call is not None
+        if call is None:
+            call = asyncio.ensure_future(count_reserved(func))
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._forget(key, call))
+        result, reserved = await asyncio.shield(call)
+        if joined:
+            await reserve_memory(reserved)
+        return result
+
+    def _forget(self, key: Hashable, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # nobody may be waiting for it anymore
+        if not call.cancelled():
+            call.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+# calls of provider methods and fetches of URLs in flight in this worker
+FLIGHTS = SingleFlight()
+
+
+def single_flight(
+    method: Callable[..., Awaitable[Any]],
+) -> Callable[..., Awaitable[Any]]:
+    """
+    Coalesce concurrent calls of a provider method with the same arguments on
+    providers with the same `flight_key`. Every caller gets its own copy of
+    the result, so that changing it doesn't affect the others.
+    """
+
+    @wraps(method)
+    async def inner(self, *args, **kwargs):
+        key = (
+            type(self).__name__,
+            method.__name__,
+            self.flight_key,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        result = await FLIGHTS.do(key, lambda: method(self, *args, **kwargs))
+        return copy.deepcopy(result)
+
+    return inner
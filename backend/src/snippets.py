@@ -0,0 +1,67 @@
+"""
+Reviewer-sized views of annotations.
+
+Reviewers only look at snippets, yet an annotation carries full contents of
+all its logs, often tens of megabytes. When an annotation is stored we
+precompute a window of whole lines around every snippet, so that a review page
+needs only these windows and its size depends on the number of snippets, not
+on the size of the logs. More of a log can be fetched by character offsets
+when the reviewer asks for it.
+"""
+
+
+def _window_start(content: str, index: int, lines: int) -> int:
+    start = content.rfind("\n", 0, index) + 1
+    for _ in range(lines):
+        if start == 0:
+            break
+        start = content.rfind("\n", 0, start - 1) + 1
+    return start
+
+
+def _window_end(content: str, index: int, lines: int) -> int:
+    end = content.find("\n", index)
+    for _ in range(lines):
+        if end == -1:
+            break
+        end = content.find("\n", end + 1)
+    return len(content) if end == -1 else end
+
+
+def snippet_window(content: str, start_index: int, end_index: int, lines: int) -> dict:
+    """
+    Lines of content with the snippet between start_index and end_index
+    (exclusive) and up to `lines` lines before and after it.
+
+    Returns:
+        {"start": ..., "end": ..., "text": content[start:end]}
+    """
+    start_index = max(0, min(start_index, len(content)))
+    end_index = max(start_index, min(end_index, len(content)))
+    start = _window_start(content, start_index, lines)
+    end = _window_end(content, max(start_index, end_index - 1), lines)
+    return {"start": start, "end": end, "text": content[start:end]}
+
+
+def review_payload(feedback: dict, lines: int) -> dict:
+    """
+    The annotation with full contents of logs replaced by their size and a
+    `context` window around every snippet, see `snippet_window`.
+    """
+    logs = {}
+    for name, log in feedback["logs"].items():
+        content = log.get("content", "")
+        logs[name] = {
+            "name": log.get("name", name),
+            "size": len(content),
+            "snippets": [
+                snippet
+                | {
+                    "context": snippet_window(
+                        content, snippet["start_index"], snippet["end_index"], lines
+                    )
+                }
+                for snippet in log.get("snippets", [])
+            ],
+        }
+    return feedback | {"logs": logs}
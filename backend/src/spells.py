@@ -2,15 +2,20 @@
 Some random spells and helpers for backend :magic:
 """
 
+import codecs
+import gzip
 import json
 import logging
 import os
 import shutil
 import tempfile
+from collections import deque
 from contextlib import contextmanager
+from dataclasses import dataclass
 from functools import lru_cache
+from http import HTTPStatus
 from pathlib import Path
-from typing import Any, Iterator, Optional
+from typing import Any, Iterator, Optional, TextIO
 
 import httpx
 import sentry_sdk
@@ -30,7 +35,17 @@ from src.log_cleaning import (
     html_careful_unescape,
     log_schema_redaction,
 )
-from src.constants import DEFAULT_ROBOTS, STATIC_SOURCE_DIR
+from src.constants import (
+    DEFAULT_ROBOTS,
+    LOG_MAX_SIZE,
+    LOG_TRUNCATED_HEAD,
+    LOG_TRUNCATED_TAIL,
+    STATIC_SOURCE_DIR,
+    STORAGE_COMPRESSION,
+)
+from src.budget import reserve_memory
+from src.logcache import cache_log, get_cached_log
+from src.singleflight import FLIGHTS
 
 
 @contextmanager
@@ -42,22 +57,6 @@ def get_temporary_dir() -> Iterator[Path]:
         shutil.rmtree(temp_dir)
 
 
-def find_file_by_name(name: str, path: Path) -> Optional[Path]:
-    """
-    Find file by name in the path.
-
-    Args:
-        name: Name of the file
-        path: Path where to search
-    """
-
-    for file in path.rglob(name):
-        if file.is_file():
-            return file
-
-    return None
-
-
 def get_logger(logger_name: str):
     """Initialize a logger for this server"""
     log = logging.getLogger(logger_name)
@@ -88,33 +87,67 @@ def start_sentry() -> bool:
     return False
 
 
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_compressed(path: Path | str) -> bool:
+    """
+    Check whether a file is gzip compressed, regardless of its name.
+    """
+    with open(path, "rb") as fp:
+        return fp.read(2) == GZIP_MAGIC
+
+
+def json_suffix() -> str:
+    """Suffix for newly stored JSON files, depending on STORAGE_COMPRESSION."""
+    return ".json.gz" if STORAGE_COMPRESSION == "gzip" else ".json"
+
+
+def _open_text(path: Path | str, write: bool = False) -> TextIO:
+    if write:
+        if str(path).endswith(".gz"):
+            return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        return open(path, "w", encoding="utf-8")
+
+    if is_compressed(path):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
 def read_json_file(path: Path | str) -> Any:
     """
     Read JSON file with consistent UTF-8 encoding.
 
+    Gzip compressed files are decompressed transparently.
+
     Args:
         path: Path to the JSON file
 
     Returns:
         Parsed JSON content
     """
-    with open(path, encoding="utf-8") as fp:
+    with _open_text(path) as fp:
         return json.load(fp)
 
 
-def write_json_file(path: Path | str, data: Any, indent: int = 4) -> None:
+def write_json_file(path: Path | str, data: Any, indent: Optional[int] = 4) -> None:
     """
     Write JSON file with consistent UTF-8 encoding.
 
     Uses ensure_ascii=False to preserve Unicode characters (like Czech diacritics)
     instead of escaping them to \\uXXXX sequences.
 
+    If the path ends with .gz, the file is gzip compressed and written without
+    indentation.
+
     Args:
         path: Path to the JSON file
         data: Data to serialize as JSON
         indent: Indentation level (default: 4)
     """
-    with open(path, "w", encoding="utf-8") as fp:
+    if str(path).endswith(".gz"):
+        indent = None
+    with _open_text(path, write=True) as fp:
         json.dump(data, fp, indent=indent, ensure_ascii=False)
 
 
@@ -122,33 +155,290 @@ def read_text_file(path: Path | str) -> str:
     """
     Read text file with consistent UTF-8 encoding.
 
+    Gzip compressed files are decompressed transparently.
+
     Args:
         path: Path to the text file
 
     Returns:
         File content as string
     """
-    with open(path, encoding="utf-8") as fp:
+    with _open_text(path) as fp:
         return fp.read()
 
 
-async def fetch_text(url: str, client: httpx.AsyncClient, **kwargs) -> httpx.Response:
+def write_text_file(path: Path | str, content: str) -> None:
+    """
+    Write text file with consistent UTF-8 encoding, gzip compressed if the path
+    ends with .gz.
+
+    Args:
+        path: Path to the text file
+        content: Text to write
+    """
+    with _open_text(path, write=True) as fp:
+        fp.write(content)
+
+
+def encode_text(path: Path | str, content: str) -> bytes:
+    """
+    Content of a text file as `write_text_file` would write it.
+    """
+    data = content.encode("utf-8")
+    if str(path).endswith(".gz"):
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def decode_text(data: bytes) -> str:
+    """
+    Inverse of `encode_text`, gzip compressed data is recognized by content.
+    """
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    return data.decode("utf-8")
+
+
+def encode_json(path: Path | str, data: Any) -> bytes:
+    """
+    Content of a JSON file as `write_json_file` would write it.
+    """
+    indent = None if str(path).endswith(".gz") else 4
+    return encode_text(path, json.dumps(data, indent=indent, ensure_ascii=False))
+
+
+def compress_file(path: Path) -> Path:
+    """
+    Replace a file with its gzip compressed version with .gz suffix.
+
+    Returns:
+        Path to the compressed file.
+    """
+    compressed_path = path.with_name(f"{path.name}.gz")
+    tmp_path = path.with_name(f".tmp-{compressed_path.name}")
+    with open(path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, compressed_path)
+    path.unlink()
+    return compressed_path
+
+
+async def fetch_text(
+    url: str, client: httpx.AsyncClient, immutable: bool = False, **kwargs
+) -> httpx.Response:
     """
     Fetch text content from URL with consistent UTF-8 encoding.
 
     Args:
         url: The URL to fetch
+        immutable: Content of the URL never changes once it exists (e.g. logs
+            of finished builds), so it can be served from the log cache and
+            concurrent fetches of the URL share one download
         **kwargs: Additional arguments passed to AsyncClient.get()
 
     Returns:
         httpx.Response with encoding set to UTF-8
     """
+    if immutable:
+        return await FLIGHTS.do(
+            ("fetch_text", url, tuple(sorted(kwargs.items()))),
+            lambda: _fetch_immutable_text(url, client, **kwargs),
+        )
+
+    response = await client.get(url, **kwargs)
+    response.encoding = "utf-8"
+    return response
+
+
+async def _fetch_immutable_text(
+    url: str, client: httpx.AsyncClient, **kwargs
+) -> httpx.Response:
+    cached = await get_cached_log(url)
+    if cached is not None:
+        content, content_type = cached
+        await reserve_memory(min(len(content), LOG_MAX_SIZE))
+        response = httpx.Response(
+            HTTPStatus.OK,
+            content=content,
+            headers={"Content-Type": content_type} if content_type else None,
+            request=httpx.Request("GET", url),
+        )
+        response.encoding = "utf-8"
+        return response
 
     response = await client.get(url, **kwargs)
     response.encoding = "utf-8"
+    if response.status_code == HTTPStatus.OK:
+        await cache_log(url, response.content, response.headers.get("Content-Type"))
     return response
 
 
+TRUNCATION_MARKER = "[... {} bytes of this log were truncated by Log Detective ...]\n"
+# memory for logs of unknown size is reserved in steps of this many bytes
+LOG_RESERVATION_STEP = 1024 * 1024
+
+
+class HeadTailText:
+    """
+    Text decoded incrementally from a stream of bytes. Once there are more
+    than `max_size` bytes, only the first `head` and the last `tail`
+    characters are kept.
+    """
+
+    def __init__(self, max_size: int, head: int, tail: int) -> None:
+        self.max_size = max_size
+        self.head_size = head
+        self.tail_size = tail
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # bytes fed so far
+        self.size = 0
+        self.truncated = False
+        self._head: list[str] = []
+        self._head_length = 0
+        self._rest: deque[str] = deque()
+        self._rest_length = 0
+        # the character right before the rest, once its beginning was dropped
+        self._before_rest: Optional[str] = None
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        self.size += len(data)
+        text = self._decoder.decode(data, final)
+        if self._head_length < self.head_size:
+            part = text[: self.head_size - self._head_length]
+            self._head.append(part)
+            self._head_length += len(part)
+            text = text[len(part) :]
+        if text:
+            self._rest.append(text)
+            self._rest_length += len(text)
+
+        if self.size > self.max_size:
+            self.truncated = True
+        if self.truncated:
+            while (
+                self._rest and self._rest_length - len(self._rest[0]) >= self.tail_size
+            ):
+                dropped = self._rest.popleft()
+                self._rest_length -= len(dropped)
+                self._before_rest = dropped[-1:]
+
+    def text(self) -> str:
+        head = "".join(self._head)
+        rest = "".join(self._rest)
+        if not self.truncated:
+            return head + rest
+
+        # whole lines only
+        start = max(len(rest) - self.tail_size, 0)
+        if start:
+            before = rest[start - 1]
+        elif self._before_rest is not None:
+            before = self._before_rest
+        else:
+            before = head[-1:]
+        tail = rest[start:]
+        if before != "\n":
+            tail = tail[tail.find("\n") + 1 :]
+        head = head[: head.rfind("\n") + 1]
+        skipped = self.size - len(head.encode("utf-8")) - len(tail.encode("utf-8"))
+        return head + TRUNCATION_MARKER.format(skipped) + tail
+
+
+@dataclass
+class FetchedLog:
+    """
+    Log fetched by `fetch_log`. The content is empty when the response is not
+    successful.
+    """
+
+    response: httpx.Response
+    content: str = ""
+    original_size: int = 0
+    truncated: bool = False
+
+    def as_dict(self, name: str) -> dict[str, Any]:
+        return {
+            "name": name,
+            "content": self.content,
+            "original_size": self.original_size,
+            "truncated": self.truncated,
+        }
+
+
+async def fetch_log(
+    url: str, client: httpx.AsyncClient, immutable: bool = False, **kwargs
+) -> FetchedLog:
+    """
+    Stream a log from URL and decode it as UTF-8 as it comes, so that a huge
+    log never takes more than LOG_MAX_SIZE bytes of memory. Larger logs are
+    truncated to their head and tail (see `HeadTailText`).
+
+    Args:
+        url: The URL to fetch
+        immutable: The same as for `fetch_text`, logs which have to be
+            truncated are not cached though
+        **kwargs: Additional arguments passed to AsyncClient.stream()
+    """
+    if immutable:
+        return await FLIGHTS.do(
+            ("fetch_log", url, tuple(sorted(kwargs.items()))),
+            lambda: _fetch_log(url, client, immutable=True, **kwargs),
+        )
+    return await _fetch_log(url, client, **kwargs)
+
+
+async def _fetch_log(
+    url: str, client: httpx.AsyncClient, immutable: bool = False, **kwargs
+) -> FetchedLog:
+    text = HeadTailText(LOG_MAX_SIZE, LOG_TRUNCATED_HEAD, LOG_TRUNCATED_TAIL)
+    cached = await get_cached_log(url) if immutable else None
+    if cached is not None:
+        data, content_type = cached
+        await reserve_memory(min(len(data), LOG_MAX_SIZE))
+        response = httpx.Response(
+            HTTPStatus.OK,
+            headers={"Content-Type": content_type} if content_type else None,
+            request=httpx.Request("GET", url),
+        )
+        text.feed(data, final=True)
+        return FetchedLog(response, text.text(), text.size, text.truncated)
+
+    async with client.stream("GET", url, **kwargs) as response:
+        if not response.is_success:
+            return FetchedLog(response)
+        reserved = _expected_log_size(response)
+        await reserve_memory(reserved)
+        async for chunk in response.aiter_bytes():
+            text.feed(chunk)
+            if text.size > reserved and reserved < LOG_MAX_SIZE:
+                # the size wasn't known ahead, reserve it as the log comes
+                step = min(
+                    max(text.size - reserved, LOG_RESERVATION_STEP),
+                    LOG_MAX_SIZE - reserved,
+                )
+                await reserve_memory(step)
+                reserved += step
+        text.feed(b"", final=True)
+
+    content = text.text()
+    if immutable and not text.truncated:
+        await cache_log(
+            url, content.encode("utf-8"), response.headers.get("Content-Type")
+        )
+    return FetchedLog(response, content, text.size, text.truncated)
+
+
+def _expected_log_size(response: httpx.Response) -> int:
+    """
+    How many bytes of memory a log takes at most, known from its headers, or
+    0 if they don't tell, e.g. for compressed logs.
+    """
+    length = response.headers.get("Content-Length", "")
+    if not length.isdigit() or "Content-Encoding" in response.headers:
+        return 0
+    return min(int(length), LOG_MAX_SIZE)
+
+
 def ensure_text(content: str | bytes) -> str:
     """
     Ensure content is a UTF-8 decoded string.
@@ -0,0 +1,161 @@
+"""
+Reading of spec files from source RPMs.
+
+Extracting the whole payload of an SRPM with rpm2archive and tar to find the
+spec file wrote hundreds of megabytes for packages like kernel or chromium.
+This reader walks the RPM headers and the compressed cpio payload and stops at
+the first spec file, the rest of the payload is never decompressed to disk or
+kept in memory. Payloads it can't read raise UnsupportedSRPM, so that the
+caller can fall back to rpm2archive.
+"""
+
+import bz2
+import lzma
+import struct
+import zlib
+from typing import BinaryIO, Optional
+
+import zstandard
+
+RPM_LEAD_MAGIC = b"\xed\xab\xee\xdb"
+RPM_LEAD_SIZE = 96
+RPM_HEADER_MAGIC = b"\x8e\xad\xe8\x01"
+RPMTAG_PAYLOADFORMAT = 1124
+RPMTAG_PAYLOADCOMPRESSOR = 1125
+RPM_STRING_TYPE = 6
+
+CPIO_MAGICS = (b"070701", b"070702")
+CPIO_HEADER_SIZE = 110
+CPIO_TRAILER = "TRAILER!!!"
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UnsupportedSRPM(Exception):
+    """
+    The file isn't an SRPM this reader understands.
+    """
+
+
+def _decompressor(compressor: str):
+    if compressor == "gzip":
+        # gzip header, possibly followed by more members
+        return zlib.decompressobj(zlib.MAX_WBITS | 32)
+    if compressor == "bzip2":
+        return bz2.BZ2Decompressor()
+    if compressor in ("xz", "lzma"):
+        return lzma.LZMADecompressor()
+    if compressor == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise UnsupportedSRPM(f"Unsupported payload compressor {compressor}")
+
+
+class _Payload:
+    """
+    Decompressed payload read in exact sizes, without reading ahead more than
+    a chunk of the compressed file.
+    """
+
+    def __init__(self, fp: BinaryIO, compressor: str) -> None:
+        self.fp = fp
+        self.decompressor = _decompressor(compressor)
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            chunk = self.fp.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise UnsupportedSRPM("Truncated payload")
+            try:
+                self.buffer += self.decompressor.decompress(chunk)
+            except Exception as ex:
+                raise UnsupportedSRPM(f"Corrupted payload: {ex}") from ex
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.offset += size
+        return data
+
+    def skip(self, size: int) -> None:
+        while size:
+            step = min(size, READ_CHUNK_SIZE)
+            self.read(step)
+            size -= step
+
+    def align(self, alignment: int = 4) -> None:
+        self.skip(-self.offset % alignment)
+
+
+def _read_exactly(fp: BinaryIO, size: int) -> bytes:
+    data = fp.read(size)
+    if len(data) != size:
+        raise UnsupportedSRPM("Truncated header")
+    return data
+
+
+def _read_header(fp: BinaryIO) -> dict[int, str]:
+    """
+    Read an RPM header and return its string tags.
+    """
+    magic, _, count, size = struct.unpack(">4s4sII", _read_exactly(fp, 16))
+    if magic != RPM_HEADER_MAGIC:
+        raise UnsupportedSRPM("Bad header magic")
+    index = _read_exactly(fp, 16 * count)
+    store = _read_exactly(fp, size)
+
+    tags = {}
+    for position in range(0, len(index), 16):
+        tag, type_, offset, _ = struct.unpack(">IIiI", index[position : position + 16])
+        if type_ == RPM_STRING_TYPE and 0 <= offset < size:
+            end = store.find(b"\0", offset)
+            tags[tag] = store[offset:end].decode("utf-8", errors="replace")
+    return tags
+
+
+def read_spec_file(fp: BinaryIO) -> Optional[tuple[str, str]]:
+    """
+    Read the first spec file out of an SRPM.
+
+    Args:
+        fp: The SRPM opened in binary mode
+
+    Returns:
+        Name and content of the spec file, or None if there's no spec file
+
+    Raises:
+        UnsupportedSRPM: The SRPM can't be read in-process
+    """
+    lead = _read_exactly(fp, RPM_LEAD_SIZE)
+    if not lead.startswith(RPM_LEAD_MAGIC):
+        raise UnsupportedSRPM("Not an RPM")
+    # the signature header is padded to 8 bytes
+    signature_start = fp.tell()
+    _read_header(fp)
+    _read_exactly(fp, -(fp.tell() - signature_start) % 8)
+    tags = _read_header(fp)
+    if tags.get(RPMTAG_PAYLOADFORMAT, "cpio") != "cpio":
+        raise UnsupportedSRPM(
+            f"Unsupported payload format {tags[RPMTAG_PAYLOADFORMAT]}"
+        )
+
+    payload = _Payload(fp, tags.get(RPMTAG_PAYLOADCOMPRESSOR, "gzip"))
+    while True:
+        header = payload.read(CPIO_HEADER_SIZE)
+        if header[:6] not in CPIO_MAGICS:
+            # e.g. the stripped cpio format of payloads with files over 4 GiB
+            raise UnsupportedSRPM("Unsupported cpio format")
+        try:
+            fields = [int(header[i : i + 8], 16) for i in range(6, CPIO_HEADER_SIZE, 8)]
+        except ValueError as ex:
+            raise UnsupportedSRPM("Corrupted cpio header") from ex
+        file_size, name_size = fields[6], fields[11]
+        name = payload.read(name_size).rstrip(b"\0").decode("utf-8", errors="replace")
+        payload.align()
+        if name == CPIO_TRAILER:
+            return None
+        name = name.removeprefix("./")
+        if name.endswith(".spec"):
+            content = payload.read(file_size)
+            return name.rsplit("/", 1)[-1], content.decode("utf-8", errors="replace")
+        payload.skip(file_size)
+        payload.align()
@@ -1,20 +1,70 @@
+import gzip
+import json
 import os
-import random
+import sqlite3
+import time
 from datetime import datetime
 from pathlib import Path
 from itertools import chain
 import uuid
+from typing import Iterable, Iterator, Optional
 
-from src.constants import FEEDBACK_DIR, ProvidersEnum
+from src.backends import FilesystemBackend, S3Backend, SQLiteBackend, StorageBackend
+from src.blobs import BlobStore
+from src.constants import (
+    BLOBS_DIR,
+    FEEDBACK_DIR,
+    INDEX_DB,
+    LOGGER_NAME,
+    REVIEW_LEASE,
+    REVIEW_MERGE_LEASE,
+    RENDERED_DIR,
+    REVIEWS_DIR,
+    S3_ACCESS_KEY_ID,
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_REGION,
+    S3_SECRET_ACCESS_KEY,
+    SEGMENT_MAX_SIZE,
+    SEGMENTS_DIR,
+    SNIPPET_CONTEXT_LINES,
+    STATS_CACHE_TTL,
+    STORAGE_BACKEND,
+    STORAGE_DB,
+    STORAGE_MODE,
+    ProvidersEnum,
+)
 from src.exceptions import NoDataFound
+from src.index import AnnotationIndex
 from src.schema import FeedbackSchema
-from src.spells import write_json_file
+from src.segments import SegmentStore
+from src.snippets import review_payload
+from src.spells import (
+    GZIP_MAGIC,
+    decode_text,
+    encode_json,
+    get_logger,
+    json_suffix,
+)
+from src.writer import GroupCommitWriter
+
+LOGGER = get_logger(LOGGER_NAME)
+
+# stored with annotations in segments, to be able to rebuild the index
+PACKED_METADATA = ("id", "provider", "build_id", "chroot", "package", "date")
+EXPORTED_COLUMNS = ("seq", *PACKED_METADATA, "reviews")
 
 
 class Storator3000:
-    def __init__(self, provider: ProvidersEnum, id_: str) -> None:
+    # (monotonic time when computed, stats) shared by the whole worker
+    _stats_cache: Optional[tuple[float, dict]] = None
+
+    def __init__(
+        self, provider: ProvidersEnum, id_: str, chroot: Optional[str] = None
+    ) -> None:
         self.provider = provider
         self.id_ = id_
+        self.chroot = chroot
         self.store_to = Path(FEEDBACK_DIR) / str(datetime.now().date())
 
     @property
@@ -36,14 +86,221 @@ class Storator3000:
         return self.target_dir / id_
 
     def store(self, feedback_result: FeedbackSchema) -> uuid.UUID:
-        self.build_dir.mkdir(parents=True, exist_ok=True)
-
         contribution_id = uuid.uuid4()
-        file_name = f"{self.build_dir}/{contribution_id}.json"
-        feedback_result_dict = feedback_result.model_dump(exclude_unset=True)
-        write_json_file(file_name, feedback_result_dict)
+        # before the contents of logs are moved away by extract_blobs
+        payload = review_payload(feedback_result.model_dump(), SNIPPET_CONTEXT_LINES)
+        feedback_result_dict = self.extract_blobs(
+            feedback_result.model_dump(exclude_unset=True)
+        )
+        if STORAGE_MODE == "segments":
+            record = self._store_to_segment(str(contribution_id), feedback_result_dict)
+        else:
+            record = self._store_to_file(str(contribution_id), feedback_result_dict)
+
+        self.get_index().add(record)
+        self.get_index().set_review_payload(str(contribution_id), json.dumps(payload))
+        Storator3000._stats_cache = None
         return contribution_id
 
+    def _store_to_file(self, contribution_id: str, feedback: dict) -> dict:
+        key = (self.build_dir / f"{contribution_id}{json_suffix()}").relative_to(
+            FEEDBACK_DIR
+        )
+        data = encode_json(key, feedback)
+        self.get_backend("results").put(key.as_posix(), data)
+        return self._index_record(key.as_posix(), len(data)) | {
+            "chroot": self.chroot,
+            "package": self.package(feedback),
+        }
+
+    def _store_to_segment(self, contribution_id: str, feedback: dict) -> dict:
+        record = {
+            "id": contribution_id,
+            "provider": self.provider,
+            "build_id": str(self.build_dir.relative_to(self.target_dir)),
+            "chroot": self.chroot,
+            "package": self.package(feedback),
+            "date": self.store_to.name,
+            "reviews": 0,
+        }
+        ((segment, offset, size),) = (
+            GroupCommitWriter.get()
+            .append_records(self.get_segments(), [self._pack(record, feedback)])
+            .result()
+        )
+        return record | {"path": segment, "segment_offset": offset, "size": size}
+
+    @staticmethod
+    def _pack(record: dict, feedback: dict) -> bytes:
+        """
+        Serialize an annotation for a segment, together with its metadata
+        so that the index can be rebuilt from segments.
+        """
+        packed = {key: record[key] for key in PACKED_METADATA}
+        packed["annotation"] = feedback
+        return gzip.compress(json.dumps(packed, ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def _unpack(payload: bytes) -> dict:
+        return json.loads(gzip.decompress(payload))
+
+    @staticmethod
+    def package(feedback: dict) -> Optional[str]:
+        """
+        Name of the package the annotation is for, from its spec file.
+        """
+        spec_file = feedback.get("spec_file")
+        if not spec_file or not spec_file.get("name"):
+            return None
+        return Path(spec_file["name"]).name.removesuffix(".spec")
+
+    @staticmethod
+    def result_id(path: Path) -> str:
+        """
+        ID of a stored annotation or review from its file name.
+        """
+        return path.name.split(".")[0]
+
+    @staticmethod
+    def get_index() -> AnnotationIndex:
+        return AnnotationIndex(INDEX_DB)
+
+    @staticmethod
+    def get_backend(namespace: str) -> StorageBackend:
+        """
+        Args:
+            namespace: results, reviews, blobs or rendered
+        """
+        if STORAGE_BACKEND == "filesystem":
+            directories = {
+                "results": FEEDBACK_DIR,
+                "reviews": REVIEWS_DIR,
+                "blobs": BLOBS_DIR,
+                "rendered": RENDERED_DIR,
+            }
+            return FilesystemBackend(directories[namespace])
+        if STORAGE_BACKEND == "sqlite":
+            return SQLiteBackend(STORAGE_DB, namespace)
+        if STORAGE_BACKEND == "s3":
+            return S3Backend(
+                S3_ENDPOINT_URL,
+                S3_BUCKET,
+                namespace,
+                S3_ACCESS_KEY_ID,
+                S3_SECRET_ACCESS_KEY,
+                S3_REGION,
+            )
+        raise ValueError(f"Unknown storage backend {STORAGE_BACKEND}")
+
+    @classmethod
+    def get_blobs(cls) -> BlobStore:
+        return BlobStore(cls.get_backend("blobs"))
+
+    @classmethod
+    def get_rendered(cls) -> BlobStore:
+        return BlobStore(cls.get_backend("rendered"))
+
+    @staticmethod
+    def get_segments() -> SegmentStore:
+        return SegmentStore(SEGMENTS_DIR, SEGMENT_MAX_SIZE)
+
+    @staticmethod
+    def _files_with_content(feedback: dict) -> list[dict]:
+        """
+        All parts of an annotation which have a (possibly large) content.
+        """
+        files = list(feedback.get("logs", {}).values())
+        for key in ("spec_file", "container_file"):
+            if feedback.get(key):
+                files.append(feedback[key])
+        return files
+
+    @classmethod
+    def extract_blobs(cls, feedback: dict) -> dict:
+        """
+        Move contents of logs and spec/container files into the blob store
+        and reference them by their hash instead.
+        """
+        files = cls._files_with_content(feedback)
+        digests = cls.get_blobs().put_many([file.pop("content") for file in files])
+        for file, digest in zip(files, digests):
+            file["content_sha256"] = digest
+        return feedback
+
+    @classmethod
+    def inline_blobs(cls, feedback: dict) -> dict:
+        """
+        Inverse of `extract_blobs`, files without a reference are left
+        untouched since they were stored before blobs existed.
+        """
+        blobs = cls.get_blobs()
+        for file in cls._files_with_content(feedback):
+            if "content_sha256" in file:
+                file["content"] = blobs.get(file.pop("content_sha256"))
+        return feedback
+
+    @classmethod
+    def _read(cls, record: sqlite3.Row) -> dict:
+        """
+        Read an indexed annotation including full contents of all its files.
+        """
+        return cls.inline_blobs(cls._read_stored(record))
+
+    @classmethod
+    def _read_stored(cls, record: sqlite3.Row) -> dict:
+        """
+        Read an indexed annotation as it is stored, contents of files being
+        referenced by their hash.
+        """
+        if record["segment_offset"] is None:
+            try:
+                data = cls.get_backend("results").get(record["path"])
+            except FileNotFoundError:
+                # moved into a segment by `compact` since the record was read
+                current = cls.get_index().get(record["id"])
+                if current is None or current["segment_offset"] is None:
+                    raise
+                return cls._read_stored(current)
+            return json.loads(decode_text(data))
+        payload = cls.get_segments().read(
+            record["path"], record["segment_offset"], record["size"]
+        )
+        return cls._unpack(payload)["annotation"]
+
+    @staticmethod
+    def _review_record(key: str, parsed: bool) -> dict:
+        """
+        Describe a stored review for the index, it is stored as
+        <annotation id>-<timestamp>.json[.gz]
+        """
+        review_id = Storator3000.result_id(Path(key))
+        return {
+            "id": review_id,
+            "annotation_id": review_id.rsplit("-", 1)[0],
+            "key": key,
+            "status": "parsed" if parsed else "pending",
+        }
+
+    @staticmethod
+    def _index_record(key: str, size: int, reviews: int = 0) -> dict:
+        """
+        Describe a stored annotation for the index. Everything but the size
+        is encoded in its key: <date>/<provider>/<build id>/<id>.json[.gz]
+        """
+        date, provider, *build_id, _ = key.split("/")
+        return {
+            "id": Storator3000.result_id(Path(key)),
+            "path": key,
+            "provider": provider,
+            "build_id": "/".join(build_id),
+            "date": date,
+            "size": size,
+            "reviews": reviews,
+            "segment_offset": None,
+            "chroot": None,
+            "package": None,
+        }
+
     @classmethod
     def get_logs(cls) -> list:
         if not os.path.exists(FEEDBACK_DIR):
@@ -56,36 +313,551 @@ class Storator3000:
         # MyPy has an issue with this usage of chain.
         all_files = list(chain.from_iterable(all_files))  # type: ignore
 
-        all_files = [x for x in all_files if x.endswith(".json")]  # type: ignore
+        all_files = [
+            x
+            for x in all_files
+            if x.endswith((".json", ".json.gz"))  # type: ignore
+        ]
 
         if not all_files:
             raise NoDataFound(f"Results directory {FEEDBACK_DIR} is empty")
         return all_files
 
     @classmethod
-    def get_random(cls) -> Path:
-        # TODO: instead of random, we should go from oldest to newest?
-        #  and deprioritize those with reviews
-        files = cls.get_logs()
+    def rebuild_index(cls) -> int:
+        """
+        Recreate the index from the annotations and reviews stored on disk.
 
-        return Path(random.choice(files))
+        Returns:
+            Number of indexed annotations.
+        """
+        keys = {
+            key
+            for key, _ in cls.get_backend("reviews").list()
+            if key.endswith((".json", ".json.gz"))
+        }
+        backend = cls.get_backend("reviews")
+        reviews = []
+        # parsed copies of reviews are in parsed/
+        for key in sorted(key for key in keys if "/" not in key):
+            try:
+                votes = cls._votes(json.loads(decode_text(backend.get(key))))
+            except (OSError, ValueError, KeyError, TypeError):
+                LOGGER.error("Can't read votes of review %s", key)
+                votes = []
+            reviews.append(
+                cls._review_record(key, parsed=f"parsed/{key}" in keys)
+                | {"votes": votes}
+            )
+
+        records: dict[str, dict] = {}
+        # an annotation may be in a segment and still in its file when
+        # compaction was interrupted, both are the same so prefer the segment
+        for segment, offset, payload in cls.get_segments().scan():
+            try:
+                packed = cls._unpack(payload)
+            except (OSError, ValueError):
+                LOGGER.error("Skipping unreadable record %s:%s", segment, offset)
+                continue
+            records[packed["id"]] = {
+                "id": packed["id"],
+                "path": segment,
+                "provider": packed["provider"],
+                "build_id": packed["build_id"],
+                # segments written before these were indexed lack them
+                "chroot": packed.get("chroot"),
+                "package": packed.get("package", cls.package(packed["annotation"])),
+                "date": packed["date"],
+                "size": len(payload),
+                "reviews": 0,
+                "segment_offset": offset,
+            }
+
+        results = cls.get_backend("results")
+        for key, size in results.list():
+            if not key.endswith((".json", ".json.gz")):
+                continue
+            result_id = cls.result_id(Path(key))
+            if result_id in records:
+                continue
+            # the package is not in the path, only in the annotation itself,
+            # and the chroot of annotations stored as files is not kept at all
+            try:
+                package = cls.package(json.loads(decode_text(results.get(key))))
+            except (OSError, ValueError):
+                LOGGER.error("Can't read package of %s", key)
+                package = None
+            records[result_id] = cls._index_record(key, size) | {"package": package}
+
+        cls._stats_cache = None
+        # keep the order of submission, at least by days
+        return cls.get_index().rebuild(
+            sorted(records.values(), key=lambda record: record["date"]), reviews
+        )
 
     @classmethod
-    def get_by_id(cls, result_id: str) -> Path | None:
+    def compact(cls, batch_size: int = 100) -> int:
+        """
+        Move annotations stored as separate files into segments.
+
+        Returns:
+            Number of moved annotations.
+
+        Raises:
+            ValueError: when the annotations are not stored on the filesystem,
+                segments are always local
+        """
+        if STORAGE_BACKEND != "filesystem":
+            raise ValueError(
+                f"Can't compact annotations stored by the {STORAGE_BACKEND} backend"
+            )
+        index = cls.get_index()
+        segments = cls.get_segments()
+        results = cls.get_backend("results")
+        count = 0
+        last_seq = 0
+        while batch := index.unpacked(after=last_seq, limit=batch_size):
+            last_seq = batch[-1]["seq"]
+            payloads, records = [], []
+            for record in batch:
+                try:
+                    feedback = json.loads(decode_text(results.get(record["path"])))
+                except OSError as ex:
+                    LOGGER.error("Can't compact %s: %s", record["id"], ex)
+                    continue
+                payloads.append(cls._pack(dict(record), feedback))
+                records.append(record)
+
+            # the annotation must be safely in a segment before we point the
+            # index there, and the index must point there before the file
+            # is removed
+            locations = segments.append(payloads) if payloads else []
+            for record, (segment, offset, size) in zip(records, locations):
+                index.relocate(record["id"], segment, offset, size)
+                results.delete(record["path"])
+            count += len(locations)
+
+        # new annotations may be just stored to today's directory
+        results.prune(keep_prefix=str(datetime.now().date()))
+        return count
+
+    @classmethod
+    def compress_stored(cls) -> int:
+        """
+        Compress annotations, reviews and blobs stored uncompressed, and update
+        the index to point to the compressed files.
+
+        Returns:
+            Number of compressed files.
+        """
+        count = 0
+        for namespace in ("results", "reviews", "blobs"):
+            backend = cls.get_backend(namespace)
+            # materialize the list, we are going to add objects to the backend
+            for key, _ in list(backend.list()):
+                if key.endswith(".gz") or not cls._compressible(namespace, key):
+                    continue
+                data = backend.get(key)
+                if data.startswith(GZIP_MAGIC):
+                    continue
+                # the compressed object must be stored before the original is
+                # deleted, readers look for both
+                backend.put(f"{key}.gz", gzip.compress(data, compresslevel=6))
+                backend.delete(key)
+                count += 1
+
+        cls.rebuild_index()
+        return count
+
+    @staticmethod
+    def _compressible(namespace: str, key: str) -> bool:
+        if namespace == "blobs":
+            # <first two characters of the digest>/<digest>
+            return "/" in key
+        return key.endswith(".json")
+
+    @classmethod
+    def ensure_index(cls) -> None:
+        """
+        Build the index if this deployment has none yet. Only one of the
+        workers starting together builds it, the others wait for it.
+        """
+        index = cls.get_index()
+        with index.locked():
+            # indexes created before counters were introduced have none
+            if not index.exists() or "total" not in index.counters():
+                cls.rebuild_index()
+
+    @classmethod
+    def store_review(cls, result_id: str, review_id: str, review: dict) -> None:
+        """
+        Durably store a review as submitted. The annotation it reviews updated
+        by it is stored later by `store_parsed_review`.
+
+        Raises:
+            NoDataFound: when there is no result with the ID
+        """
+        if cls.get_index().get(result_id) is None:
+            raise NoDataFound(f"Original feedback file for ID {result_id} not found")
+
+        key = f"{review_id}{json_suffix()}"
+        cls.get_backend("reviews").put(key, encode_json(key, review))
+        # leased to this worker, which merges it right away (see
+        # ReviewProcessor.submit), so that no other worker resumes it
+        cls.get_index().add_review(
+            result_id, review_id, key, lease_until=time.time() + REVIEW_MERGE_LEASE
+        )
+
+    @classmethod
+    def store_parsed_review(
+        cls, review_id: str, review: dict, parsed_review: dict
+    ) -> None:
+        """
+        Store the annotation updated by a review stored by `store_review` and
+        count the review with its votes.
+
+        Raises:
+            NoDataFound: when there is no review with the ID
+        """
+        index = cls.get_index()
+        record = index.get_review(review_id)
+        if record is None:
+            raise NoDataFound(f"No review with ID {review_id}")
+
+        key = f"parsed/{record['key']}"
+        parsed_review = cls.extract_blobs(parsed_review)
+        cls.get_backend("reviews").put(key, encode_json(key, parsed_review))
+        index.set_review_parsed(review_id, cls._votes(review))
+        cls._stats_cache = None
+
+    @classmethod
+    def get_review(cls, review_id: str) -> Optional[dict]:
+        """
+        Return a review as it was submitted, or None if it's not stored.
+        """
+        review = cls.get_index().get_review(review_id)
+        if review is None:
+            return None
+        try:
+            data = cls.get_backend("reviews").get(review["key"])
+        except FileNotFoundError:
+            return None
+        return json.loads(decode_text(data))
+
+    @classmethod
+    def add_review(
+        cls,
+        result_id: str,
+        key: str,
+        votes: Iterable[tuple[str, str, int, int, int]] = (),
+    ) -> None:
+        """
+        Record a review of the result stored under the key, which is already
+        merged with it, in the index together with its votes (see `_votes`).
+        """
+        cls.get_index().add_review(
+            result_id, cls.result_id(Path(key)), key, votes, status="parsed"
+        )
+        cls._stats_cache = None
+
+    @staticmethod
+    def _votes(review: dict) -> list[tuple[str, str, int, int, int]]:
+        """
+        Votes of a review as submitted from the frontend, as
+        (field, file, start index, end index, vote). Fields nobody voted
+        on (vote 0) are left out.
+        """
+        votes = []
+        for field in ("fail_reason", "how_to_fix"):
+            vote = (review.get(field) or {}).get("vote", 0)
+            if vote:
+                votes.append((field, "", -1, -1, vote))
+        for snippet in review.get("snippets") or []:
+            if snippet.get("vote"):
+                votes.append(
+                    (
+                        "snippet",
+                        snippet["file"],
+                        snippet["start_index"],
+                        snippet["end_index"],
+                        snippet["vote"],
+                    )
+                )
+        return votes
+
+    @classmethod
+    def get_consensus(cls, result_id: str) -> dict:
+        """
+        Votes of all reviews of a result summed up, per field and snippet.
+
+        Raises:
+            NoDataFound: when there is no result with the ID
+        """
+        record = cls.get_index().get(result_id)
+        if record is None:
+            raise NoDataFound(f"Original feedback file for ID {result_id} not found")
+        return {"id": result_id} | cls._consensus(record)
+
+    @classmethod
+    def _consensus(cls, record: sqlite3.Row) -> dict:
+        consensus: dict = {
+            "reviews": record["reviews"],
+            "fail_reason": {"up": 0, "down": 0},
+            "how_to_fix": {"up": 0, "down": 0},
+            "snippets": [],
+        }
+        for vote in cls.get_index().votes(record["id"]):
+            if vote["field"] == "snippet":
+                consensus["snippets"].append(
+                    {
+                        "file": vote["file"],
+                        "start_index": vote["start_index"],
+                        "end_index": vote["end_index"],
+                        "up": vote["up"],
+                        "down": vote["down"],
+                    }
+                )
+            else:
+                consensus[vote["field"]] = {"up": vote["up"], "down": vote["down"]}
+        return consensus
+
+    @classmethod
+    def get_reviews(cls, result_id: str) -> list[dict]:
+        """
+        All reviews of a result as they were submitted, oldest first.
+        """
+        backend = cls.get_backend("reviews")
+        return [
+            json.loads(decode_text(backend.get(review["key"])))
+            for review in cls.get_index().reviews(result_id)
+        ]
+
+    @classmethod
+    def next_for_review(cls) -> str:
+        """
+        Return ID of the result which should be reviewed next, the least
+        reviewed and oldest one. It is not handed out to other reviewers for
+        REVIEW_LEASE seconds.
+
+        Raises:
+            NoDataFound: when there are no results
+        """
+        record = cls.get_index().lease_for_review(time.time(), REVIEW_LEASE)
+        if record is None:
+            raise NoDataFound(f"Results directory {FEEDBACK_DIR} is empty")
+
+        return record["id"]
+
+    @classmethod
+    def get_by_id(cls, result_id: str) -> Optional[dict]:
         """
         Return a result based on its ID
         """
-        files = cls.get_logs()
-        for path in files:
-            if os.path.basename(path).split(".")[0] == result_id:
-                return Path(path)
-        return None
+        record = cls.get_index().get(result_id)
+        if record is None:
+            return None
+        return cls._read(record)
+
+    @classmethod
+    def get_review_payload(cls, result_id: str) -> Optional[dict]:
+        """
+        Return a result as shown to reviewers, with windows of
+        SNIPPET_CONTEXT_LINES lines around every snippet instead of full logs.
+        """
+        index = cls.get_index()
+        payload = index.get_review_payload(result_id)
+        if payload is not None:
+            return json.loads(payload)
+
+        # stored before review payloads existed or the index was recreated
+        content = cls.get_by_id(result_id)
+        if content is None:
+            return None
+        review = review_payload(
+            FeedbackSchema(**content).model_dump(), SNIPPET_CONTEXT_LINES
+        )
+        index.set_review_payload(result_id, json.dumps(review))
+        return review
+
+    @classmethod
+    def find_rendered_review(
+        cls, result_id: str, payload: str = "full"
+    ) -> Optional[tuple[str, bool]]:
+        """
+        Find a result rendered by `get_rendered_review` without reading it.
+
+        Returns:
+            SHA-256 hex digest of the JSON and whether it is stored gzip
+            compressed, or None if it isn't rendered yet.
+        """
+        digest = cls.get_index().get_rendered_review(result_id, payload)
+        if digest is None:
+            return None
+        key = cls.get_rendered().find(digest)
+        if key is None:
+            return None
+        return digest, key.endswith(".gz")
+
+    @classmethod
+    def get_rendered_review(
+        cls, result_id: str, payload: str = "full"
+    ) -> Optional[tuple[str, bytes]]:
+        """
+        Return a result as served to reviewers, serialized to JSON only once
+        and kept in the rendered namespace since results never change.
+
+        Args:
+            payload: full, or snippets for `get_review_payload`
+
+        Returns:
+            SHA-256 hex digest of the JSON and the JSON as it is stored,
+            gzip compressed or not.
+        """
+        index = cls.get_index()
+        rendered = cls.get_rendered()
+        digest = index.get_rendered_review(result_id, payload)
+        if digest is not None:
+            try:
+                return digest, rendered.get_stored(digest)
+            except FileNotFoundError:
+                LOGGER.warning("Rendered review %s is gone", digest)
+
+        if payload == "snippets":
+            review = cls.get_review_payload(result_id)
+        else:
+            content = cls.get_by_id(result_id)
+            review = None if content is None else FeedbackSchema(**content).model_dump()
+        if review is None:
+            return None
+
+        digest = rendered.put(
+            json.dumps(review | {"id": result_id}, ensure_ascii=False)
+        )
+        index.set_rendered_review(result_id, payload, digest)
+        return digest, rendered.get_stored(digest)
+
+    @classmethod
+    def prune_rendered(cls) -> int:
+        """
+        Delete all rendered review responses, they are rendered again when
+        requested.
+
+        Returns:
+            Number of deleted responses.
+        """
+        digests = cls.get_index().pop_rendered_reviews()
+        rendered = cls.get_rendered()
+        for digest in digests:
+            rendered.delete(digest)
+        rendered.backend.prune()
+        return len(digests)
+
+    @classmethod
+    def get_log_part(cls, result_id: str, name: str, start: int, end: int) -> dict:
+        """
+        Return characters from start to end (exclusive) of a log of a result,
+        to show more context of a snippet. Only the content of that log is
+        read.
+
+        Raises:
+            NoDataFound: when there is no result with the ID or no such log
+        """
+        record = cls.get_index().get(result_id)
+        if record is None:
+            raise NoDataFound(f"No result with ID {result_id}")
+        log = cls._read_stored(record)["logs"].get(name)
+        if log is None:
+            raise NoDataFound(f"No log {name} in result {result_id}")
+
+        if "content_sha256" in log:
+            content = cls.get_blobs().get(log["content_sha256"])
+        else:
+            content = log["content"]
+        start, end = min(start, len(content)), min(end, len(content))
+        return {
+            "name": name,
+            "start": start,
+            "end": end,
+            "size": len(content),
+            "text": content[start:end],
+        }
+
+    @classmethod
+    def find_annotations(
+        cls,
+        provider: Optional[str] = None,
+        build_id: Optional[str] = None,
+        chroot: Optional[str] = None,
+        package: Optional[str] = None,
+    ) -> list[dict]:
+        """
+        Annotations for the given build or package, newest first.
+        """
+        columns = ("id", "provider", "build_id", "chroot", "package", "date", "reviews")
+        return [
+            {column: record[column] for column in columns}
+            for record in cls.get_index().find(provider, build_id, chroot, package)
+        ]
+
+    @classmethod
+    def export(
+        cls,
+        after: int = 0,
+        limit: int = 100,
+        provider: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> tuple[int, Iterator[dict]]:
+        """
+        A page of annotations in the order they were stored, see
+        `AnnotationIndex.page`. Rebuilding the index renumbers them.
+
+        Returns:
+            Cursor to pass as `after` for the next page, and annotations with
+            their metadata read lazily one by one.
+        """
+        records = cls.get_index().page(after, limit, provider, since, until)
+        next_cursor = records[-1]["seq"] if records else after
+        return next_cursor, cls._export_records(records)
+
+    @classmethod
+    def _export_records(cls, records: list[sqlite3.Row]) -> Iterator[dict]:
+        for record in records:
+            try:
+                annotation = cls._read(record)
+            except OSError as ex:
+                LOGGER.error("Can't export %s: %s", record["id"], ex)
+                continue
+            yield {column: record[column] for column in EXPORTED_COLUMNS} | {
+                "annotation": annotation,
+                "consensus": cls._consensus(record),
+            }
 
     @classmethod
     def get_stats(cls) -> dict:
-        """Retrieve basic statistics about submitted reports."""
-        files = cls.get_logs()
+        """
+        Retrieve statistics about submitted reports.
+
+        They are maintained by the index on every write, and this worker
+        remembers them for STATS_CACHE_TTL seconds.
+        """
+        now = time.monotonic()
+        if cls._stats_cache and now - cls._stats_cache[0] < STATS_CACHE_TTL:
+            return cls._stats_cache[1]
+
+        counters = cls.get_index().counters()
+        total = counters.get("total", {}).get("", 0)
+        reviewed = counters.get("reviewed", {}).get("", 0)
+        providers = counters.get("provider", {})
         stats = {
-            "total_reports": len(files),
+            "total_reports": total,
+            "reviewed_reports": reviewed,
+            "unreviewed_reports": total - reviewed,
+            "total_reviews": counters.get("reviews", {}).get("", 0),
+            "providers": {
+                provider.value: providers.get(provider, 0) for provider in ProvidersEnum
+            },
+            "days": dict(sorted(counters.get("day", {}).items())),
         }
+        cls._stats_cache = (now, stats)
         return stats
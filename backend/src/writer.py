@@ -0,0 +1,230 @@
+"""
+Background writer committing writes of concurrent requests together.
+
+Every submission used to be written by its own request thread without any
+durability guarantee. The writer thread instead takes everything queued since
+its last commit, writes all files to temporary names, syncs them concurrently,
+renames them into place and syncs their directories once for the whole batch. Segment records of
+a batch are appended with a single fsync. Under bursts the cost of syncing is
+shared by all requests in the batch, and a killed pod never leaves a partially
+written file behind.
+
+Callers wait on the returned future, when it resolves their data is durable.
+"""
+
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from src.constants import LOGGER_NAME
+from src.segments import SegmentStore
+from src.spells import get_logger
+
+LOGGER = get_logger(LOGGER_NAME)
+
+# files of a batch are synced concurrently, so that the filesystem can commit
+# them to its journal together
+_SYNC_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="group-sync")
+
+
+@dataclass
+class _FileWrite:
+    path: Path
+    data: bytes
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class _RecordsAppend:
+    segments: SegmentStore
+    payloads: list[bytes]
+    future: Future = field(default_factory=Future)
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class GroupCommitWriter:
+    # writer shared by all request threads of this worker
+    _instance: Optional["GroupCommitWriter"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_batch: int = 256) -> None:
+        self.max_batch = max_batch
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit-writer", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def get(cls) -> "GroupCommitWriter":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Commit everything queued so far and stop the shared writer.
+        """
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.close()
+                cls._instance = None
+
+    def write_file(self, path: Path | str, data: bytes) -> Future:
+        """
+        Atomically replace the file at path with data.
+
+        Returns:
+            Future resolved once the file is durably stored.
+        """
+        job = _FileWrite(Path(path), data)
+        self._queue.put(job)
+        return job.future
+
+    def append_records(self, segments: SegmentStore, payloads: list[bytes]) -> Future:
+        """
+        Append records to segments, see `SegmentStore.append`.
+
+        Returns:
+            Future resolved to locations of the records once they are
+            durably stored.
+        """
+        job = _RecordsAppend(segments, payloads)
+        self._queue.put(job)
+        return job.future
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            try:
+                self._commit(batch)
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                # keep the thread running, nobody else would resolve the futures
+                LOGGER.exception("Failed to commit a batch of %s jobs", len(batch))
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(ex)
+
+    def _commit(self, batch: list) -> None:
+        files = [job for job in batch if isinstance(job, _FileWrite)]
+        appends = [job for job in batch if isinstance(job, _RecordsAppend)]
+        self._commit_files(files)
+        self._commit_appends(appends)
+
+    @staticmethod
+    def _commit_files(jobs: list[_FileWrite]) -> None:
+        opened: list[tuple[_FileWrite, str, int]] = []
+        directories: set[Path] = set()
+        for job in jobs:
+            try:
+                missing = []
+                directory = job.path.parent
+                while not directory.exists():
+                    missing.append(directory)
+                    directory = directory.parent
+                if missing:
+                    job.path.parent.mkdir(parents=True, exist_ok=True)
+                    # every new directory must be durable as well
+                    directories.update(directory.parent for directory in missing)
+                fd, tmp_path = tempfile.mkstemp(dir=job.path.parent, prefix=".tmp-")
+                try:
+                    view = memoryview(job.data)
+                    while view:
+                        view = view[os.write(fd, view) :]
+                except BaseException:
+                    os.close(fd)
+                    os.unlink(tmp_path)
+                    raise
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                job.future.set_exception(ex)
+                continue
+            opened.append((job, tmp_path, fd))
+
+        syncs = [_SYNC_EXECUTOR.submit(os.fsync, fd) for _, _, fd in opened]
+        written: list[tuple[_FileWrite, str]] = []
+        for (job, tmp_path, fd), sync in zip(opened, syncs):
+            try:
+                sync.result()
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                os.close(fd)
+                os.unlink(tmp_path)
+                job.future.set_exception(ex)
+                continue
+            os.close(fd)
+            written.append((job, tmp_path))
+
+        for job, tmp_path in written:
+            try:
+                os.replace(tmp_path, job.path)
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                os.unlink(tmp_path)
+                job.future.set_exception(ex)
+                continue
+            directories.add(job.path.parent)
+
+        try:
+            # deepest first, a directory is synced after its new subdirectories
+            for directory in sorted(
+                directories, key=lambda path: len(path.parts), reverse=True
+            ):
+                _fsync_directory(directory)
+        except OSError as ex:
+            LOGGER.error("Failed to sync directories: %s", ex)
+            for job, _ in written:
+                if not job.future.done():
+                    job.future.set_exception(ex)
+            return
+
+        for job, _ in written:
+            if not job.future.done():
+                job.future.set_result(None)
+
+    @staticmethod
+    def _commit_appends(jobs: list[_RecordsAppend]) -> None:
+        by_root: dict[Path, list[_RecordsAppend]] = {}
+        for job in jobs:
+            by_root.setdefault(job.segments.root, []).append(job)
+
+        for root_jobs in by_root.values():
+            payloads = [payload for job in root_jobs for payload in job.payloads]
+            try:
+                locations = root_jobs[0].segments.append(payloads)
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                for job in root_jobs:
+                    job.future.set_exception(ex)
+                continue
+
+            for job in root_jobs:
+                job.future.set_result(locations[: len(job.payloads)])
+                locations = locations[len(job.payloads) :]
@@ -1,11 +1,17 @@
 import json
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
 from src.constants import ProvidersEnum
+from src.copr_client import CoprClient
+from src.koji_client import KojiClient, KojiSessionPool
+from src.metadata import MetadataCache
 from src.schema import FeedbackInputSchema, FeedbackSchema
+from src.sharedcache import SharedCache
 from src.store import Storator3000
+from tests.spells import FakeRedis
 
 
 FAKE_BUILD_LOG = """
@@ -116,6 +122,53 @@ def koji_chroot_logs_x86_64():
         }
 
 
+@pytest.fixture
+def storage(tmp_path):
+    """Point the storage to a temporary directory."""
+    feedback_dir = tmp_path / "results"
+    reviews_dir = tmp_path / "reviews"
+    with (
+        patch("src.store.FEEDBACK_DIR", str(feedback_dir)),
+        patch("src.store.REVIEWS_DIR", str(reviews_dir)),
+        patch("src.store.BLOBS_DIR", str(tmp_path / "blobs")),
+        patch("src.store.RENDERED_DIR", str(tmp_path / "rendered")),
+        patch("src.store.INDEX_DB", str(tmp_path / "index.sqlite3")),
+        patch("src.store.SEGMENTS_DIR", str(tmp_path / "segments")),
+        patch.object(Storator3000, "_stats_cache", None),
+    ):
+        yield tmp_path
+
+
+@pytest.fixture(autouse=True)
+def log_cache(tmp_path):
+    """Keep logs cached by any test in a temporary directory."""
+    with patch("src.logcache.LOG_CACHE_DIR", str(tmp_path / "log-cache")):
+        yield tmp_path / "log-cache"
+
+
+@pytest.fixture(autouse=True)
+def build_metadata():
+    """Don't let tests see builds or Koji sessions of other tests."""
+    with (
+        patch.object(CoprClient, "_finished", MetadataCache()),
+        patch.object(KojiClient, "_finished", MetadataCache()),
+        patch.object(KojiSessionPool, "_instances", {}),
+    ):
+        yield
+
+
+@pytest.fixture
+def shared_cache():
+    """Cache shared by replicas in an in-process stand-in for Redis."""
+    server = FakeRedis()
+    with (
+        patch("src.sharedcache.SHARED_CACHE_URL", server.url),
+        patch.object(SharedCache, "_instances", {}),
+    ):
+        yield server
+    server.stop()
+
+
 @pytest.fixture
 def storator():
     return Storator3000(ProvidersEnum.copr, str(123))
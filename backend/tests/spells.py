@@ -1,5 +1,183 @@
 """Lyney would approve this :magic:"""
 
+import bz2
+import gzip
+import io
+import lzma
+import socketserver
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+import zstandard
+
+from src import srpm
+
 
 def sort_by_name(item):
     return item["name"]
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while line := self.rfile.readline():
+            args = []
+            for _ in range(int(line[1:-2])):
+                size = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(size + 2)[:-2])
+            self.wfile.write(self.server.execute(args))
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """
+    In-process stand-in for a Redis server, speaking just enough of its
+    protocol for the shared cache.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FakeRedisHandler)
+        # key -> (value, monotonic time of expiration)
+        self.data: dict[bytes, tuple[bytes, float]] = {}
+        self.commands: list[list[bytes]] = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"redis://:secret@127.0.0.1:{self.server_address[1]}/1"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def execute(self, args: list[bytes]) -> bytes:
+        self.commands.append(args)
+        command = args[0].upper()
+        if command in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if command == b"GET":
+            value, expires = self.data.get(args[1], (None, 0.0))
+            if value is None or expires < time.monotonic():
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET" and len(args) == 5 and args[3].upper() == b"EX":
+            self.data[args[1]] = (args[2], time.monotonic() + int(args[4]))
+            return b"+OK\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+class _FakeKojiCall:
+    def __init__(self, method: Callable, args: tuple, kwargs: dict) -> None:
+        self._call = lambda: method(*args, **kwargs)
+        self._result: Any = None
+        self._error: Exception | None = None
+
+    def run(self) -> None:
+        try:
+            self._result = self._call()
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            self._error = ex
+
+    @property
+    def result(self) -> Any:
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class FakeKojiSession:
+    """
+    Stand-in for koji.ClientSession calling the given methods (usually mocks),
+    also in multicalls, and counting round trips to the hub.
+    """
+
+    def __init__(self, **methods: Callable) -> None:
+        self.methods = methods
+        self.round_trips = 0
+
+    def __getattr__(self, name: str) -> Callable:
+        try:
+            method = self.methods[name]
+        except KeyError as ex:
+            raise AttributeError(name) from ex
+
+        def call(*args, **kwargs):
+            self.round_trips += 1
+            return method(*args, **kwargs)
+
+        return call
+
+    @contextmanager
+    def multicall(self, strict: bool = False):
+        calls: list[_FakeKojiCall] = []
+        methods = self.methods
+
+        class _MultiCall:
+            def __getattr__(self, name: str) -> Callable:
+                def call(*args, **kwargs):
+                    calls.append(_FakeKojiCall(methods[name], args, kwargs))
+                    return calls[-1]
+
+                return call
+
+        yield _MultiCall()
+        self.round_trips += 1
+        for call in calls:
+            call.run()
+            if strict:
+                call.result  # pylint: disable=pointless-statement
+
+
+def _srpm_header(tags: dict[int, str]) -> bytes:
+    index, store = b"", b""
+    for tag, value in tags.items():
+        index += struct.pack(">IIiI", tag, srpm.RPM_STRING_TYPE, len(store), 1)
+        store += value.encode() + b"\0"
+    return (
+        srpm.RPM_HEADER_MAGIC
+        + bytes(4)
+        + struct.pack(">II", len(tags), len(store))
+        + index
+        + store
+    )
+
+
+def _cpio_archive(files: dict[str, bytes]) -> bytes:
+    archive = b""
+    for name, content in [*files.items(), (srpm.CPIO_TRAILER, b"")]:
+        fields = [0, 0o100644, 0, 0, 1, 0, len(content), 0, 0, 0, 0, len(name) + 1, 0]
+        archive += b"070701" + b"".join(b"%08X" % field for field in fields)
+        archive += name.encode() + b"\0"
+        archive += bytes(-len(archive) % 4)
+        archive += content
+        archive += bytes(-len(archive) % 4)
+    return archive
+
+
+def build_srpm(files: dict[str, bytes], compressor: str = "gzip") -> io.BytesIO:
+    """SRPM with the files in its payload, without any real metadata."""
+    compress = {
+        "gzip": gzip.compress,
+        "bzip2": bz2.compress,
+        "xz": lzma.compress,
+        "zstd": zstandard.ZstdCompressor().compress,
+    }
+    # a signature header which needs padding
+    signature = _srpm_header({1000: "x"})
+    return io.BytesIO(
+        srpm.RPM_LEAD_MAGIC
+        + bytes(srpm.RPM_LEAD_SIZE - 4)
+        + signature
+        + bytes(-len(signature) % 8)
+        + _srpm_header(
+            {
+                srpm.RPMTAG_PAYLOADFORMAT: "cpio",
+                srpm.RPMTAG_PAYLOADCOMPRESSOR: compressor,
+            }
+        )
+        + compress[compressor](_cpio_archive(files))
+    )
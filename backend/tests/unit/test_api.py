@@ -222,6 +222,37 @@ class TestExplainEndpoint:
         assert len(data["logs"]) == 1
         assert data["logs"][0]["content"] == FAKE_LOG_CONTENT
 
+    @patch("src.api._check_log_urls", new_callable=AsyncMock)
+    async def test_explanation_shared(self, _mock_check, shared_cache):
+        from src.api import _call_analyze_api
+        from src.constants import ProvidersEnum
+
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = FAKE_SERVER_RESPONSE
+        mock_response.request = MagicMock(headers={}, content=b"")
+        mock_client = AsyncMock()
+        mock_client.post = AsyncMock(return_value=mock_response)
+
+        log_urls = [{"name": "build.log", "url": "https://example.com/build.log"}]
+        first = await _call_analyze_api(
+            log_urls, http_client=mock_client, provider_name=ProvidersEnum.copr
+        )
+        second = await _call_analyze_api(
+            log_urls, http_client=mock_client, provider_name=ProvidersEnum.copr
+        )
+        assert first == second
+        mock_client.post.assert_awaited_once()
+
+        # logs behind plain URLs may change
+        await _call_analyze_api(
+            log_urls, http_client=mock_client, provider_name=ProvidersEnum.url
+        )
+        await _call_analyze_api(
+            log_urls, http_client=mock_client, provider_name=ProvidersEnum.url
+        )
+        assert mock_client.post.await_count == 3
+
     @patch("src.api._check_log_urls", new_callable=AsyncMock)
     @patch("src.api._download_log_content", new_callable=AsyncMock)
     async def test_explain_server_timeout(self, mock_download, _mock_check):
@@ -647,3 +678,343 @@ def test_our_server_url(tmp_path):
         f"{client.base_url}/frontend/review/"
     )
     assert response_json["review_url_website"].startswith(f"{client.base_url}/review/")
+
+
+class TestReviewEndpoints:
+    def test_review_by_id_inlines_contents(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+
+        client = TestClient(app)
+        response = client.get(f"/frontend/review/{contribution_id}")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id"] == str(contribution_id)
+        assert data["logs"]["log1"]["content"] == "log content 1"
+        assert data["spec_file"]["content"] == "spec content"
+
+    def test_review_is_cached(self, storage, spec_feedback_input_output_schema_tuple):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        url = f"/frontend/review/{contribution_id}"
+
+        client = TestClient(app)
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert "immutable" in response.headers["cache-control"]
+        etag = response.headers["etag"]
+
+        with patch.object(Storator3000, "get_by_id") as mock_get_by_id:
+            with patch.object(Storator3000, "get_rendered_review") as mock_get:
+                response = client.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.content == b""
+            # nothing is read for a conditional request
+            mock_get.assert_not_called()
+
+            response = client.get(url, headers={"Accept-Encoding": "identity"})
+            assert response.status_code == 200
+            assert "content-encoding" not in response.headers
+            assert response.headers["etag"] != etag
+            assert response.json()["id"] == str(contribution_id)
+        # rendered only once
+        mock_get_by_id.assert_not_called()
+        # and kept apart from the blobs of annotations
+        assert Storator3000.get_rendered().find(etag.strip('"').removesuffix("-gzip"))
+        assert (
+            Storator3000.get_blobs().find(etag.strip('"').removesuffix("-gzip")) is None
+        )
+
+        assert Storator3000.prune_rendered() == 1
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        response = client.get("/frontend/review/random")
+        assert response.headers["cache-control"] == "no-store"
+
+    def test_review_snippets_payload(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+
+        client = TestClient(app)
+        response = client.get(
+            f"/frontend/review/{contribution_id}", params={"payload": "snippets"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id"] == str(contribution_id)
+        log = data["logs"]["log1"]
+        assert "content" not in log
+        assert log["size"] == len("log content 1")
+        assert log["snippets"][0]["context"] == {
+            "start": 0,
+            "end": 13,
+            "text": "log content 1",
+        }
+
+        # recreated for annotations stored before the index knew them
+        Storator3000.get_index().db_path.unlink()
+        Storator3000.rebuild_index()
+        response = client.get(
+            f"/frontend/review/{contribution_id}", params={"payload": "snippets"}
+        )
+        assert response.json() == data
+
+        response = client.get(
+            "/frontend/review/nonexistent", params={"payload": "snippets"}
+        )
+        assert response.status_code == 404
+
+    def test_log_context(self, storage, spec_feedback_input_output_schema_tuple):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        url = f"/frontend/review/{contribution_id}/context"
+
+        client = TestClient(app)
+        response = client.get(url, params={"log": "log1", "start": 4, "end": 100})
+        assert response.status_code == 200
+        assert response.json() == {
+            "name": "log1",
+            "start": 4,
+            "end": 13,
+            "size": 13,
+            "text": "content 1",
+        }
+
+        response = client.get(url, params={"log": "log2", "start": 0, "end": 1})
+        assert response.status_code == 404
+        response = client.get(url, params={"log": "log1", "start": 5, "end": 1})
+        assert response.status_code == 400
+
+    def test_store_review(self, storage, spec_feedback_input_output_schema_tuple):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.reviews import ReviewProcessor
+        from src.spells import read_json_file
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+
+        client = TestClient(app)
+        response = client.post(
+            "/frontend/review",
+            json={
+                "id": contribution_id,
+                "fail_reason": {"text": "reason", "vote": 1},
+                "how_to_fix": {"text": "fix", "vote": 0},
+                "snippets": [],
+            },
+        )
+
+        assert response.status_code == 200
+        review_id = response.json()["review_id"]
+        review = read_json_file(storage / "reviews" / f"{review_id}.json.gz")
+        assert review["id"] == contribution_id
+
+        # wait for the review to be merged in the background
+        ReviewProcessor.shutdown()
+        response = client.get(f"/frontend/reviews/{review_id}/status")
+        assert response.json() == {"review_id": review_id, "status": "parsed"}
+        parsed = read_json_file(storage / "reviews" / "parsed" / f"{review_id}.json.gz")
+        assert parsed["fail_reason"] == "reason"
+        assert "content_sha256" in parsed["logs"]["log1"]
+        assert Storator3000.get_index().get(contribution_id)["reviews"] == 1
+
+    def test_store_review_unknown_annotation(self, storage):
+        from fastapi.testclient import TestClient
+
+        client = TestClient(app)
+        response = client.post(
+            "/frontend/review",
+            json={
+                "id": "nonexistent",
+                "fail_reason": {"text": "", "vote": 0},
+                "how_to_fix": {"text": "", "vote": 0},
+                "snippets": [],
+            },
+        )
+        assert response.status_code == 404
+        assert not (storage / "reviews").exists()
+
+    def test_existing_annotations(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = Storator3000(ProvidersEnum.copr, "123", "fedora-40").store(
+            feedback
+        )
+        Storator3000(ProvidersEnum.koji, "123", "x86_64").store(feedback)
+
+        client = TestClient(app)
+        response = client.get(
+            "/frontend/annotations",
+            params={"provider": "copr", "build_id": "123", "chroot": "fedora-40"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["annotated"]
+        assert [a["id"] for a in data["annotations"]] == [str(contribution_id)]
+        assert data["annotations"][0]["review_url_website"].endswith(
+            f"/review/{contribution_id}"
+        )
+
+        response = client.get(
+            "/frontend/annotations", params={"build_id": "123", "chroot": "rawhide"}
+        )
+        assert response.json() == {"annotated": False, "annotations": []}
+
+        response = client.get("/frontend/annotations", params={"provider": "copr"})
+        assert response.status_code == 400
+
+    def test_export(self, storage, spec_feedback_input_output_schema_tuple):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        ids = [
+            str(Storator3000(provider, "123").store(feedback))
+            for provider in (ProvidersEnum.copr, ProvidersEnum.koji, ProvidersEnum.copr)
+        ]
+
+        client = TestClient(app)
+        response = client.get("/export", params={"limit": 2})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["id"] for line in lines] == ids[:2]
+        assert lines[0]["annotation"]["logs"]["log1"]["content"] == "log content 1"
+
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/export", params={"after": cursor})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [
+            ids[2]
+        ]
+
+        # nothing new, the cursor stays
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/export", params={"after": cursor})
+        assert response.text == ""
+        assert response.headers["X-Next-Cursor"] == cursor
+
+        response = client.get("/export", params={"provider": "copr"})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [
+            ids[0],
+            ids[2],
+        ]
+        response = client.get("/export", params={"since": "2000-01-01"})
+        assert len(response.text.splitlines()) == 3
+        response = client.get("/export", params={"until": "2000-01-01"})
+        assert response.text == ""
+
+    def test_get_reviews(self, storage, spec_feedback_input_output_schema_tuple):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        Storator3000.store_review(
+            contribution_id, f"{contribution_id}-1", {"id": contribution_id}
+        )
+
+        client = TestClient(app)
+        response = client.get(f"/frontend/review/{contribution_id}/reviews")
+        assert response.status_code == 200
+        assert response.json() == [{"id": contribution_id}]
+
+        response = client.get("/frontend/review/nonexistent/reviews")
+        assert response.status_code == 404
+
+    def test_get_consensus(self, storage, spec_feedback_input_output_schema_tuple):
+        from fastapi.testclient import TestClient
+
+        from src.constants import ProvidersEnum
+        from src.store import Storator3000
+
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review = {"fail_reason": {"text": "reason", "vote": 1}, "snippets": []}
+        Storator3000.store_review(contribution_id, f"{contribution_id}-1", review)
+        Storator3000.store_parsed_review(f"{contribution_id}-1", review, {})
+
+        client = TestClient(app)
+        response = client.get(f"/frontend/review/{contribution_id}/consensus")
+        assert response.status_code == 200
+        assert response.json()["fail_reason"] == {"up": 1, "down": 0}
+
+        response = client.get("/export")
+        (line,) = response.text.splitlines()
+        assert json.loads(line)["consensus"]["reviews"] == 1
+
+        response = client.get("/frontend/review/nonexistent/consensus")
+        assert response.status_code == 404
+
+
+def test_metrics(log_cache):
+    from fastapi.testclient import TestClient
+
+    from src.logcache import get_log_cache
+
+    get_log_cache().put("https://example.com/build.log", b"log content", None)
+    get_log_cache().get("https://example.com/build.log")
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert "logdetective_log_cache_hits_total 1\n" in response.text
+    assert "logdetective_log_cache_entries 1\n" in response.text
+    assert "logdetective_memory_budget_used_bytes 0\n" in response.text
+    assert "logdetective_memory_budget_rejected_total 0\n" in response.text
+
+
+@patch("src.budget.MEMORY_BUDGET_WAIT", 0.01)
+def test_memory_budget_exhausted():
+    from fastapi.testclient import TestClient
+
+    from src.budget import BUDGET
+
+    with (
+        patch.object(BUDGET, "used", BUDGET.capacity),
+        patch.object(BUDGET, "rejected", 0),
+    ):
+        response = TestClient(app).post(
+            "/frontend/contribute/upload", content=b"x" * 1024
+        )
+        assert BUDGET.rejected == 1
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from src.budget import ByteBudget, MemoryBudgetMiddleware, Reservation, reserve_memory
+from src.exceptions import BudgetExhausted
+
+
+class TestByteBudget:
+    async def test_reservations_are_clamped_to_capacity(self):
+        budget = ByteBudget(100)
+        assert await budget.acquire(1000, timeout=1) == 100
+        assert budget.used == 100
+        budget.release(100)
+        assert budget.used == 0
+
+    async def test_waiters_are_served_in_order(self):
+        budget = ByteBudget(100)
+        await budget.acquire(80, timeout=1)
+        granted = []
+
+        async def acquire(name, size):
+            await budget.acquire(size, timeout=1)
+            granted.append(name)
+
+        tasks = [
+            asyncio.create_task(acquire("large", 60)),
+            asyncio.create_task(acquire("small", 10)),
+        ]
+        await asyncio.sleep(0)
+        # the small one would fit, but mustn't overtake the large one
+        assert granted == []
+        assert budget.waiting == 2
+
+        budget.release(80)
+        await asyncio.gather(*tasks)
+        assert granted == ["large", "small"]
+        assert budget.used == 70
+        assert budget.waiting == 0
+
+    async def test_exhausted(self):
+        budget = ByteBudget(100)
+        await budget.acquire(100, timeout=1)
+        with pytest.raises(BudgetExhausted) as ex:
+            await budget.acquire(1, timeout=0.01)
+        assert ex.value.status_code == 503
+        assert "Retry-After" in ex.value.headers
+        assert budget.rejected == 1
+        assert budget.waiting == 0
+        assert budget.used == 100
+
+    async def test_cancelled_waiter_lets_others_in(self):
+        budget = ByteBudget(100)
+        await budget.acquire(50, timeout=1)
+        blocked = asyncio.create_task(budget.acquire(100, timeout=10))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(budget.acquire(50, timeout=10))
+        await asyncio.sleep(0)
+
+        blocked.cancel()
+        assert await waiting == 50
+        assert budget.used == 100
+        assert budget.waiting == 0
+
+
+@patch("src.budget.MEMORY_BUDGET_FACTOR", 1)
+class TestReservation:
+    async def test_waiting_request_holds_nothing(self):
+        budget = ByteBudget(100)
+        reservation = Reservation(budget)
+        await reservation.reserve(60)
+        await budget.acquire(40, timeout=1)
+
+        waiting = asyncio.create_task(reservation.reserve(20))
+        await asyncio.sleep(0)
+        # it gave back what it held and waits for all of it
+        assert budget.used == 40
+        assert budget.waiting == 1
+
+        budget.release(40)
+        await waiting
+        assert reservation.size == 80
+        assert budget.used == 80
+
+
+def _app(budget):
+    app = FastAPI()
+    app.add_middleware(MemoryBudgetMiddleware, budget=budget)
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        await request.body()
+        return {"used": budget.used}
+
+    @app.get("/log")
+    async def log():
+        await reserve_memory(10)
+        return {"used": budget.used}
+
+    return app
+
+
+@patch("src.budget.MEMORY_BUDGET_FACTOR", 2)
+class TestMemoryBudgetMiddleware:
+    def test_reservations_last_for_the_request(self):
+        budget = ByteBudget(1000)
+        client = TestClient(_app(budget))
+        assert client.post("/upload", content=b"x" * 100).json() == {"used": 200}
+        assert client.get("/log").json() == {"used": 20}
+        assert budget.used == 0
+
+    @patch("src.budget.MEMORY_BUDGET_WAIT", 0.01)
+    def test_exhausted(self):
+        budget = ByteBudget(1000)
+        budget.used = 1000
+        client = TestClient(_app(budget), raise_server_exceptions=False)
+
+        response = client.post("/upload", content=b"x" * 100)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert response.json()["error"] == "Server error: 503"
+        assert budget.rejected == 1
+
+    async def test_nothing_is_reserved_outside_of_requests(self):
+        await reserve_memory(10**12)
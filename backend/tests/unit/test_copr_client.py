@@ -0,0 +1,71 @@
+import httpx
+import pytest
+
+from src.copr_client import CoprClient, CoprNoResultError
+from src.metadata import MetadataCache
+
+COPR_URL = "https://copr.example.com"
+
+
+def _copr_api(records: dict[str, dict], requests: list[str]) -> httpx.AsyncClient:
+    """Client of a fake Copr API serving the records by their path."""
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.raw_path.decode().removeprefix("/api_3/")
+        requests.append(path)
+        if path not in records:
+            return httpx.Response(404, json={"error": f"{path} doesn't exist"})
+        return httpx.Response(200, json=records[path])
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+
+
+class TestCoprClient:
+    async def test_memoized_per_request(self):
+        requests: list[str] = []
+        http_client = _copr_api({"build/1": {"id": 1, "state": "running"}}, requests)
+
+        client = CoprClient(COPR_URL, http_client)
+        assert await client.get_build(1) == {"id": 1, "state": "running"}
+        assert await client.get_build(1) == {"id": 1, "state": "running"}
+        assert requests == ["build/1"]
+
+        # the build may still change, so the next request asks again
+        await CoprClient(COPR_URL, http_client).get_build(1)
+        assert requests == ["build/1", "build/1"]
+
+    async def test_finished_builds_are_remembered(self):
+        requests: list[str] = []
+        records = {
+            "build-chroot?build_id=1&chrootname=fedora-41-x86_64": {
+                "name": "fedora-41-x86_64",
+                "state": "failed",
+                "result_url": "https://example.com/results",
+            }
+        }
+        http_client = _copr_api(records, requests)
+
+        for _ in range(3):
+            build_chroot = await CoprClient(COPR_URL, http_client).get_build_chroot(
+                1, "fedora-41-x86_64"
+            )
+            assert build_chroot["result_url"] == "https://example.com/results"
+        assert len(requests) == 1
+
+    async def test_finished_builds_are_shared(self, shared_cache):
+        requests: list[str] = []
+        http_client = _copr_api({"build/1": {"id": 1, "state": "succeeded"}}, requests)
+        await CoprClient(COPR_URL, http_client).get_build(1)
+
+        # another replica
+        CoprClient._finished = MetadataCache()
+        assert await CoprClient(COPR_URL, http_client).get_build(1) == {
+            "id": 1,
+            "state": "succeeded",
+        }
+        assert requests == ["build/1"]
+
+    async def test_not_found(self):
+        client = CoprClient(COPR_URL, _copr_api({}, []))
+        with pytest.raises(CoprNoResultError, match="build/2 doesn't exist"):
+            await client.get_build(2)
@@ -1,12 +1,14 @@
+from typing import Optional
+
 import koji
 import pytest
-from unittest.mock import patch, MagicMock, AsyncMock, PropertyMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 import httpx
-from copr.v3 import BuildProxy, BuildChrootProxy
 from fastapi import HTTPException
 
 from src.constants import COPR_RESULT_TEMPLATE
+from src.copr_client import CoprClient
 from src.exceptions import FetchError
 from src.fetcher import (
     CoprProvider,
@@ -16,7 +18,8 @@ from src.fetcher import (
     ContainerProvider,
     OBSProvider,
 )
-from tests.spells import sort_by_name
+from src.spells import FetchedLog
+from tests.spells import FakeKojiSession, build_srpm, sort_by_name
 
 
 def _mock_fetch_text(url_to_response: dict[str, tuple[str, int]]):
@@ -34,6 +37,18 @@ def _mock_fetch_text(url_to_response: dict[str, tuple[str, int]]):
     return _fake_fetch_text
 
 
+def _as_fetched_log(fake_fetch_text):
+    """Fake fetch_log serving responses of a fake fetch_text."""
+
+    async def _fake_fetch_log(url, **kwargs):
+        response = await fake_fetch_text(url, **kwargs)
+        if not response.is_success:
+            return FetchedLog(response)
+        return FetchedLog(response, response.text, len(response.content))
+
+    return _fake_fetch_log
+
+
 class TestCoprProvider:
     @pytest.mark.parametrize(
         "chroot, baseurl",
@@ -45,8 +60,8 @@ class TestCoprProvider:
             pytest.param("fedora-39_x86_64", None),
         ],
     )
-    @patch.object(BuildProxy, "get")
-    @patch.object(BuildChrootProxy, "get")
+    @patch.object(CoprClient, "get_build")
+    @patch.object(CoprClient, "get_build_chroot")
     async def test_fetch_copr_logs(
         self,
         mock_build_chroot_proxy,
@@ -56,10 +71,12 @@ class TestCoprProvider:
         copr_chroot_logs,
         copr_srpm_logs,
     ):
-        mock_build_chroot_proxy.return_value = MagicMock(result_url=baseurl)
-        mock_build_proxy.return_value = MagicMock(
-            ownername="ownername", project_dirname="dirname", id=123
-        )
+        mock_build_chroot_proxy.return_value = {"result_url": baseurl}
+        mock_build_proxy.return_value = {
+            "ownername": "ownername",
+            "project_dirname": "dirname",
+            "id": 123,
+        }
 
         logs = copr_srpm_logs if chroot == "srpm-builds" else copr_chroot_logs
 
@@ -75,12 +92,20 @@ class TestCoprProvider:
 
         expected_result = sorted(
             [
-                {"name": name.removesuffix(".gz"), "content": content}
+                {
+                    "name": name.removesuffix(".gz"),
+                    "content": content,
+                    "original_size": len(content.encode("utf-8")),
+                    "truncated": False,
+                }
                 for name, content in logs.items()
             ],
             key=sort_by_name,
         )
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             result = await provider.fetch_logs()
         assert expected_result == sorted(result, key=sort_by_name)
 
@@ -93,19 +118,19 @@ class TestCoprProvider:
             ),
         ],
     )
-    @patch.object(BuildProxy, "get")
-    @patch.object(BuildChrootProxy, "get")
+    @patch.object(CoprClient, "get_build")
+    @patch.object(CoprClient, "get_build_chroot")
     async def test_fetch_copr_spec(
         self, mock_build_chroot_proxy, mock_build_proxy, chroot, baseurl, fake_spec_file
     ):
-        mock_build_chroot_proxy.return_value = MagicMock(result_url=baseurl)
+        mock_build_chroot_proxy.return_value = {"result_url": baseurl}
         projectname = "pikachu"
-        mock_build_proxy.return_value = MagicMock(
-            source_package={"name": projectname, "url": baseurl},
-            id=123,
-            ownername="ownername",
-            project_dirname="dirname",
-        )
+        mock_build_proxy.return_value = {
+            "source_package": {"name": projectname, "url": baseurl},
+            "id": 123,
+            "ownername": "ownername",
+            "project_dirname": "dirname",
+        }
 
         spec_name = f"{projectname}.spec"
         url_map = {f"{baseurl}/{spec_name}": (fake_spec_file, 200)}
@@ -123,8 +148,8 @@ class TestCoprProvider:
             ).fetch_spec_file()
         assert result is None
 
-    @patch.object(BuildProxy, "get")
-    @patch.object(BuildChrootProxy, "get")
+    @patch.object(CoprClient, "get_build")
+    @patch.object(CoprClient, "get_build_chroot")
     async def test_fetch_copr_logs_with_utf8(
         self, mock_build_chroot_proxy, mock_build_proxy
     ):
@@ -132,10 +157,12 @@ class TestCoprProvider:
         chroot = "fedora-39-x86_64"
         czech_log = "Chyba: závislost 'žluťoučký-balíček' nebyla nalezena"
 
-        mock_build_chroot_proxy.return_value = MagicMock(result_url=baseurl)
-        mock_build_proxy.return_value = MagicMock(
-            ownername="owner", project_dirname="project", id=123
-        )
+        mock_build_chroot_proxy.return_value = {"result_url": baseurl}
+        mock_build_proxy.return_value = {
+            "ownername": "owner",
+            "project_dirname": "project",
+            "id": 123,
+        }
 
         url_map = {
             f"{baseurl}/{name}": (czech_log, 200)
@@ -143,7 +170,10 @@ class TestCoprProvider:
         }
 
         provider = CoprProvider(123, chroot, http_client=MagicMock())
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             logs = await provider.fetch_logs()
 
         for log in logs:
@@ -159,8 +189,8 @@ class TestCoprProvider:
             ),
         ],
     )
-    @patch.object(BuildProxy, "get")
-    @patch.object(BuildChrootProxy, "get")
+    @patch.object(CoprClient, "get_build")
+    @patch.object(CoprClient, "get_build_chroot")
     async def test_fetch_log_urls(
         self,
         mock_build_chroot_proxy,
@@ -168,10 +198,12 @@ class TestCoprProvider:
         chroot,
         baseurl,
     ):
-        mock_build_chroot_proxy.return_value = MagicMock(result_url=baseurl)
-        mock_build_proxy.return_value = MagicMock(
-            ownername="ownername", project_dirname="dirname", id=123
-        )
+        mock_build_chroot_proxy.return_value = {"result_url": baseurl}
+        mock_build_proxy.return_value = {
+            "ownername": "ownername",
+            "project_dirname": "dirname",
+            "id": 123,
+        }
         provider = CoprProvider(123, chroot, http_client=MagicMock())
         result = await provider.fetch_log_urls()
 
@@ -186,15 +218,17 @@ class TestCoprProvider:
         if chroot != "srpm-builds":
             assert "build.log" in names
 
-    @patch.object(BuildProxy, "get")
-    @patch.object(BuildChrootProxy, "get")
+    @patch.object(CoprClient, "get_build")
+    @patch.object(CoprClient, "get_build_chroot")
     async def test_fetch_log_urls_no_results(
         self, mock_build_chroot_proxy, mock_build_proxy
     ):
-        mock_build_chroot_proxy.return_value = MagicMock(result_url=None)
-        mock_build_proxy.return_value = MagicMock(
-            ownername="ownername", project_dirname="dirname", id=123
-        )
+        mock_build_chroot_proxy.return_value = {"result_url": None}
+        mock_build_proxy.return_value = {
+            "ownername": "ownername",
+            "project_dirname": "dirname",
+            "id": 123,
+        }
         provider = CoprProvider(123, "fedora-39_x86_64", http_client=MagicMock())
         with pytest.raises(FetchError):
             await provider.fetch_log_urls()
@@ -205,16 +239,29 @@ class TestURLProvider:
         url = "https://www.fake.lol"
         provider = URLProvider(url, http_client=MagicMock())
         url_map = {url: ("text", 200)}
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             result = await provider.fetch_logs()
-        assert result == [{"name": "build.log", "content": "text"}]
+        assert result == [
+            {
+                "name": "build.log",
+                "content": "text",
+                "original_size": 4,
+                "truncated": False,
+            }
+        ]
 
     async def test_fetch_url_logs_with_utf8(self):
         url = "https://www.fake.lol/log.txt"
         czech_content = "Chyba: balíček nebyl nalezen\nŘešení: přidejte repozitář"
         provider = URLProvider(url, http_client=MagicMock())
         url_map = {url: (czech_content, 200)}
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             logs = await provider.fetch_logs()
         assert logs[0]["content"] == czech_content
 
@@ -252,9 +299,19 @@ class TestOBSProvider:
     async def test_fetch_logs(self):
         """fetch_logs returns the OBS build log content as a single entry."""
         url_map = {self.expected_log_url: ("obs log content", 200)}
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             result = await self._provider().fetch_logs()
-        assert result == [{"name": "build.log", "content": "obs log content"}]
+        assert result == [
+            {
+                "name": "build.log",
+                "content": "obs log content",
+                "original_size": 15,
+                "truncated": False,
+            }
+        ]
 
     async def test_fetch_log_urls(self):
         """fetch_log_urls returns the OBS log URL without downloading content."""
@@ -278,12 +335,51 @@ class TestOBSProvider:
     async def test_fetch_logs_http_error(self):
         """fetch_logs raises HTTPException"""
         url_map = {self.expected_log_url: ("", 404)}
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             with pytest.raises(HTTPException) as exc_info:
                 await self._provider().fetch_logs()
             assert exc_info.value.status_code == 404
 
 
+KOJI_LOGS = ["build.log", "root.log", "mock_output.log", "checkout.log", "flatpak.log"]
+
+
+def _task_output(names: list[str]) -> dict[str, dict[str, str]]:
+    """Response of listTaskOutput(stat=True)."""
+    return {name: {"st_size": "11", "st_mtime": "1709816475"} for name in names}
+
+
+def _kojipkgs(
+    requests: list[str],
+    responses: Optional[dict[str, tuple[str, int]]] = None,
+    body: str = "LOG_CONTENT",
+) -> httpx.AsyncClient:
+    """
+    Client of a fake kojipkgs serving (body, status) by log name, the body to
+    any other log.
+    """
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        name = request.url.path.rsplit("/", 1)[-1]
+        requests.append(name)
+        content, status_code = (responses or {}).get(name, (body, 200))
+        return httpx.Response(status_code, content=content.encode("utf-8"))
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+
+
+def _koji_session(task_info, **methods) -> FakeKojiSession:
+    """Koji hub knowing just the task, the ID is not a build."""
+    return FakeKojiSession(
+        getBuild=MagicMock(side_effect=koji.GenericError),
+        getTaskInfo=MagicMock(return_value=task_info),
+        **methods,
+    )
+
+
 class TestKojiProviderLogs:
     @pytest.mark.parametrize(
         "f_task_dict",
@@ -294,40 +390,91 @@ class TestKojiProviderLogs:
         ],
     )
     @patch.object(koji, "ClientSession")
-    @patch.object(KojiProvider, "task_info", new_callable=PropertyMock)
-    async def test_get_logs(
-        self, mock_task_info, mock_client_session, f_task_dict, request
-    ):
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-            downloadTaskOutput=MagicMock(return_value="LOG_CONTENT"),
+    async def test_get_logs(self, mock_client_session, f_task_dict, request):
+        mock_client_session.return_value = _koji_session(
+            request.getfixturevalue(f_task_dict),
+            listTaskOutput=MagicMock(return_value=_task_output(KOJI_LOGS)),
         )
-        mock_task_info.return_value = request.getfixturevalue(f_task_dict)
-        koji_provider = KojiProvider(123, "noarch", http_client=MagicMock())
+        requests: list[str] = []
+        koji_provider = KojiProvider(123, "noarch", http_client=_kojipkgs(requests))
         logs = await koji_provider.fetch_logs()
-        assert len(logs) == 5
+        assert [log["name"] for log in logs] == KOJI_LOGS
         for log in logs:
             assert log["content"] == "LOG_CONTENT"
+        assert len(requests) == 5
 
     @patch.object(koji, "ClientSession")
-    @patch.object(KojiProvider, "task_info", new_callable=PropertyMock)
-    async def test_get_logs_decodes_bytes(
-        self, mock_task_info, mock_client_session, srpm_task_dict
-    ):
+    async def test_get_logs_decodes_bytes(self, mock_client_session, srpm_task_dict):
         czech_log = "Chyba při kompilaci: žádný takový soubor"
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-            downloadTaskOutput=MagicMock(return_value=czech_log.encode("utf-8")),
+        mock_client_session.return_value = _koji_session(
+            srpm_task_dict,
+            listTaskOutput=MagicMock(return_value=_task_output(["build.log"])),
+        )
+        koji_provider = KojiProvider(
+            123, "noarch", http_client=_kojipkgs([], body=czech_log)
+        )
+        (log,) = await koji_provider.fetch_logs()
+        assert log["content"] == czech_log
+        assert isinstance(log["content"], str)
+
+    @patch.object(koji, "ClientSession")
+    async def test_get_logs_skips_empty_and_failed(
+        self, mock_client_session, srpm_task_dict
+    ):
+        output = _task_output(["build.log", "root.log", "checkout.log"])
+        output["checkout.log"]["st_size"] = "0"
+        mock_client_session.return_value = _koji_session(
+            srpm_task_dict, listTaskOutput=MagicMock(return_value=output)
+        )
+        requests: list[str] = []
+        responses = {"build.log": ("BUILD", 200), "root.log": ("", 503)}
+        koji_provider = KojiProvider(
+            123, "noarch", http_client=_kojipkgs(requests, responses)
         )
-        mock_task_info.return_value = srpm_task_dict
-        koji_provider = KojiProvider(123, "noarch", http_client=MagicMock())
         logs = await koji_provider.fetch_logs()
-        for log in logs:
-            assert log["content"] == czech_log
-            assert isinstance(log["content"], str)
+        assert logs == [
+            {
+                "name": "build.log",
+                "content": "BUILD",
+                "original_size": 5,
+                "truncated": False,
+            },
+            {
+                "name": "checkout.log",
+                "content": "",
+                "original_size": 0,
+                "truncated": False,
+            },
+        ]
+        # empty logs are not downloaded
+        assert sorted(requests) == ["build.log", "root.log"]
+
+    @patch.object(koji, "ClientSession")
+    async def test_get_logs_of_finished_task_cached(
+        self, mock_client_session, srpm_task_dict
+    ):
+        session = _koji_session(
+            srpm_task_dict,
+            listTaskOutput=MagicMock(return_value=_task_output(KOJI_LOGS)),
+        )
+        mock_client_session.return_value = session
+        requests: list[str] = []
+        http_client = _kojipkgs(requests)
+        logs = await KojiProvider(123, "noarch", http_client=http_client).fetch_logs()
+        # the task was resolved in one round trip
+        assert session.round_trips == 2
+        assert len(requests) == 5
+
+        session.round_trips = 0
+        cached_logs = await KojiProvider(
+            123, "noarch", http_client=http_client
+        ).fetch_logs()
+        assert session.round_trips == 0
+        assert len(requests) == 5
+        assert cached_logs == logs
 
     @pytest.mark.parametrize(
-        "task_request, get_task_info, result",
+        "task_request, parent_request, result",
         [
             pytest.param(
                 ["git+https://src.fedoraproject.org/rpms/libphonenumber.git#c88bd3"],
@@ -346,25 +493,32 @@ class TestKojiProviderLogs:
             ),
         ],
     )
-    def test_get_task_request_url(self, task_request, get_task_info, result):
-        mock_self = MagicMock(
-            task_request=task_request,
-            task_info={"parent": get_task_info},
-            client=MagicMock(
-                getBuild=MagicMock(side_effect=koji.GenericError),
-                getTaskInfo=MagicMock(return_value={"request": [get_task_info]}),
-            ),
+    @patch.object(koji, "ClientSession")
+    async def test_get_task_request_url(
+        self, mock_client_session, task_request, parent_request, result
+    ):
+        tasks = {
+            123: {"id": 123, "state": 5, "parent": 100, "request": task_request},
+            100: {"id": 100, "state": 5, "parent": None, "request": [parent_request]},
+        }
+        mock_client_session.return_value = FakeKojiSession(
+            getBuild=MagicMock(side_effect=koji.GenericError),
+            getTaskInfo=MagicMock(side_effect=lambda task_id, request: tasks[task_id]),
         )
-        assert result == KojiProvider.get_task_request_url(mock_self)
+        provider = KojiProvider(123, "noarch", http_client=MagicMock())
+        await provider._resolve()
+        assert result == await provider.get_task_request_url()
 
-    @patch.object(KojiProvider, "get_task_request_url")
+    @patch.object(KojiProvider, "get_task_request_url", new_callable=AsyncMock)
     @patch.object(koji, "ClientSession")
     async def test_fetch_spec_file_from_url(
-        self, mock_client_session, mock_get_task_request_url, fake_spec_file
+        self,
+        mock_client_session,
+        mock_get_task_request_url,
+        srpm_task_dict,
+        fake_spec_file,
     ):
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-        )
+        mock_client_session.return_value = _koji_session(srpm_task_dict)
         mock_get_task_request_url.return_value = (
             "git+https://src.fedoraproject.org/rpms/copr-frontend.git#dbcd207"
         )
@@ -378,18 +532,17 @@ class TestKojiProviderLogs:
         assert expected == result
 
     @patch.object(KojiProvider, "_fetch_spec_file_from_task_id", new_callable=AsyncMock)
-    @patch.object(KojiProvider, "get_task_request_url")
+    @patch.object(KojiProvider, "get_task_request_url", new_callable=AsyncMock)
     @patch.object(koji, "ClientSession")
     async def test_fetch_spec_file_from_task_id(
         self,
         mock_client_session,
         mock_get_task_request_url,
         mock_fetch_spec_file_from_task_id,
+        srpm_task_dict,
         fake_spec_file,
     ):
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-        )
+        mock_client_session.return_value = _koji_session(srpm_task_dict)
         mock_get_task_request_url.return_value = None
         expected = {"name": "copr-fronend.spec", "content": fake_spec_file}
         mock_fetch_spec_file_from_task_id.return_value = expected
@@ -399,18 +552,16 @@ class TestKojiProviderLogs:
         assert expected == result
 
     @patch.object(KojiProvider, "_fetch_spec_file_from_task_id", new_callable=AsyncMock)
-    @patch.object(KojiProvider, "get_task_request_url")
+    @patch.object(KojiProvider, "get_task_request_url", new_callable=AsyncMock)
     @patch.object(koji, "ClientSession")
     async def test_fetch_spec_file_from_task_id_none(
         self,
         mock_client_session,
         mock_get_task_request_url,
         mock_fetch_spec_file_from_task_id,
-        fake_spec_file,
+        srpm_task_dict,
     ):
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-        )
+        mock_client_session.return_value = _koji_session(srpm_task_dict)
         mock_get_task_request_url.return_value = None
         mock_fetch_spec_file_from_task_id.return_value = None
         koji_result = await KojiProvider(
@@ -419,30 +570,48 @@ class TestKojiProviderLogs:
         assert koji_result is None
 
     @patch.object(koji, "ClientSession")
-    def test_build_id_to_task_id(
+    async def test_build_id_to_task_id(
         self, mock_client_session, copr_build_dict, copr_task_descendants
     ):
         root_task_id = copr_build_dict["task_id"]
-        mock_client_session.return_value = MagicMock(
+        session = FakeKojiSession(
             getBuild=MagicMock(return_value=copr_build_dict),
+            getTaskInfo=MagicMock(
+                return_value={"id": root_task_id, "state": 5, "parent": None}
+            ),
             getTaskDescendents=MagicMock(
                 return_value={str(root_task_id): copr_task_descendants}
             ),
         )
-        KojiProvider(123, "noarch", http_client=MagicMock())
+        mock_client_session.return_value = session
+
+        provider = KojiProvider(
+            copr_build_dict["id"], "noarch", http_client=MagicMock()
+        )
+        # nothing is resolved on the event loop before it is needed
+        assert session.round_trips == 0
+        await provider._resolve()
+        assert provider.build_id == copr_build_dict["id"]
+        assert provider.task_id == 114443338
+        assert session.round_trips == 2
+
+        # the build failed, so resolving it for another arch costs nothing
+        provider = KojiProvider(
+            copr_build_dict["id"], "x86_64", http_client=MagicMock()
+        )
+        with pytest.raises(HTTPException) as exc_info:
+            await provider._resolve()
+        assert exc_info.value.status_code == 400
+        assert session.round_trips == 2
 
     @patch.object(koji, "ClientSession")
-    @patch.object(KojiProvider, "task_info", new_callable=PropertyMock)
-    async def test_fetch_log_urls(
-        self, mock_task_info, mock_client_session, srpm_task_dict
-    ):
-        task_id = 123
+    async def test_fetch_log_urls(self, mock_client_session, srpm_task_dict):
+        task_id = srpm_task_dict["id"]
         available_files = ["build.log", "root.log", "mock_output.log", "state.log"]
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-            listTaskOutput=MagicMock(return_value=available_files),
+        mock_client_session.return_value = _koji_session(
+            srpm_task_dict,
+            listTaskOutput=MagicMock(return_value=_task_output(available_files)),
         )
-        mock_task_info.return_value = srpm_task_dict
         provider = KojiProvider(task_id, "noarch", http_client=MagicMock())
         result = await provider.fetch_log_urls()
 
@@ -459,26 +628,29 @@ class TestKojiProviderLogs:
         assert "state.log" not in names
 
     @patch.object(koji, "ClientSession")
-    @patch.object(KojiProvider, "task_info", new_callable=PropertyMock)
-    async def test_fetch_log_urls_no_logs(
-        self, mock_task_info, mock_client_session, srpm_task_dict
-    ):
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-            listTaskOutput=MagicMock(return_value=["state.log"]),
+    async def test_fetch_log_urls_no_logs(self, mock_client_session, srpm_task_dict):
+        mock_client_session.return_value = _koji_session(
+            srpm_task_dict,
+            listTaskOutput=MagicMock(return_value=_task_output(["state.log"])),
         )
-        mock_task_info.return_value = srpm_task_dict
         provider = KojiProvider(123, "noarch", http_client=MagicMock())
         with pytest.raises(FetchError):
             await provider.fetch_log_urls()
 
+    @patch.object(koji, "ClientSession")
+    async def test_task_is_empty(self, mock_client_session):
+        mock_client_session.return_value = _koji_session(None)
+        with pytest.raises(HTTPException) as exc_info:
+            await KojiProvider(123, "noarch", http_client=MagicMock()).fetch_logs()
+        assert exc_info.value.status_code == 400
+
 
 class TestPackitProvider:
     packit_id = 123
     packit_provider = PackitProvider(packit_id, http_client=MagicMock())
 
-    @patch.object(BuildProxy, "get")
-    @patch.object(BuildChrootProxy, "get")
+    @patch.object(CoprClient, "get_build")
+    @patch.object(CoprClient, "get_build_chroot")
     async def test_fetch_logs_with_utf8_via_copr(
         self, mock_build_chroot_proxy, mock_build_proxy
     ):
@@ -487,10 +659,12 @@ class TestPackitProvider:
         baseurl = "https://copr.example.com/results"
         czech_log = "Sestavení selhalo: chybí závislost"
 
-        mock_build_chroot_proxy.return_value = MagicMock(result_url=baseurl)
-        mock_build_proxy.return_value = MagicMock(
-            ownername="owner", project_dirname="project", id=build_id
-        )
+        mock_build_chroot_proxy.return_value = {"result_url": baseurl}
+        mock_build_proxy.return_value = {
+            "ownername": "owner",
+            "project_dirname": "project",
+            "id": build_id,
+        }
 
         url_map = {
             f"{baseurl}/{name}": (czech_log, 200)
@@ -505,7 +679,10 @@ class TestPackitProvider:
 
         transport = httpx.MockTransport(_transport_handler)
 
-        with patch("src.fetcher.fetch_text", side_effect=_mock_fetch_text(url_map)):
+        with patch(
+            "src.fetcher.fetch_log",
+            side_effect=_as_fetched_log(_mock_fetch_text(url_map)),
+        ):
             provider = PackitProvider(
                 self.packit_id, http_client=httpx.AsyncClient(transport=transport)
             )
@@ -541,9 +718,10 @@ class TestPackitProvider:
         task_id = 456
         arch = "x86_64"
 
-        mock_client_session.return_value = MagicMock(
-            getBuild=MagicMock(side_effect=koji.GenericError),
-            getTaskInfo=MagicMock(return_value={"arch": arch}),
+        mock_client_session.return_value = FakeKojiSession(
+            getTaskInfo=MagicMock(
+                return_value={"id": task_id, "arch": arch, "state": 5}
+            ),
         )
 
         def _handler(request: httpx.Request) -> httpx.Response:
@@ -622,9 +800,18 @@ class TestContainerProvider:
             )
 
         provider = ContainerProvider(url, http_client=MagicMock())
-        with patch("src.fetcher.fetch_text", side_effect=_fake_fetch_text):
+        with patch(
+            "src.fetcher.fetch_log", side_effect=_as_fetched_log(_fake_fetch_text)
+        ):
             result = await provider.fetch_logs()
-        assert result == [{"name": "Container log", "content": content}]
+        assert result == [
+            {
+                "name": "Container log",
+                "content": content,
+                "original_size": len(content),
+                "truncated": False,
+            }
+        ]
 
     async def test_fetch_logs_non_text_content_type(self):
         url = "https://example.com/page.html"
@@ -638,7 +825,9 @@ class TestContainerProvider:
             )
 
         provider = ContainerProvider(url, http_client=MagicMock())
-        with patch("src.fetcher.fetch_text", side_effect=_fake_fetch_text):
+        with patch(
+            "src.fetcher.fetch_log", side_effect=_as_fetched_log(_fake_fetch_text)
+        ):
             with pytest.raises(FetchError):
                 await provider.fetch_logs()
 
@@ -654,7 +843,9 @@ class TestContainerProvider:
             )
 
         provider = ContainerProvider(url, http_client=MagicMock())
-        with patch("src.fetcher.fetch_text", side_effect=_fake_fetch_text):
+        with patch(
+            "src.fetcher.fetch_log", side_effect=_as_fetched_log(_fake_fetch_text)
+        ):
             from fastapi import HTTPException
 
             with pytest.raises(HTTPException) as exc_info:
@@ -666,3 +857,27 @@ class TestContainerProvider:
         provider = ContainerProvider(url, http_client=MagicMock())
         result = await provider.fetch_log_urls()
         assert result == [{"name": "Container log", "url": url}]
+
+
+class TestSpecFileFromSRPM:
+    def test_read_in_process(self, tmp_path, fake_spec_file):
+        srpm_path = tmp_path / "foo-1.0-1.src.rpm"
+        srpm_path.write_bytes(
+            build_srpm({"foo.spec": fake_spec_file.encode()}, "xz").getvalue()
+        )
+        with patch("subprocess.run") as mock_run:
+            result = KojiProvider._get_spec_file_content_from_srpm(srpm_path, tmp_path)
+        assert result == {"name": "foo.spec", "content": fake_spec_file}
+        mock_run.assert_not_called()
+
+    def test_rpm2archive_fallback(self, tmp_path, fake_spec_file):
+        srpm_path = tmp_path / "foo-1.0-1.src.rpm"
+        srpm_path.write_bytes(b"not an rpm we can read")
+
+        def _extract(*args, **kwargs):
+            (tmp_path / "foo.spec").write_text(fake_spec_file)
+
+        with patch("subprocess.run", side_effect=_extract) as mock_run:
+            result = KojiProvider._get_spec_file_content_from_srpm(srpm_path, tmp_path)
+        assert result == {"name": "foo.spec", "content": fake_spec_file}
+        mock_run.assert_called_once()
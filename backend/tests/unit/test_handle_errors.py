@@ -3,12 +3,12 @@ import subprocess
 from http import HTTPStatus
 from unittest.mock import patch
 
-import copr.v3
 import httpx
 import koji
 import pytest
 from fastapi import HTTPException
 
+from src.copr_client import CoprNoResultError
 from src.fetcher import handle_errors
 
 
@@ -33,7 +33,7 @@ class TestHandleErrorsAsync:
     async def test_copr_no_result_exception(self):
         @handle_errors
         async def failing():
-            raise copr.v3.exceptions.CoprNoResultException("build not found")
+            raise CoprNoResultError("build not found")
 
         with pytest.raises(HTTPException) as exc_info:
             await failing()
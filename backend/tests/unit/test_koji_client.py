@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import koji
+import pytest
+
+from src.koji_client import KojiClient, KojiSessionPool
+from tests.spells import FakeKojiSession
+
+API_URL = "https://koji.example.com/kojihub"
+
+
+class TestKojiSessionPool:
+    @patch.object(koji, "ClientSession")
+    async def test_sessions_are_reused(self, mock_client_session):
+        mock_client_session.side_effect = lambda _: FakeKojiSession(
+            getTaskInfo=MagicMock(side_effect=koji.GenericError("No such task")),
+            listTaskOutput=MagicMock(return_value={}),
+        )
+        await KojiClient(API_URL).call("listTaskOutput", 1)
+        # errors reported by the hub don't spoil the session
+        with pytest.raises(koji.GenericError):
+            await KojiClient(API_URL).call("getTaskInfo", 1)
+        await KojiClient(API_URL).multicall(("listTaskOutput", (1,), {}))
+        mock_client_session.assert_called_once_with(API_URL)
+
+    @patch.object(koji, "ClientSession")
+    async def test_broken_sessions_are_dropped(self, mock_client_session):
+        mock_client_session.side_effect = lambda _: FakeKojiSession(
+            listTaskOutput=MagicMock(side_effect=ConnectionError),
+        )
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await KojiClient(API_URL).call("listTaskOutput", 1)
+        assert mock_client_session.call_count == 2
+
+    @patch.object(koji, "ClientSession")
+    async def test_concurrent_use_is_limited(self, mock_client_session):
+        lock = threading.Lock()
+        running = []
+        most_running = 0
+
+        def _slow_call(task_id):
+            nonlocal most_running
+            with lock:
+                running.append(task_id)
+                most_running = max(most_running, len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(task_id)
+            return {}
+
+        mock_client_session.side_effect = lambda _: FakeKojiSession(
+            listTaskOutput=_slow_call
+        )
+        KojiSessionPool._instances[API_URL] = KojiSessionPool(API_URL, size=2)
+        await asyncio.gather(
+            *[KojiClient(API_URL).call("listTaskOutput", i) for i in range(6)]
+        )
+        assert most_running == 2
+        assert mock_client_session.call_count == 2
+
+        KojiSessionPool.close_all()
+        assert not KojiSessionPool._instances
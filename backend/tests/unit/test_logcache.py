@@ -0,0 +1,82 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+
+from src.logcache import LogCache
+from src.spells import fetch_text
+
+
+class TestLogCache:
+    def test_put_and_get(self, tmp_path):
+        cache = LogCache(tmp_path, max_size=1024 * 1024)
+        assert cache.get("https://example.com/build.log") is None
+
+        cache.put("https://example.com/build.log", b"log content", "text/plain")
+        assert cache.get("https://example.com/build.log") == (
+            b"log content",
+            "text/plain",
+        )
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_bytes"] == len(b"log content")
+        assert stats["entries"] == 1
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        # incompressible content to know how much space the entries take
+        contents = {name: os.urandom(1000) for name in ("a", "b", "c")}
+        cache = LogCache(tmp_path, max_size=2500)
+        cache.put("a", contents["a"], None)
+        cache.put("b", contents["b"], None)
+        assert cache.get("a") is not None
+        cache.put("c", contents["c"], None)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == (contents["a"], None)
+        assert cache.get("c") == (contents["c"], None)
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["entries"] == 2
+
+    def test_missing_file_is_miss(self, tmp_path):
+        cache = LogCache(tmp_path, max_size=1024 * 1024)
+        cache.put("a", b"content", None)
+        cache._path("a").unlink()
+        assert cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+
+
+class TestFetchText:
+    async def test_immutable_cached(self, log_cache):
+        url = "https://example.com/build.log"
+        client = MagicMock(
+            get=AsyncMock(
+                side_effect=lambda url: httpx.Response(
+                    200,
+                    text="log content",
+                    headers={"Content-Type": "text/plain"},
+                    request=httpx.Request("GET", url),
+                )
+            )
+        )
+        first = await fetch_text(url, client=client, immutable=True)
+        second = await fetch_text(url, client=client, immutable=True)
+        client.get.assert_awaited_once()
+        assert second.text == first.text == "log content"
+        assert second.headers["Content-Type"] == "text/plain"
+
+        # everything else is always fetched
+        await fetch_text(url, client=client)
+        assert client.get.await_count == 2
+
+    async def test_errors_not_cached(self, log_cache):
+        url = "https://example.com/build.log"
+        client = MagicMock(
+            get=AsyncMock(
+                return_value=httpx.Response(404, request=httpx.Request("GET", url))
+            )
+        )
+        await fetch_text(url, client=client, immutable=True)
+        response = await fetch_text(url, client=client, immutable=True)
+        assert response.status_code == 404
+        assert client.get.await_count == 2
@@ -0,0 +1,153 @@
+import json
+import sqlite3
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.constants import ProvidersEnum
+from src.exceptions import NoDataFound
+from src.reviews import ReviewProcessor
+from src.spells import decode_text
+from src.store import Storator3000
+
+
+REVIEW = {
+    "fail_reason": {"text": "reason", "vote": 1},
+    "how_to_fix": {"text": "fix", "vote": 1},
+    # as submitted by the review page
+    "snippets": [
+        {
+            "file": "log1",
+            "vote": 1,
+            "start_index": 0,
+            "end_index": 3,
+            "text": "log",
+            "comment": "the log starts here",
+        },
+        {
+            "file": "log1",
+            "vote": -1,
+            "start_index": 4,
+            "end_index": 7,
+            "text": "con",
+            "comment": "this is not interesting",
+        },
+    ],
+}
+
+
+class TestReviewProcessor:
+    def test_merge(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review_id = f"{contribution_id}-1"
+        Storator3000.store_review(contribution_id, review_id, REVIEW)
+        assert Storator3000.get_index().get_review(review_id)["status"] == "pending"
+        # the review counts only once it is merged
+        assert Storator3000.get_index().counters().get("reviews") is None
+
+        processor = ReviewProcessor(workers=1)
+        processor.submit(review_id).result(timeout=5)
+
+        assert Storator3000.get_index().get_review(review_id)["status"] == "parsed"
+        assert Storator3000.get_index().counters()["reviews"] == {"": 1}
+        key = f"parsed/{review_id}.json.gz"
+        parsed = json.loads(decode_text(Storator3000.get_backend("reviews").get(key)))
+        assert parsed["logs"]["log1"]["snippets"] == [
+            {
+                "start_index": 0,
+                "end_index": 3,
+                "user_comment": "the log starts here",
+                "text": "log",
+            }
+        ]
+
+    def test_resume_pending(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review_ids = [f"{contribution_id}-{n}" for n in range(3)]
+        for review_id in review_ids:
+            Storator3000.store_review(contribution_id, review_id, REVIEW)
+        # a worker stopped before merging them, the index is rebuilt
+        Storator3000.get_index().db_path.unlink()
+        Storator3000.rebuild_index()
+        assert Storator3000.get_index().pending_reviews() == review_ids
+
+        processor = ReviewProcessor(workers=2)
+        with patch.object(processor, "submit") as mock_submit:
+            processor.resume()
+            # another worker started at the same time leaves them alone
+            ReviewProcessor(workers=1).resume()
+        assert [call.args[0] for call in mock_submit.call_args_list] == review_ids
+
+        for review_id in review_ids:
+            processor.submit(review_id)
+        processor._executor.shutdown(wait=True)
+        assert Storator3000.get_index().pending_reviews() == []
+        assert Storator3000.get_index().counters()["reviews"] == {"": 3}
+
+    def test_resume_expired_lease(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review_id = f"{contribution_id}-1"
+        Storator3000.store_review(contribution_id, review_id, REVIEW)
+        index = Storator3000.get_index()
+        # the worker which stored it is merging it
+        assert index.lease_pending_reviews(time.time(), 60) == []
+        # ... or it stopped before it could
+        assert index.lease_pending_reviews(time.time() + 3600, 60) == [review_id]
+
+    def test_failed_merge(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review_id = f"{contribution_id}-1"
+        Storator3000.store_review(contribution_id, review_id, {"snippets": []})
+
+        ReviewProcessor(workers=1).submit(review_id).result(timeout=5)
+        assert Storator3000.get_index().get_review(review_id)["status"] == "failed"
+        assert Storator3000.get_index().counters().get("reviews") is None
+
+    def test_transient_failure(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review_id = f"{contribution_id}-1"
+        Storator3000.store_review(contribution_id, review_id, REVIEW)
+        store_parsed_review = Storator3000.store_parsed_review
+        failures = [sqlite3.OperationalError("database is locked")] * 3
+
+        def _store_parsed_review(*args):
+            if failures:
+                raise failures.pop()
+            store_parsed_review(*args)
+
+        processor = ReviewProcessor(workers=1)
+        with (
+            patch.object(Storator3000, "store_parsed_review", _store_parsed_review),
+            patch("src.reviews.time.sleep") as mock_sleep,
+        ):
+            # retried, then left pending for the next resume
+            processor.submit(review_id).result(timeout=5)
+            assert Storator3000.get_index().get_review(review_id)["status"] == "pending"
+            assert mock_sleep.call_count == 2
+
+            # the lease expired, another worker merges it
+            with patch("src.reviews.time.time", return_value=time.time() + 3600):
+                processor.resume()
+            processor._executor.shutdown(wait=True)
+        assert Storator3000.get_index().get_review(review_id)["status"] == "parsed"
+
+    def test_missing_review(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        review_id = f"{contribution_id}-1"
+        Storator3000.store_review(contribution_id, review_id, REVIEW)
+        key = Storator3000.get_index().get_review(review_id)["key"]
+        Storator3000.get_backend("reviews").delete(key)
+
+        ReviewProcessor(workers=1).submit(review_id).result(timeout=5)
+        assert Storator3000.get_index().get_review(review_id)["status"] == "pending"
+        with pytest.raises(NoDataFound):
+            Storator3000.store_parsed_review(f"{contribution_id}-2", REVIEW, {})
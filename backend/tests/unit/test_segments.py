@@ -0,0 +1,46 @@
+from src.segments import HEADER, SegmentStore
+
+
+class TestSegmentStore:
+    def test_append_and_read(self, tmp_path):
+        segments = SegmentStore(tmp_path, max_size=1024)
+        locations = segments.append([b"first", b"second"])
+        assert [loc[0] for loc in locations] == ["segment-000001.seg"] * 2
+        assert [segments.read(*loc) for loc in locations] == [b"first", b"second"]
+
+        # reading again after the segment grew
+        (location,) = segments.append([b"third"])
+        assert segments.read(*location) == b"third"
+
+    def test_rollover(self, tmp_path):
+        segments = SegmentStore(tmp_path, max_size=2 * HEADER.size + 10)
+        segments.append([b"a" * 5])
+        segments.append([b"b" * 5])
+        (location,) = segments.append([b"c" * 5])
+        assert location == ("segment-000002.seg", HEADER.size, 5)
+        assert segments.segments() == ["segment-000001.seg", "segment-000002.seg"]
+
+    def test_scan(self, tmp_path):
+        segments = SegmentStore(tmp_path, max_size=1024)
+        locations = segments.append([b"first", b"second"])
+        assert list(segments.scan()) == [
+            (segment, offset, payload)
+            for (segment, offset, _), payload in zip(locations, [b"first", b"second"])
+        ]
+
+    def test_scan_skips_torn_record(self, tmp_path):
+        segments = SegmentStore(tmp_path, max_size=1024)
+        segments.append([b"first"])
+        path = tmp_path / "segment-000001.seg"
+        # a header promising more than was written before a crash
+        with open(path, "ab") as segment_f:
+            segment_f.write(HEADER.pack(b"LDR1", 100) + b"torn")
+        (location,) = segments.append([b"second"])
+
+        assert [payload for _, _, payload in segments.scan()] == [b"first", b"second"]
+        assert segments.read(*location) == b"second"
+
+    def test_empty(self, tmp_path):
+        segments = SegmentStore(tmp_path / "nonexistent", max_size=1024)
+        assert segments.segments() == []
+        assert list(segments.scan()) == []
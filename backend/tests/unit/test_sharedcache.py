@@ -0,0 +1,76 @@
+import socket
+from unittest.mock import patch
+
+from src.logcache import get_cached_log, get_log_cache
+from src.sharedcache import RedisConnection, SharedCache, get_shared_cache
+
+
+class TestSharedCache:
+    def test_set_and_get(self, shared_cache):
+        cache = get_shared_cache()
+        assert cache.get("log", "https://example.com/build.log") is None
+
+        cache.set("log", "https://example.com/build.log", b"log content", ttl=60)
+        assert cache.get("log", "https://example.com/build.log") == b"log content"
+        # other namespaces don't share keys
+        assert cache.get("metadata", "https://example.com/build.log") is None
+
+        cache.set_json("metadata", "copr/1/fedora-41", {"baseurl": "x"}, ttl=60)
+        assert cache.get_json("metadata", "copr/1/fedora-41") == {"baseurl": "x"}
+
+        # authenticated and switched to the database from the URL once
+        commands = [args[0] for args in shared_cache.commands]
+        assert commands.count(b"AUTH") == commands.count(b"SELECT") == 1
+
+    def test_values_are_compressed_and_expire(self, shared_cache):
+        cache = get_shared_cache()
+        cache.set("log", "a", b"x" * 10000, ttl=60)
+        ((value, _),) = shared_cache.data.values()
+        assert len(value) < 1000
+
+        cache.set("log", "b", b"content", ttl=60)
+        key, (value, _) = list(shared_cache.data.items())[1]
+        shared_cache.data[key] = (value, 0.0)
+        assert cache.get("log", "b") is None
+
+    def test_large_values_not_cached(self, shared_cache):
+        cache = SharedCache(shared_cache.url, max_value_size=100)
+        cache.set("log", "a", bytes(range(256)) * 10, ttl=60)
+        assert cache.get("log", "a") is None
+        assert shared_cache.data == {}
+
+    def test_garbled_reply(self, shared_cache):
+        cache = get_shared_cache()
+        cache.set("log", "a", b"content", ttl=60)
+        assert len(cache._idle) == 1
+        with patch.object(shared_cache, "execute", return_value=b"$garbled\r\n"):
+            assert cache.get("log", "a") is None
+        # the connection is not reused
+        assert cache._idle == []
+        assert cache.get("log", "a") == b"content"
+
+    def test_unavailable(self):
+        # nothing listens on a port freed right away
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        cache = SharedCache(f"redis://127.0.0.1:{port}")
+
+        assert cache.get("log", "a") is None
+        with patch.object(RedisConnection, "__init__") as mock_connect:
+            cache.set("log", "a", b"content", ttl=60)
+            assert cache.get("log", "a") is None
+        # not tried again for a while
+        mock_connect.assert_not_called()
+
+    def test_not_configured(self):
+        assert get_shared_cache() is None
+
+
+async def test_log_from_shared_cache_cached_locally(shared_cache):
+    url = "https://example.com/build.log"
+    get_shared_cache().set("log", url, b"text/plain\nlog content", ttl=60)
+
+    assert await get_cached_log(url) == (b"log content", "text/plain")
+    shared_cache.data.clear()
+    assert get_log_cache().get(url) == (b"log content", "text/plain")
@@ -0,0 +1,103 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from src.budget import _RESERVATION, ByteBudget, Reservation, reserve_memory
+from src.singleflight import SingleFlight, single_flight
+
+
+class TestSingleFlight:
+    async def test_concurrent_calls_share_one(self):
+        flights = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flights.do("key", fetch) for _ in range(5)))
+        assert results == [1] * 5
+        assert flights.in_flight() == 0
+
+        # finished calls are not reused
+        assert await flights.do("key", fetch) == 2
+
+    async def test_cancelled_waiter_does_not_cancel_call(self):
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "content"
+
+        first = asyncio.create_task(flights.do("key", fetch))
+        await started.wait()
+        second = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "content"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    @patch("src.budget.MEMORY_BUDGET_FACTOR", 1)
+    async def test_memory_reserved_for_every_caller(self):
+        flights = SingleFlight()
+        budget = ByteBudget(1000)
+
+        async def fetch():
+            await reserve_memory(100)
+            await asyncio.sleep(0.01)
+            return "content"
+
+        async def request():
+            reservation = Reservation(budget)
+            _RESERVATION.set(reservation)
+            await flights.do("key", fetch)
+            return reservation.size
+
+        assert await asyncio.gather(request(), request()) == [100, 100]
+        assert budget.used == 200
+
+    async def test_exception_shared(self):
+        flights = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(
+            flights.do("key", fetch), flights.do("key", fetch), return_exceptions=True
+        )
+        assert [str(result) for result in results] == ["upstream failed"] * 2
+        assert flights.in_flight() == 0
+
+
+class FakeProvider:
+    calls = 0
+
+    def __init__(self, build_id):
+        self.flight_key = build_id
+
+    @single_flight
+    async def fetch_logs(self):
+        FakeProvider.calls += 1
+        await asyncio.sleep(0.01)
+        return [{"name": "build.log", "content": str(self.flight_key)}]
+
+
+async def test_single_flight_provider():
+    first, second, other = await asyncio.gather(
+        FakeProvider(1).fetch_logs(),
+        FakeProvider(1).fetch_logs(),
+        FakeProvider(2).fetch_logs(),
+    )
+    assert FakeProvider.calls == 2
+    assert first == second == [{"name": "build.log", "content": "1"}]
+    assert other == [{"name": "build.log", "content": "2"}]
+    # every caller has its own copy
+    assert first is not second
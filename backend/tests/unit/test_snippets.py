@@ -0,0 +1,49 @@
+from src.snippets import review_payload, snippet_window
+
+LOG = "\n".join(f"line {number}" for number in range(10))
+
+
+class TestSnippetWindow:
+    def test_lines_around(self):
+        start = LOG.index("line 5")
+        window = snippet_window(LOG, start + 2, start + 4, lines=2)
+        assert window["text"] == "line 3\nline 4\nline 5\nline 6\nline 7"
+        assert LOG[window["start"] : window["end"]] == window["text"]
+
+    def test_multiline_snippet(self):
+        start = LOG.index("line 4")
+        end = LOG.index("line 6") + len("line 6")
+        window = snippet_window(LOG, start, end, lines=1)
+        assert window["text"] == "line 3\nline 4\nline 5\nline 6\nline 7"
+
+    def test_log_edges(self):
+        assert snippet_window(LOG, 0, 3, lines=2)["text"] == "line 0\nline 1\nline 2"
+        window = snippet_window(LOG, len(LOG) - 2, len(LOG), lines=1)
+        assert window["text"] == "line 8\nline 9"
+        assert window["end"] == len(LOG)
+
+    def test_out_of_range(self):
+        window = snippet_window(LOG, len(LOG) + 10, len(LOG) + 20, lines=0)
+        assert window["text"] == "line 9"
+        assert snippet_window("", 0, 5, lines=3) == {"start": 0, "end": 0, "text": ""}
+
+
+def test_review_payload():
+    feedback = {
+        "fail_reason": "reason",
+        "logs": {
+            "build.log": {
+                "name": "build.log",
+                "content": LOG,
+                "snippets": [{"start_index": 0, "end_index": 3, "user_comment": "c"}],
+            }
+        },
+    }
+    payload = review_payload(feedback, lines=1)
+    log = payload["logs"]["build.log"]
+    assert "content" not in log
+    assert log["size"] == len(LOG)
+    assert log["snippets"][0]["context"]["text"] == "line 0\nline 1"
+    assert payload["fail_reason"] == "reason"
+    # the annotation itself is left untouched
+    assert feedback["logs"]["build.log"]["content"] == LOG
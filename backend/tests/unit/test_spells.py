@@ -1,8 +1,14 @@
+import gzip
+import json
 from unittest.mock import patch
 import httpx
 from src.constants import DEFAULT_ROBOTS
 from src.spells import (
+    HeadTailText,
+    compress_file,
     ensure_text,
+    is_compressed,
+    fetch_log,
     fetch_text,
     read_json_file,
     read_text_file,
@@ -56,6 +62,94 @@ class TestFetchText:
         assert response.text == czech_text
 
 
+class TestHeadTailText:
+    def test_small_text_kept_whole(self):
+        text = HeadTailText(max_size=100, head=10, tail=10)
+        data = "Příliš žluťoučký kůň\n".encode("utf-8")
+        # characters split between chunks
+        for i in range(0, len(data), 3):
+            text.feed(data[i : i + 3])
+        text.feed(b"", final=True)
+        assert text.text() == "Příliš žluťoučký kůň\n"
+        assert text.size == len(data)
+        assert not text.truncated
+
+    def test_large_text_truncated_to_whole_lines(self):
+        text = HeadTailText(max_size=100, head=25, tail=25)
+        lines = [f"line {i:03}\n" for i in range(100)]
+        for line in lines:
+            text.feed(line.encode("utf-8"))
+        text.feed(b"", final=True)
+
+        assert text.truncated
+        assert text.size == 900
+        assert text.text() == (
+            "line 000\nline 001\n"
+            "[... 864 bytes of this log were truncated by Log Detective ...]\n"
+            "line 098\nline 099\n"
+        )
+
+
+class TestFetchLog:
+    async def test_truncated(self):
+        url = "http://example.com/build.log"
+        content = b"".join(b"line %06d\n" % i for i in range(10000))
+
+        def _handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=content)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        with (
+            patch("src.spells.LOG_MAX_SIZE", 1000),
+            patch("src.spells.LOG_TRUNCATED_HEAD", 24),
+            patch("src.spells.LOG_TRUNCATED_TAIL", 24),
+        ):
+            log = await fetch_log(url, client=client, immutable=True)
+
+        assert log.truncated
+        assert log.original_size == len(content)
+        assert log.content == (
+            "line 000000\nline 000001\n"
+            "[... 119952 bytes of this log were truncated by Log Detective ...]\n"
+            "line 009998\nline 009999\n"
+        )
+        assert log.as_dict("build.log")["original_size"] == len(content)
+
+    async def test_reserved_as_it_comes(self):
+        content = b"x" * 2500
+        reserved = []
+
+        def _handler(request: httpx.Request) -> httpx.Response:
+            # compressed, the size of the log is not known ahead
+            return httpx.Response(
+                200,
+                content=gzip.compress(content),
+                headers={"Content-Encoding": "gzip"},
+            )
+
+        async def _reserve_memory(size):
+            reserved.append(size)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        with (
+            patch("src.spells.LOG_MAX_SIZE", 2000),
+            patch("src.spells.LOG_RESERVATION_STEP", 1000),
+            patch("src.spells.reserve_memory", _reserve_memory),
+        ):
+            await fetch_log("http://example.com/build.log", client=client)
+        assert reserved[0] == 0
+        assert sum(reserved) == 2000
+
+    async def test_not_successful(self):
+        def _handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(404, content=b"Not found")
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        log = await fetch_log("http://example.com/build.log", client=client)
+        assert log.response.status_code == 404
+        assert log.content == ""
+
+
 class TestJsonFileIO:
     def test_roundtrip_with_czech_characters(self, tmp_path):
         data = {
@@ -81,6 +175,33 @@ class TestJsonFileIO:
         assert "šěčřžýáíé" in raw_content
         assert "\\u" not in raw_content
 
+    def test_compressed_roundtrip(self, tmp_path):
+        data = {"text": "šěčřžýáíé"}
+        file_path = tmp_path / "test.json.gz"
+
+        write_json_file(file_path, data)
+
+        assert is_compressed(file_path)
+        assert json.loads(gzip.decompress(file_path.read_bytes())) == data
+        assert read_json_file(file_path) == data
+
+    def test_compressed_detected_by_content(self, tmp_path):
+        file_path = tmp_path / "test.json"
+        file_path.write_bytes(gzip.compress(b'{"a": 1}'))
+
+        assert read_json_file(file_path) == {"a": 1}
+
+    def test_compress_file(self, tmp_path):
+        data = {"text": "šěčřžýáíé"}
+        file_path = tmp_path / "test.json"
+        write_json_file(file_path, data)
+
+        compressed_path = compress_file(file_path)
+
+        assert compressed_path == tmp_path / "test.json.gz"
+        assert not file_path.exists()
+        assert read_json_file(compressed_path) == data
+
 
 class TestReadTextFile:
     def test_reads_utf8_content(self, tmp_path):
@@ -0,0 +1,53 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from src import srpm
+from src.srpm import UnsupportedSRPM, read_spec_file
+from tests.spells import build_srpm
+
+SPEC = "Name: foo\nVersion: 1.0\n# Žluťoučký kůň\n"
+
+
+@pytest.mark.parametrize("compressor", ["gzip", "bzip2", "xz", "zstd"])
+def test_read_spec_file(compressor):
+    fp = build_srpm(
+        {
+            "foo-1.0.tar.gz": b"\x00" * 100_001,
+            "foo.spec": SPEC.encode(),
+            "zzz.patch": b"patch",
+        },
+        compressor,
+    )
+    assert read_spec_file(fp) == ("foo.spec", SPEC)
+
+
+@patch.object(srpm, "READ_CHUNK_SIZE", 16)
+def test_read_spec_file_stops_at_spec():
+    fp = build_srpm({"./foo.spec": SPEC.encode(), "huge.tar": b"\x00" * 1_000_000})
+    assert read_spec_file(fp) == ("foo.spec", SPEC)
+    # the rest of the payload was never read
+    assert fp.tell() < len(fp.getvalue()) - 100
+
+
+def test_read_spec_file_without_spec():
+    assert read_spec_file(build_srpm({"foo.tar.gz": b"tarball"})) is None
+
+
+def test_read_spec_file_not_rpm():
+    with pytest.raises(UnsupportedSRPM):
+        read_spec_file(io.BytesIO(b"not an rpm" * 100))
+
+
+def test_read_spec_file_truncated():
+    content = build_srpm({"foo.tar": bytes(range(256)) * 100}, "xz").getvalue()
+    with pytest.raises(UnsupportedSRPM):
+        read_spec_file(io.BytesIO(content[: len(content) // 2]))
+
+
+def test_read_spec_file_unknown_compressor():
+    fp = build_srpm({"foo.spec": b""})
+    fp = io.BytesIO(fp.getvalue().replace(b"gzip\0", b"lzip\0"))
+    with pytest.raises(UnsupportedSRPM):
+        read_spec_file(fp)
@@ -1,11 +1,16 @@
 import os
+import threading
+import time
+from datetime import date, datetime
 
 from unittest.mock import patch
 
 import pytest
 
-from src.constants import FEEDBACK_DIR
+from src.constants import FEEDBACK_DIR, ProvidersEnum
+from src.blobs import BlobStore
 from src.exceptions import NoDataFound
+from src.spells import read_json_file, write_json_file
 from src.store import Storator3000
 
 
@@ -34,13 +39,418 @@ class TestStorator:
             with pytest.raises(NoDataFound):
                 storator.get_logs()
 
-    @patch.object(Storator3000, "get_logs")
-    def test_get_stats(self, mock_get_logs, storator):
-        mock_get_logs.return_value = [
-            "/path/123.json",
-            "/path/234.json",
-            "/path/345.json",
+    def test_get_stats(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        for _ in range(3):
+            Storator3000(ProvidersEnum.copr, "123").store(feedback)
+
+        Storator3000(ProvidersEnum.koji, "456").store(feedback)
+        contribution_id = Storator3000(ProvidersEnum.koji, "789").store(feedback)
+        Storator3000.add_review(str(contribution_id), f"{contribution_id}-1.json")
+        Storator3000.add_review(str(contribution_id), f"{contribution_id}-2.json")
+        # recording the same review again changes nothing
+        Storator3000.add_review(str(contribution_id), f"{contribution_id}-2.json")
+
+        stats = Storator3000.get_stats()
+        assert stats["total_reports"] == 5
+        assert stats["reviewed_reports"] == 1
+        assert stats["unreviewed_reports"] == 4
+        assert stats["total_reviews"] == 2
+        assert stats["providers"]["copr"] == 3
+        assert stats["providers"]["koji"] == 2
+        assert stats["providers"]["obs"] == 0
+        assert stats["days"] == {str(date.today()): 5}
+
+    def test_get_stats_cached(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        assert Storator3000.get_stats()["total_reports"] == 1
+
+        with patch.object(Storator3000, "get_index") as mock_get_index:
+            assert Storator3000.get_stats()["total_reports"] == 1
+            mock_get_index.assert_not_called()
+
+    def test_store_updates_index(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        storator = Storator3000(ProvidersEnum.copr, "123")
+        contribution_id = storator.store(feedback)
+
+        record = Storator3000.get_index().get(str(contribution_id))
+        assert record["provider"] == "copr"
+        assert record["build_id"] == "123"
+        assert record["reviews"] == 0
+        path = storator.build_dir / f"{contribution_id}.json.gz"
+        assert record["path"] == str(path.relative_to(storage / "results"))
+        assert record["segment_offset"] is None
+        assert record["size"] == path.stat().st_size
+        assert Storator3000.next_for_review() == str(contribution_id)
+        assert Storator3000.get_by_id(str(contribution_id)) == feedback.model_dump(
+            exclude_unset=True
+        )
+        assert Storator3000.get_by_id("nonexistent") is None
+
+    def test_next_for_review_empty(self, storage):
+        with pytest.raises(NoDataFound):
+            Storator3000.next_for_review()
+
+    def test_next_for_review(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        first, second, third = (
+            str(Storator3000(ProvidersEnum.copr, str(build)).store(feedback))
+            for build in range(3)
+        )
+        Storator3000.add_review(first, f"{first}-1.json")
+
+        # unreviewed first, oldest first, each handed out only once
+        assert Storator3000.next_for_review() == second
+        assert Storator3000.next_for_review() == third
+        assert Storator3000.next_for_review() == first
+        # all are leased, the one leased for the longest time is handed out
+        assert Storator3000.next_for_review() == second
+
+        # a review releases the lease
+        Storator3000.add_review(third, f"{third}-1.json")
+        assert Storator3000.next_for_review() == third
+        # expired leases are handed out again
+        with patch("src.store.time.time", return_value=time.time() + 3600):
+            assert Storator3000.next_for_review() == second
+            assert Storator3000.next_for_review() == first
+            assert Storator3000.next_for_review() == third
+
+    def test_ensure_index_once(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        Storator3000.get_index().db_path.unlink()
+
+        rebuild_index = Storator3000.rebuild_index
+        with patch.object(
+            Storator3000, "rebuild_index", side_effect=rebuild_index
+        ) as mock_rebuild_index:
+            errors = []
+
+            def start_worker():
+                try:
+                    Storator3000.ensure_index()
+                except Exception as ex:  # pylint: disable=broad-exception-caught
+                    errors.append(ex)
+
+            # workers starting together
+            threads = [threading.Thread(target=start_worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert errors == []
+        mock_rebuild_index.assert_called_once()
+        assert Storator3000.get_stats()["total_reports"] == 1
+
+    def test_rebuild_index(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        copr_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        obs_id = Storator3000(ProvidersEnum.obs, "prj/repo/x86_64/ed").store(feedback)
+        reviews_dir = storage / "reviews"
+        reviews_dir.mkdir()
+        (reviews_dir / "parsed").mkdir()
+        for timestamp in (1700000000, 1700000001):
+            (reviews_dir / f"{copr_id}-{timestamp}.json").write_text("{}")
+            (reviews_dir / "parsed" / f"{copr_id}-{timestamp}.json").write_text("{}")
+
+        Storator3000.get_index().db_path.unlink()
+        Storator3000.ensure_index()
+
+        stats = Storator3000.get_stats()
+        assert stats["total_reports"] == 2
+        assert stats["reviewed_reports"] == 1
+        assert stats["total_reviews"] == 2
+        assert stats["providers"]["obs"] == 1
+        copr_record = Storator3000.get_index().get(str(copr_id))
+        assert copr_record["reviews"] == 2
+        obs_record = Storator3000.get_index().get(str(obs_id))
+        assert obs_record["provider"] == "obs"
+        assert obs_record["build_id"] == "prj/repo/x86_64/ed"
+        assert obs_record["reviews"] == 0
+
+    def test_store_deduplicates_contents(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        first_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        second_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+
+        first_path = (
+            storage / "results" / Storator3000.get_index().get(str(first_id))["path"]
+        )
+        stored = read_json_file(first_path)
+        assert "content" not in stored["logs"]["log1"]
+        assert "content" not in stored["spec_file"]
+        assert stored["logs"]["log1"]["content_sha256"] == (
+            BlobStore.digest("log content 1")
+        )
+        # one log and one spec file, shared by both annotations
+        assert len([p for p in (storage / "blobs").rglob("*") if p.is_file()]) == 2
+
+        for contribution_id in (first_id, second_id):
+            loaded = Storator3000.get_by_id(str(contribution_id))
+            assert loaded == feedback.model_dump(exclude_unset=True)
+
+    def test_load_legacy_annotation(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        path = storage / "results" / "2024-01-01" / "copr" / "123" / "legacy.json"
+        path.parent.mkdir(parents=True)
+        write_json_file(path, feedback.model_dump(exclude_unset=True))
+        Storator3000.rebuild_index()
+        assert Storator3000.get_by_id("legacy") == feedback.model_dump(
+            exclude_unset=True
+        )
+
+    def test_compress_stored(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        with (
+            patch("src.spells.STORAGE_COMPRESSION", "none"),
+            patch("src.blobs.STORAGE_COMPRESSION", "none"),
+        ):
+            contribution_id = Storator3000(ProvidersEnum.copr, "123").store(feedback)
+        path = Storator3000.get_index().get(str(contribution_id))["path"]
+        assert path.endswith(f"{contribution_id}.json")
+        reviews_dir = storage / "reviews"
+        reviews_dir.mkdir()
+        write_json_file(reviews_dir / f"{contribution_id}-1700000000.json", {})
+        (reviews_dir / "parsed").mkdir()
+        write_json_file(
+            reviews_dir / "parsed" / f"{contribution_id}-1700000000.json", {}
+        )
+
+        # annotation, review, its parsed copy, log and spec file
+        assert Storator3000.compress_stored() == 5
+        assert Storator3000.compress_stored() == 0
+
+        record = Storator3000.get_index().get(str(contribution_id))
+        assert record["path"].endswith(f"{contribution_id}.json.gz")
+        assert record["reviews"] == 1
+        assert Storator3000.get_by_id(str(contribution_id)) == feedback.model_dump(
+            exclude_unset=True
+        )
+        assert all(
+            p.name.endswith(".gz")
+            for p in (storage / "blobs").rglob("*")
+            if p.is_file()
+        )
+
+    def test_store_to_segment(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        with patch("src.store.STORAGE_MODE", "segments"):
+            contribution_id = Storator3000(ProvidersEnum.obs, "prj/repo/x/ed").store(
+                feedback
+            )
+
+        assert not (storage / "results").exists()
+        record = Storator3000.get_index().get(str(contribution_id))
+        assert record["path"] == "segment-000001.seg"
+        assert record["segment_offset"] is not None
+        assert record["build_id"] == "prj/repo/x/ed"
+        assert Storator3000.get_by_id(str(contribution_id)) == feedback.model_dump(
+            exclude_unset=True
+        )
+
+        Storator3000.get_index().db_path.unlink()
+        assert Storator3000.rebuild_index() == 1
+        assert Storator3000.get_index().get(str(contribution_id))["provider"] == "obs"
+        assert Storator3000.get_by_id(str(contribution_id)) == feedback.model_dump(
+            exclude_unset=True
+        )
+
+    def test_compact(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        with patch("src.store.datetime") as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 1, 1)
+            ids = [
+                str(Storator3000(ProvidersEnum.copr, str(build)).store(feedback))
+                for build in range(3)
+            ]
+        Storator3000.add_review(ids[0], f"{ids[0]}-1.json")
+
+        assert Storator3000.compact(batch_size=2) == 3
+        assert Storator3000.compact() == 0
+        # directories left empty are removed as well
+        assert list((storage / "results").iterdir()) == []
+        for contribution_id in ids:
+            record = Storator3000.get_index().get(contribution_id)
+            assert record["segment_offset"] is not None
+            assert Storator3000.get_by_id(contribution_id) == feedback.model_dump(
+                exclude_unset=True
+            )
+
+        stats = Storator3000.get_stats()
+        assert stats["total_reports"] == 3
+        assert stats["reviewed_reports"] == 1
+
+    def test_read_during_compact(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        # looked up by a worker before the annotation was moved
+        record = Storator3000.get_index().get(contribution_id)
+        assert Storator3000.compact() == 1
+
+        assert Storator3000._read(record) == feedback.model_dump(exclude_unset=True)
+
+    def test_compact_only_filesystem(self, storage):
+        with patch("src.store.STORAGE_BACKEND", "sqlite"):
+            with pytest.raises(ValueError):
+                Storator3000.compact()
+
+    def test_rebuild_index_prefers_segment(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        record = Storator3000.get_index().get(contribution_id)
+        # compaction interrupted after the annotation was appended to a segment
+        Storator3000.get_segments().append(
+            [
+                Storator3000._pack(
+                    dict(record), read_json_file(storage / "results" / record["path"])
+                )
+            ]
+        )
+
+        assert Storator3000.rebuild_index() == 1
+        assert Storator3000.get_index().get(contribution_id)["segment_offset"]
+
+    def test_sqlite_backend(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        with (
+            patch("src.store.STORAGE_BACKEND", "sqlite"),
+            patch("src.store.STORAGE_DB", str(storage / "storage.sqlite3")),
+        ):
+            contribution_id = str(
+                Storator3000(ProvidersEnum.copr, "123").store(feedback)
+            )
+            Storator3000.store_review(contribution_id, f"{contribution_id}-1", {})
+            Storator3000.store_parsed_review(f"{contribution_id}-1", {}, {})
+            assert not (storage / "results").exists()
+            assert not (storage / "blobs").exists()
+            assert Storator3000.get_by_id(contribution_id) == feedback.model_dump(
+                exclude_unset=True
+            )
+
+            Storator3000.get_index().db_path.unlink()
+            assert Storator3000.rebuild_index() == 1
+            assert Storator3000.get_index().get(contribution_id)["reviews"] == 1
+
+    def test_compress_stored_sqlite(
+        self, storage, spec_feedback_input_output_schema_tuple
+    ):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        with (
+            patch("src.store.STORAGE_BACKEND", "sqlite"),
+            patch("src.store.STORAGE_DB", str(storage / "storage.sqlite3")),
+        ):
+            with (
+                patch("src.spells.STORAGE_COMPRESSION", "none"),
+                patch("src.blobs.STORAGE_COMPRESSION", "none"),
+            ):
+                contribution_id = str(
+                    Storator3000(ProvidersEnum.copr, "123").store(feedback)
+                )
+            # annotation, log and spec file
+            assert Storator3000.compress_stored() == 3
+            assert Storator3000.compress_stored() == 0
+
+            keys = [
+                key
+                for namespace in ("results", "blobs")
+                for key, _ in Storator3000.get_backend(namespace).list()
+            ]
+            assert all(key.endswith(".gz") for key in keys)
+            assert Storator3000.get_by_id(contribution_id) == feedback.model_dump(
+                exclude_unset=True
+            )
+
+    def test_find_annotations(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        first_id = str(
+            Storator3000(ProvidersEnum.copr, "1", "fedora-40").store(feedback)
+        )
+        with patch("src.store.STORAGE_MODE", "segments"):
+            second_id = str(
+                Storator3000(ProvidersEnum.copr, "2", "fedora-41").store(feedback)
+            )
+
+        # the spec file of the fixture is named "spec"
+        found = Storator3000.find_annotations(package="spec")
+        assert [a["id"] for a in found] == [second_id, first_id]
+        assert found[0]["chroot"] == "fedora-41"
+        assert Storator3000.find_annotations(provider="koji", package="spec") == []
+
+        Storator3000.get_index().db_path.unlink()
+        Storator3000.rebuild_index()
+        first, second = (
+            Storator3000.get_index().get(id_) for id_ in (first_id, second_id)
+        )
+        assert first["package"] == second["package"] == "spec"
+        # the chroot is kept only in segments
+        assert first["chroot"] is None
+        assert second["chroot"] == "fedora-41"
+
+    def test_get_reviews(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        for timestamp in (1700000000, 1700000001):
+            review = {"id": contribution_id, "timestamp": timestamp}
+            review_id = f"{contribution_id}-{timestamp}"
+            Storator3000.store_review(contribution_id, review_id, review)
+            Storator3000.store_parsed_review(review_id, review, {})
+
+        expected = [
+            {"id": contribution_id, "timestamp": 1700000000},
+            {"id": contribution_id, "timestamp": 1700000001},
         ]
-        expected_stats = {"total_reports": 3}
-        stats = storator.get_stats()
-        assert stats == expected_stats
+        assert Storator3000.get_reviews(contribution_id) == expected
+        assert Storator3000.get_reviews("nonexistent") == []
+
+        Storator3000.get_index().db_path.unlink()
+        Storator3000.rebuild_index()
+        assert Storator3000.get_reviews(contribution_id) == expected
+        assert Storator3000.get_index().get(contribution_id)["reviews"] == 2
+
+    def test_get_consensus(self, storage, spec_feedback_input_output_schema_tuple):
+        _, feedback = spec_feedback_input_output_schema_tuple
+        contribution_id = str(Storator3000(ProvidersEnum.copr, "123").store(feedback))
+        snippet = {"file": "log1", "start_index": 0, "end_index": 3}
+        for timestamp, vote in ((1700000000, 1), (1700000001, -1), (1700000002, 1)):
+            review = {
+                "fail_reason": {"text": "reason", "vote": vote},
+                "how_to_fix": {"text": "fix", "vote": 0},
+                "snippets": [snippet | {"vote": vote}],
+            }
+            review_id = f"{contribution_id}-{timestamp}"
+            Storator3000.store_review(contribution_id, review_id, review)
+            Storator3000.store_parsed_review(review_id, review, {})
+        # storing the same review again doesn't count its votes twice
+        Storator3000.add_review(
+            contribution_id,
+            f"{contribution_id}-1700000000.json.gz",
+            [("fail_reason", "", -1, -1, 1)],
+        )
+
+        expected = {
+            "id": contribution_id,
+            "reviews": 3,
+            "fail_reason": {"up": 2, "down": 1},
+            "how_to_fix": {"up": 0, "down": 0},
+            "snippets": [snippet | {"up": 2, "down": 1}],
+        }
+        assert Storator3000.get_consensus(contribution_id) == expected
+
+        Storator3000.get_index().db_path.unlink()
+        Storator3000.rebuild_index()
+        assert Storator3000.get_consensus(contribution_id) == expected
+
+        with pytest.raises(NoDataFound):
+            Storator3000.get_consensus("nonexistent")
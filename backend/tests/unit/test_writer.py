@@ -0,0 +1,122 @@
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from src.segments import SegmentStore
+from src.writer import GroupCommitWriter, _FileWrite, _RecordsAppend
+
+
+@pytest.fixture
+def writer():
+    writer = GroupCommitWriter()
+    yield writer
+    writer.close()
+
+
+class TestGroupCommitWriter:
+    def test_write_file(self, writer, tmp_path):
+        path = tmp_path / "new" / "file.json"
+        writer.write_file(path, b"data").result(timeout=5)
+        assert path.read_bytes() == b"data"
+
+        writer.write_file(path, b"replaced").result(timeout=5)
+        assert path.read_bytes() == b"replaced"
+        # no temporary files are left behind
+        assert [p.name for p in path.parent.iterdir()] == ["file.json"]
+
+    def test_concurrent_writes(self, writer, tmp_path):
+        def submit(number):
+            writer.write_file(tmp_path / f"{number}.json", b"x").result(timeout=5)
+
+        threads = [threading.Thread(target=submit, args=(n,)) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(list(tmp_path.glob("*.json"))) == 20
+
+    def test_batch_syncs_directory_once(self, tmp_path):
+        jobs = [_FileWrite(tmp_path / f"{n}.json", b"x") for n in range(5)]
+        with patch("src.writer._fsync_directory") as mock_fsync_directory:
+            GroupCommitWriter._commit_files(jobs)
+        mock_fsync_directory.assert_called_once_with(tmp_path)
+        assert all(job.future.result() is None for job in jobs)
+
+    def test_files_are_synced_before_renames(self, tmp_path):
+        jobs = [_FileWrite(tmp_path / f"{n}.json", b"x") for n in range(5)]
+        calls = []
+        fsync, replace = os.fsync, os.replace
+
+        def _fsync(fd):
+            calls.append("fsync")
+            fsync(fd)
+
+        def _replace(src, dst):
+            calls.append("replace")
+            replace(src, dst)
+
+        with (
+            patch("src.writer.os.fsync", _fsync),
+            patch("src.writer.os.replace", _replace),
+            patch("src.writer._fsync_directory"),
+        ):
+            GroupCommitWriter._commit_files(jobs)
+        assert calls == ["fsync"] * 5 + ["replace"] * 5
+        assert all(job.path.read_bytes() == b"x" for job in jobs)
+
+    def test_new_directories_are_synced(self, tmp_path):
+        job = _FileWrite(tmp_path / "a" / "b" / "c.json", b"x")
+        with patch("src.writer._fsync_directory") as mock_fsync_directory:
+            GroupCommitWriter._commit_files([job])
+        assert [call.args[0] for call in mock_fsync_directory.call_args_list] == [
+            tmp_path / "a" / "b",
+            tmp_path / "a",
+            tmp_path,
+        ]
+
+    def test_failed_batch_keeps_writer_running(self, writer, tmp_path):
+        commit_files = GroupCommitWriter._commit_files
+        failures = [RuntimeError("unexpected")]
+
+        def _commit_files(jobs):
+            if failures:
+                raise failures.pop()
+            commit_files(jobs)
+
+        with patch.object(
+            GroupCommitWriter, "_commit_files", staticmethod(_commit_files)
+        ):
+            future = writer.write_file(tmp_path / "a.json", b"x")
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+            writer.write_file(tmp_path / "b.json", b"x").result(timeout=5)
+        assert (tmp_path / "b.json").read_bytes() == b"x"
+
+    def test_failed_write_does_not_fail_batch(self, tmp_path):
+        (tmp_path / "file").write_text("not a directory")
+        failing = _FileWrite(tmp_path / "file" / "a.json", b"x")
+        ok = _FileWrite(tmp_path / "b.json", b"x")
+        GroupCommitWriter._commit_files([failing, ok])
+
+        assert ok.future.result() is None
+        assert (tmp_path / "b.json").read_bytes() == b"x"
+        with pytest.raises(OSError):
+            failing.future.result()
+
+    def test_append_records(self, tmp_path):
+        segments = SegmentStore(tmp_path, max_size=1024)
+        jobs = [
+            _RecordsAppend(segments, [b"first", b"second"]),
+            _RecordsAppend(segments, [b"third"]),
+        ]
+        with patch.object(segments, "append", wraps=segments.append) as mock_append:
+            GroupCommitWriter._commit_appends(jobs)
+        mock_append.assert_called_once()
+
+        assert [segments.read(*loc) for loc in jobs[0].future.result()] == [
+            b"first",
+            b"second",
+        ]
+        assert [segments.read(*loc) for loc in jobs[1].future.result()] == [b"third"]
@@ -38,6 +38,18 @@ try:
         with open(file) as f:
             data.append(json.load(f))
 
+    # contents of logs, spec and container files are stored only once in the
+    # blobs directory and referenced from the annotations by their hash
+    blobs_dir = os.path.join(tmp_dir, EXTRACTION_DIR, "results", "blobs")
+    for e in data:
+        files = list(e.get("logs", {}).values())
+        files += [e[key] for key in ("spec_file", "container_file") if e.get(key)]
+        for v in files:
+            if "content_sha256" in v:
+                digest = v.pop("content_sha256")
+                with open(os.path.join(blobs_dir, digest[:2], digest)) as f:
+                    v["content"] = f.read()
+
     print(f"Total {len(data)} files loaded")
 
     parsed = []
@@ -2,24 +2,75 @@
 """
 Create a dated tar.gz archive of all feedback and review data in STORAGE_DIR.
 Intended to be run daily via a Kubernetes CronJob.
+
+Everything is read through the storage backends of the website, so it needs
+the backend on PYTHONPATH and the same STORAGE_* environment as the website.
 """
 
-import os
+import gzip
+import io
+import json
 import tarfile
+import time
 from datetime import date
 from pathlib import Path
 
-FEEDBACK_DIR = Path(os.environ.get("FEEDBACK_DIR", "/persistent/results"))
-REVIEWS_DIR = Path(os.environ.get("REVIEWS_DIR", "/persistent/reviews"))
+from src.constants import FEEDBACK_DIR
+from src.spells import GZIP_MAGIC
+from src.store import Storator3000
+
+NAMESPACES = ("results", "reviews", "blobs")
+
+
+def add_file(tar_f: tarfile.TarFile, arcname: str, data: bytes) -> None:
+    info = tarfile.TarInfo(arcname)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar_f.addfile(info, io.BytesIO(data))
+
+
+def add_source(tar_f: tarfile.TarFile, namespace: str) -> None:
+    """
+    Add all objects of the storage namespace to the tar.
+
+    The website may store objects gzip compressed with .gz suffix, those are
+    added decompressed and without the suffix, so the archive looks the same
+    no matter how the data is stored.
+    """
+    backend = Storator3000.get_backend(namespace)
+    for key, _ in sorted(backend.list()):
+        data = backend.get(key)
+        if key.endswith(".gz") and data.startswith(GZIP_MAGIC):
+            key, data = key.removesuffix(".gz"), gzip.decompress(data)
+        add_file(tar_f, f"results/{namespace}/{key}", data)
+
+
+def add_segments(tar_f: tarfile.TarFile) -> None:
+    """
+    Add annotations packed in segments as if they were stored as separate
+    files in FEEDBACK_DIR.
+    """
+    for segment, offset, payload in Storator3000.get_segments().scan():
+        try:
+            # pylint: disable=protected-access
+            record = Storator3000._unpack(payload)
+        except (OSError, ValueError):
+            print(f"Skipping unreadable record {segment}:{offset}")
+            continue
+        add_file(
+            tar_f,
+            f"results/results/{record['date']}/{record['provider']}/"
+            f"{record['build_id']}/{record['id']}.json",
+            json.dumps(record["annotation"], indent=4).encode("utf-8"),
+        )
 
 
-def make_tar(name: str, sources: list[Path], destination: Path) -> Path:
+def make_tar(name: str, destination: Path) -> Path:
     """
-    Make tar from source path.
+    Make tar of everything stored by the website.
 
     Args:
         name: Name of the tar file
-        sources: Sources to be tarred
         destination: Folder where to put tar file
 
     Returns:
@@ -28,20 +79,18 @@ def make_tar(name: str, sources: list[Path], destination: Path) -> Path:
     tmp_path = destination / f"tmp-{name}"
     tar_path = destination / name
     with tarfile.open(tmp_path, "w:gz") as tar_f:
-        for source in sources:
-            if source.exists():
-                tar_f.add(source, arcname=f"results/{source.name}")
-            else:
-                print(f"{source} not found, skipping this source.")
+        for namespace in NAMESPACES:
+            add_source(tar_f, namespace)
+        add_segments(tar_f)
     tmp_path.rename(tar_path)
     return tar_path
 
 
 def main():
-    """Create a dated tar.gz archive of feedback and review data, removing any older ones."""
-    storage_dir = FEEDBACK_DIR.parent
+    """Create a dated tar.gz archive of feedback, review and blob data, removing any older ones."""
+    storage_dir = Path(FEEDBACK_DIR).parent
     tar_name = f"results-{date.today().isoformat()}.tar.gz"
-    tar_path = make_tar(tar_name, [FEEDBACK_DIR, REVIEWS_DIR], storage_dir)
+    tar_path = make_tar(tar_name, storage_dir)
     print(f"Archive created: {tar_path}")
 
     for old in storage_dir.glob("results-*-*-*.tar.gz"):